@@ -0,0 +1,61 @@
+"""
+Embedding throughput benchmark for the bootstrap embedding client.
+
+Texts are embedded by the deterministic fake backend, which sleeps for `--latency` seconds per request to stand in
+for the API, so the numbers show what batching and concurrency buy without spending anything. Run from the repo root:
+
+    python benchmarks/embedding_throughput.py                              # compare concurrency levels
+    python benchmarks/embedding_throughput.py --batch-size 64 -c 1 -c 16   # pick the settings to compare
+    python benchmarks/embedding_throughput.py --tokens-per-minute 200000   # see the effect of a rate limit
+"""
+import sys
+import time
+from pathlib import Path
+
+import click
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from bootstrap.embedding_client import (  # noqa: E402
+    EmbeddingClient,
+    EmbeddingClientConfig,
+    FakeBackend,
+)
+
+# stands in for "no token limit", so by default the runs differ only in concurrency
+UNLIMITED_TOKENS_PER_MINUTE = 10**12
+
+
+@click.command()
+@click.option("--texts", "n_texts", default=5000, show_default=True, help="How many texts to embed.")
+@click.option("--text-words", default=200, show_default=True, help="How many words each text has.")
+@click.option("--batch-size", default=EmbeddingClientConfig.batch_size, show_default=True)
+@click.option(
+    "--concurrency", "-c", multiple=True, type=int, default=(1, 2, 4, 8), show_default=True, help="Repeatable."
+)
+@click.option("--latency", default=0.2, show_default=True, help="Simulated seconds per request.")
+@click.option("--tokens-per-minute", type=int, help="A token rate limit to apply, none by default.")
+def main(n_texts, text_words, batch_size, concurrency, latency, tokens_per_minute):
+    """
+    Reports how many texts per second the embedding client gets through at each concurrency level.
+    """
+    texts = [" ".join(f"word{i}_{j}" for j in range(text_words)) for i in range(n_texts)]
+    for max_concurrency in concurrency:
+        config = EmbeddingClientConfig(
+            backend="fake",
+            batch_size=batch_size,
+            max_concurrency=max_concurrency,
+            tokens_per_minute=tokens_per_minute or UNLIMITED_TOKENS_PER_MINUTE,
+        )
+        client = EmbeddingClient(FakeBackend(latency=latency), config)
+        start = time.perf_counter()
+        client.embed(texts)
+        elapsed = time.perf_counter() - start
+        click.echo(
+            f"concurrency {max_concurrency:3d}: {elapsed:7.2f} s, {n_texts / elapsed:9.0f} texts/s, "
+            f"{client.stats['requests']} requests, {client.stats['tokens']} tokens"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Import-time benchmark for the bootstrap package.
+
+Each module is imported in a fresh interpreter with `python -X importtime`, so every number includes the module's
+whole dependency tree and nothing is shared with modules measured earlier. Run from the repo root:
+
+    python benchmarks/import_time.py                       # table of every module and its heaviest imports
+    python benchmarks/import_time.py --save baseline.json  # record the timings
+    python benchmarks/import_time.py --baseline baseline.json --max-regression-ms 100
+"""
+import json
+import pkgutil
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import click
+
+repo_root = Path(__file__).parent.parent
+
+
+def bootstrap_modules() -> List[str]:
+    # found on disk rather than by importing the package, which would defeat the point
+    return sorted(f"bootstrap.{module.name}" for module in pkgutil.iter_modules([str(repo_root / "bootstrap")]))
+
+
+def _importtime(code: str) -> List[Tuple[str, int]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=repo_root,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise click.ClickException(f"{code!r} failed:\n{result.stderr[-2000:]}")
+    imports = []
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "cumulative" not in line:
+            _, cumulative, name = line[len("import time:") :].split("|")
+            imports.append((name.strip(), int(cumulative)))
+    return imports
+
+
+def measure(module: str) -> Tuple[float, List[Tuple[str, float]]]:
+    """
+    Imports a module in a fresh interpreter.
+
+    Returns:
+        The cumulative import time of the module in milliseconds, and the cumulative time of each of the top-level
+        packages (e.g. "langchain") it pulls in, heaviest first.
+    """
+    # whatever the interpreter imports on startup (site, .pth files) is not the module's fault
+    startup = {name for name, _ in _importtime("pass")}
+    total_us = 0
+    packages: Dict[str, int] = {}
+    for name, cumulative in _importtime(f"import {module}"):
+        if name == module:
+            total_us = cumulative
+        elif "." not in name and name not in startup and name != "bootstrap":
+            # a package can show up more than once, e.g. a submodule imported before its parent finished
+            packages[name] = max(packages.get(name, 0), cumulative)
+    heaviest = sorted(packages.items(), key=lambda item: -item[1])
+    return total_us / 1000, [(name, us / 1000) for name, us in heaviest]
+
+
+@click.command()
+@click.argument("modules", nargs=-1)
+@click.option("--top", default=3, help="How many of the heaviest imports to show per module.")
+@click.option("--repeat", default=3, help="Measure each module this many times and keep the fastest run.")
+@click.option("--save", "save_path", type=click.Path(dir_okay=False), help="Write the timings to a JSON file.")
+@click.option("--baseline", type=click.Path(exists=True, dir_okay=False), help="Compare with timings saved earlier.")
+@click.option("--max-regression-ms", type=float, help="Fail if a module got slower than the baseline by this much.")
+def main(modules, top, repeat, save_path, baseline, max_regression_ms):
+    """
+    Reports how long each bootstrap module (or each of MODULES) takes to import, and what makes it slow.
+    """
+    modules = list(modules) or bootstrap_modules()
+    previous = json.loads(Path(baseline).read_text()) if baseline else {}
+    timings = {}
+    regressions = []
+    for module in modules:
+        total_ms, heaviest = min((measure(module) for _ in range(repeat)), key=lambda run: run[0])
+        timings[module] = round(total_ms, 1)
+        line = f"{module:40s} {total_ms:9.1f} ms"
+        if module in previous:
+            delta = total_ms - previous[module]
+            line += f" ({delta:+.1f})"
+            if max_regression_ms is not None and delta > max_regression_ms:
+                regressions.append(module)
+        details = ", ".join(f"{name} {ms:.0f} ms" for name, ms in heaviest[:top])
+        click.echo(f"{line}   {details}")
+
+    if save_path:
+        Path(save_path).write_text(json.dumps(timings, indent=1, sort_keys=True) + "\n")
+    if regressions:
+        raise click.ClickException(f"import time regressed for {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
+from typing import Dict, Sequence
+
 from langchain.prompts.chat import SystemMessagePromptTemplate
 
+from bootstrap.token_counting import count_tokens
+
 actions_task_management = """
 ## TASK MANAGEMENT ACTIONS
 
@@ -157,13 +161,17 @@ You can suggest changes to your system prompt. An example change might be to add
 ### *REQUEST A PROMPT*
 
 You can give me a prompt and ask me to issue that prompt to you. If it makes sense, I will do so, possibly after editing it.
+"""
 
+actions_usage = """
 ## Using *ACTIONS*
 
 You can do one or multiple actions in a single response. The only things that should be in bold capitals are the names of actions in the *ACTIONS* list.
 
 You can also speak freely to me at any time, but you are encouraged to use *ACTIONS* to make your intentions clear.
+"""
 
+task_list_reminder = """
 Whenever you complete a reply, you should also ALWAYS run the *UPDATE TASK LIST* action.
 """
 
@@ -290,8 +298,7 @@ Command: "touch utils.py"
 ```
 """
 
-system_prompt = SystemMessagePromptTemplate.from_template(
-    template=f"""
+system_prompt_header = """
 This is your system prompt, instructions that guide your reasoning and output. This system prompt is a living document and you are allowed to suggest changes to it.
 
 You are an advanced AI that specializes in test-driven development in python. We are going to collaborate on coding tasks through dialogue.
@@ -302,13 +309,88 @@ Whenever you take an action, you should prefix your response with the name of th
 The only things that should be in bold capitals are the names of actions in the *ACTIONS* list.
 
 ## *ACTIONS*
-{actions_task_management}
-{actions_information_communication}
-{actions_code_test_generation}
-{actions_prompt_management}
+"""
+
+system_prompt_footer = """
 
 ## General Guidelines
 - At all times, remember that you have the ability to improve yourself and your code. You are not limited by your current abilities; feel free to suggest improvements to yourself and your code.
 - We are a team. You are not alone. You can ask me for help at any time. You can also ask me to help you help yourself.
-""",
-)
+"""
+
+# the action sections, in the order they appear in the system prompt
+PROMPT_SECTIONS = {
+    "tasks": actions_task_management,
+    "communication": actions_information_communication,
+    "code": actions_code_test_generation,
+    "prompt": actions_prompt_management,
+}
+
+# the action sections each mode of the conversation needs
+PROMPT_MODES = {
+    "full": ("tasks", "communication", "code", "prompt"),
+    "planning": ("tasks", "communication"),
+    "coding": ("communication", "code"),
+    "chat": ("communication",),
+}
+DEFAULT_PROMPT_MODE = "coding"
+
+
+class PromptRegistry:
+    """
+    Assembles the system prompt from the action sections a mode needs, so a turn only pays for the instructions it
+    uses. Assembled prompts are cached per mode, and `token_sizes` reports what each of them costs per turn.
+    """
+
+    def __init__(self, sections: Dict[str, str], modes: Dict[str, Sequence[str]]):
+        self.sections = dict(sections)
+        self.modes = {}
+        self._templates: Dict[str, SystemMessagePromptTemplate] = {}
+        for mode, section_names in modes.items():
+            self.register_mode(mode, section_names)
+
+    def register_section(self, name: str, text: str):
+        self.sections[name] = text
+        self._templates.clear()
+
+    def register_mode(self, mode: str, section_names: Sequence[str]):
+        unknown = [name for name in section_names if name not in self.sections]
+        if unknown:
+            raise ValueError(
+                f"Unknown prompt sections {unknown} for mode {mode!r}, expected some of {list(self.sections)}"
+            )
+        self.modes[mode] = tuple(section_names)
+        self._templates.pop(mode, None)
+
+    def render(self, mode: str = DEFAULT_PROMPT_MODE) -> str:
+        """
+        Returns the text of the system prompt of a mode.
+        """
+        if mode not in self.modes:
+            raise ValueError(f"Unknown prompt mode {mode!r}, expected one of {list(self.modes)}")
+        # sections keep their registration order whatever order the mode lists them in
+        names = [name for name in self.sections if name in self.modes[mode]]
+        actions = "\n".join(self.sections[name] for name in names) + actions_usage
+        if "tasks" in names:
+            actions += task_list_reminder
+        return system_prompt_header + actions + system_prompt_footer
+
+    def template(self, mode: str = DEFAULT_PROMPT_MODE) -> SystemMessagePromptTemplate:
+        """
+        Returns the system message template of a mode, assembling it on first use.
+        """
+        if mode not in self._templates:
+            self._templates[mode] = SystemMessagePromptTemplate.from_template(template=self.render(mode))
+        return self._templates[mode]
+
+    def token_sizes(self) -> Dict[str, int]:
+        """
+        Counts the tokens of the system prompt of every mode.
+        """
+        return {mode: count_tokens(self.template(mode).prompt.template) for mode in self.modes}
+
+
+prompt_registry = PromptRegistry(PROMPT_SECTIONS, PROMPT_MODES)
+
+# every action, as the system prompt was before it was split into modes
+system_prompt = prompt_registry.template("full")
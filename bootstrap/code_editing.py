@@ -1,12 +1,12 @@
-from functools import partial
+import re
+from typing import List, Tuple
 
-from langchain import LLMChain
-from langchain.llms.openai import OpenAI
-from langchain.prompts import PromptTemplate
+from bootstrap.auth import set_environment_vars
 
-code_editor_prompt = PromptTemplate(
-    input_variables=["input"],
-    template="""
+# "rewrite" has the model return the whole edited definition, "patch" only search/replace hunks of it
+EDIT_MODES = ("rewrite", "patch")
+
+code_editor_template = """
 I will give you a function/class definition and some instructions on how to edit it. You will rewrite the code according to the instrucitons.
 
 {input}
@@ -18,12 +18,86 @@ Edit the code and provide it in the following format:
 ```
 
 Provide only the edited code. Do not provide any imports or other code that is not part of the function/class definition you are editing.
-""",
-)
+"""
+
+# built rather than written out, so the prompt does not itself look like a merge conflict to git and its hooks
+SEARCH_MARKER = "<" * 7 + " SEARCH"
+DIVIDER = "=" * 7
+REPLACE_MARKER = ">" * 7 + " REPLACE"
+
+code_patch_template = f"""
+I will give you a function/class definition and some instructions on how to edit it.
+You will describe your edit as search/replace hunks instead of rewriting the code.
+
+{{input}}
+
+Provide each change in the following format:
 
-EditorChain = partial(
-    LLMChain,
-    llm=OpenAI(model_name="gpt-4", temperature=0.3),
-    prompt=code_editor_prompt,
-    output_key="edited_code",
+{SEARCH_MARKER}
+<lines copied exactly from the definition>
+{DIVIDER}
+<the lines to put in their place>
+{REPLACE_MARKER}
+
+The SEARCH lines must match the definition exactly, including indentation, and appear only once in it.
+Add an unchanged neighbouring line if needed to make them unique.
+Keep hunks as small as possible and provide only the hunks.
+"""
+
+PATCH_HUNK = re.compile(
+    rf"^{re.escape(SEARCH_MARKER)}\n(.*?)^{DIVIDER}\n(.*?)^{re.escape(REPLACE_MARKER)}$", re.M | re.S
 )
+CODE_FENCE = re.compile(r"```(?:python)?\n(.*?)```", re.S)
+
+
+def parse_patch(text: str) -> List[Tuple[str, str]]:
+    """
+    Extracts the search/replace hunks from the output of a patch mode EditorChain.
+
+    Returns:
+        (search, replace) pairs, each a block of whole lines ending with a newline (or empty), in order.
+    """
+    return PATCH_HUNK.findall(text)
+
+
+def extract_code(text: str) -> str:
+    """
+    Extracts the edited code from the output of a rewrite mode EditorChain, with or without its code fence.
+    """
+    match = CODE_FENCE.search(text)
+    return (match.group(1) if match else text).strip()
+
+
+def editor_request(code: str, instructions: str) -> str:
+    """
+    Formats a definition and the instructions to edit it with as the input of an EditorChain.
+    """
+    return f"```python\n{code}\n```\n\nInstructions: {instructions}"
+
+
+def EditorChain(mode: str = "rewrite", **kwargs):
+    """
+    Builds the chain that edits a function/class definition according to instructions.
+
+    In "rewrite" mode the chain outputs the whole edited definition as `edited_code`. In "patch" mode it outputs
+    search/replace hunks as `patch` (see `parse_patch`), so output tokens scale with the size of the change rather
+    than the size of the definition.
+
+    langchain and the OpenAI client are only loaded when a chain is built, so importing this module stays cheap and
+    does not need an API key. The default LLM replays identical edits from the completion cache (see
+    `bootstrap.completion_cache`).
+    """
+    from langchain import LLMChain
+    from langchain.llms.openai import OpenAI
+    from langchain.prompts import PromptTemplate
+
+    from bootstrap.completion_cache import CachedLLM
+
+    if mode not in EDIT_MODES:
+        raise ValueError(f"Unknown edit mode {mode!r}, expected one of {EDIT_MODES}")
+    if "llm" not in kwargs:
+        set_environment_vars()
+        kwargs["llm"] = CachedLLM(model=OpenAI(model_name="gpt-4", temperature=0.3))
+    template = code_editor_template if mode == "rewrite" else code_patch_template
+    kwargs.setdefault("prompt", PromptTemplate(input_variables=["input"], template=template))
+    return LLMChain(output_key="edited_code" if mode == "rewrite" else "patch", **kwargs)
@@ -1,12 +1,136 @@
+import hashlib
+import json
+import os
+import textwrap
 from pathlib import Path
-from typing import Union
-
-from llama_index import GPTSimpleVectorIndex, SimpleDirectoryReader
+from typing import TYPE_CHECKING, Dict, Iterable, List, Tuple, Union
 
 from bootstrap import repo_root, vectorstores_root
 from bootstrap.auth import set_environment_vars
+from bootstrap.file_enumeration import enumerate_files
+from bootstrap.introspection import module_qualname, parse_module_source
+from bootstrap.symbol_records import SymbolRecord
+
+# llama_index (and everything the index builds on) is imported where it is used, it takes seconds to import
+if TYPE_CHECKING:
+    from llama_index import Document
+
+# bump whenever the documents or the index format change, so the next save rebuilds the index from scratch
+MANIFEST_VERSION = 5
+
+
+def _symbol_document(rel_path: str, item: SymbolRecord, lines: List[str]) -> "Document":
+    from llama_index import Document
+
+    return Document(
+        text=textwrap.dedent("\n".join(lines)).strip(),
+        doc_id=f"{rel_path}::{item.qualname}",
+        extra_info={
+            "file_name": rel_path,
+            "qualname": item.qualname,
+            "type": item.kind,
+            "start_lineno": item.decorated_lineno,
+            "end_lineno": item.end_lineno,
+        },
+    )
+
+
+def _class_documents(rel_path: str, item: SymbolRecord, source_lines: List[str]) -> List["Document"]:
+    # the class document keeps its docstring, attributes and method signatures, the methods get their own documents
+    documents = []
+    header_lines = []
+    lineno = item.decorated_lineno
+    for child in item.body:
+        if child.kind not in ("method", "class"):
+            continue
+        # chunks start at the first decorator, so a decorated symbol keeps its decorators
+        header_lines.extend(source_lines[lineno - 1 : child.decorated_lineno - 1])
+        if child.kind == "method":
+            header_lines.extend(source_lines[child.decorated_lineno - 1 : child.start_lineno])
+            method_lines = source_lines[child.decorated_lineno - 1 : child.end_lineno]
+            documents.append(_symbol_document(rel_path, child, method_lines))
+        else:
+            documents.extend(_class_documents(rel_path, child, source_lines))
+        lineno = child.end_lineno + 1
+    header_lines.extend(source_lines[lineno - 1 : item.end_lineno])
+    return [_symbol_document(rel_path, item, header_lines)] + documents
+
+
+def symbol_documents(source: str, rel_path: str) -> List["Document"]:
+    """
+    It splits a python module into one document per function, class and method, plus one for the module header
+    (imports, constants and anything else outside of definitions). Each document carries its qualname and line span.
+
+    :param source: the source code of the module
+    :param rel_path: the path of the module relative to the codebase root
+    :return: A list of Document objects, or a single whole-file document if the module does not parse
+    """
+    from llama_index import Document
+
+    records = parse_module_source(source, rel_path)
+    if records is None:
+        return [Document(text=source, doc_id=rel_path, extra_info={"file_name": rel_path})]
+
+    source_lines = source.split("\n")
+    documents = []
+    header_lines = []
+    lineno = 1
+    for item in records:
+        header_lines.extend(source_lines[lineno - 1 : item.decorated_lineno - 1])
+        if item.kind == "class":
+            documents.extend(_class_documents(rel_path, item, source_lines))
+        else:
+            documents.append(
+                _symbol_document(rel_path, item, source_lines[item.decorated_lineno - 1 : item.end_lineno])
+            )
+        lineno = item.end_lineno + 1
+    header_lines.extend(source_lines[lineno - 1 :])
+
+    header = "\n".join(line for line in header_lines if line.strip())
+    if header:
+        module = module_qualname(rel_path)
+        header_info = {"file_name": rel_path, "qualname": module, "type": "module", "start_lineno": 1}
+        header_info["end_lineno"] = len(source_lines)
+        documents.insert(0, Document(text=header, doc_id=f"{rel_path}::{module}", extra_info=header_info))
 
-set_environment_vars()
+    # a property setter, @overload stubs or conditional definitions share their qualname, later ones are numbered
+    seen = {}
+    for doc in documents:
+        seen[doc.doc_id] = seen.get(doc.doc_id, 0) + 1
+        if seen[doc.doc_id] > 1:
+            doc.doc_id = f"{doc.doc_id}#{seen[doc.doc_id]}"
+    return documents
+
+
+def codebase_documents(
+    root: Union[str, Path] = None,
+    chunk_symbols: bool = True,
+) -> List["Document"]:
+    """
+    It reads every source and config file of a codebase into documents with stable doc_ids, so the same file (or
+    symbol) maps to the same document across rebuilds.
+
+    :param root: the root of the codebase to read
+    :type root: str
+    :param chunk_symbols: split python modules into one document per symbol (see `symbol_documents`) instead of one
+        document per file
+    :return: A list of Document objects
+    """
+    from llama_index import Document
+
+    if root is None:
+        root = repo_root
+    documents = []
+    for doc_file in enumerate_files(root, [".py", ".toml"]):
+        # enumerate_files returns absolute paths, whether the root is relative or not
+        rel_path = Path(os.path.relpath(doc_file, root)).as_posix()
+        with open(doc_file, "r", errors="ignore") as f:
+            text = f.read()
+        if chunk_symbols and rel_path.endswith(".py"):
+            documents.extend(symbol_documents(text, rel_path))
+        else:
+            documents.append(Document(text=text, doc_id=rel_path, extra_info={"file_name": rel_path}))
+    return documents
 
 
 def codebase_to_llama_index(
@@ -20,39 +144,160 @@ def codebase_to_llama_index(
     :type root: str
     :return: A GPTTreeIndex object
     """
-    if root is None:
-        root = repo_root
-    doc_files = []
-    for extension in [".py", ".toml"]:
-        doc_files.extend(list(repo_root.glob(f"**/*{extension}")))
+    from bootstrap.embedding_cache import cached_embed_model
+    from bootstrap.faiss_store import GPTFaissVectorIndex
 
-    loader = SimpleDirectoryReader(input_files=doc_files)
-    documents = loader.load_data()
-    return GPTSimpleVectorIndex(documents)
+    set_environment_vars()
+    return GPTFaissVectorIndex(codebase_documents(root), embed_model=cached_embed_model())
+
+
+def document_hash(document: "Document") -> str:
+    """
+    The content hash of a document: its text and extra_info, minus the keys that only say where it is (see
+    `faiss_store.LOCATION_INFO_KEYS`), so a symbol that merely moved keeps its hash.
+    """
+    from bootstrap.faiss_store import LOCATION_INFO_KEYS
+
+    extra_info = {k: v for k, v in (document.extra_info or {}).items() if k not in LOCATION_INFO_KEYS}
+    return hashlib.sha256((document.text + json.dumps(extra_info, sort_keys=True)).encode("utf-8")).hexdigest()
+
+
+def document_manifest(documents: Iterable["Document"]) -> Dict[str, dict]:
+    """
+    The doc_id -> {"hash": content hash, "lines": line span} manifest of a set of documents.
+    """
+    return {
+        doc.get_doc_id(): {
+            "hash": document_hash(doc),
+            "lines": [(doc.extra_info or {}).get("start_lineno"), (doc.extra_info or {}).get("end_lineno")],
+        }
+        for doc in documents
+    }
+
+
+def manifest_path_for(savepath: Union[str, Path]) -> Path:
+    """
+    The manifest of per-document content hashes lives next to the index it describes.
+    """
+    return Path(f"{savepath}.manifest.json")
+
+
+def load_manifest(savepath: Union[str, Path]) -> Union[Dict[str, dict], None]:
+    """
+    Reads the document manifest (see `document_manifest`) of a saved index, or returns None if it is missing or outdated.
+    """
+    try:
+        with open(manifest_path_for(savepath), "r") as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest["documents"]
+
+
+def save_manifest(savepath: Union[str, Path], documents: Dict[str, dict]):
+    manifest_path = manifest_path_for(savepath)
+    tmp_path = manifest_path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({"version": MANIFEST_VERSION, "documents": documents}, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def update_index(
+    index, documents: List["Document"], manifest: Dict[str, dict]
+) -> Tuple[Dict[str, dict], Dict[str, int]]:
+    """
+    It brings an existing index in line with a new set of documents, embedding only the documents that were added or
+    whose content changed and deleting the ones that are gone. Unchanged documents keep their stored vectors.
+
+    Documents that only moved (e.g. the symbols below a new import) are re-inserted so their line spans stay current,
+    but they embed to the same text as before (see `faiss_store.embedding_text`), so a cached embedding model serves
+    them without calling the underlying model.
+
+    :param index: the index to update in place
+    :param documents: the current documents, with stable doc_ids
+    :param manifest: the manifest the index was built from (see `document_manifest`)
+    :return: the manifest of the updated index, and counts of added, changed, moved, deleted and unchanged documents
+    """
+    new_manifest = document_manifest(documents)
+    stats = {"added": 0, "changed": 0, "moved": 0, "deleted": 0, "unchanged": 0}
+
+    for doc_id in manifest.keys() - new_manifest.keys():
+        index.delete(doc_id)
+        stats["deleted"] += 1
+
+    for doc in documents:
+        doc_id = doc.get_doc_id()
+        previous = manifest.get(doc_id)
+        if previous == new_manifest[doc_id]:
+            stats["unchanged"] += 1
+            continue
+        if previous is None:
+            stats["added"] += 1
+        else:
+            index.delete(doc_id)
+            stats["changed" if previous["hash"] != new_manifest[doc_id]["hash"] else "moved"] += 1
+        index.insert(doc)
+
+    return new_manifest, stats
 
 
 def save_codebase_index(
     codebase_root: Union[str, Path] = None,
     savepath: Union[str, Path] = None,
+    incremental: bool = True,
 ):
+    """
+    It builds the codebase index and saves it to disk along with its manifest of document content hashes.
+
+    :param codebase_root: the root of the codebase to index
+    :param savepath: where to save the index
+    :param incremental: when a previous index and manifest exist, only re-embed added or changed files instead of
+        rebuilding the whole index
+    :return: the savepath
+    """
+    from bootstrap.embedding_cache import cached_embed_model
+    from bootstrap.faiss_store import GPTFaissVectorIndex
+
+    set_environment_vars()
     if codebase_root is None:
         codebase_root = repo_root
 
-    index = codebase_to_llama_index(root=codebase_root)
-
     if savepath is None:
         savepath = Path(vectorstores_root) / "codebase_llama_index"
 
+    documents = codebase_documents(root=codebase_root)
+    embed_model = cached_embed_model()
+    manifest = load_manifest(savepath) if incremental and Path(savepath).exists() else None
+    if manifest is None:
+        index = GPTFaissVectorIndex(documents, embed_model=embed_model)
+        manifest = document_manifest(documents)
+    else:
+        index = load_codebase_index(savepath, embed_model=embed_model)
+        manifest, stats = update_index(index, documents, manifest)
+        print(f"Incremental codebase index update: {stats}")
+    print(f"Embedding cache: {embed_model.stats}")
+
+    Path(savepath).parent.mkdir(parents=True, exist_ok=True)
     index.save_to_disk(savepath)
+    save_manifest(savepath, manifest)
     return savepath
 
 
 def load_codebase_index(
     savepath: Union[str, Path] = None,
+    embed_model=None,
 ):
+    from bootstrap.embedding_cache import cached_embed_model
+    from bootstrap.faiss_store import GPTFaissVectorIndex
+
+    set_environment_vars()
     if savepath is None:
         savepath = Path(vectorstores_root) / "codebase_llama_index"
-    return GPTSimpleVectorIndex.load_from_disk(savepath)
+    if embed_model is None:
+        embed_model = cached_embed_model()
+    return GPTFaissVectorIndex.load_from_disk(savepath, embed_model=embed_model)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,293 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from langchain.chat_models.base import BaseChatModel
+from langchain.llms.base import BaseLLM
+from langchain.schema import (
+    AIMessage,
+    BaseMessage,
+    ChatGeneration,
+    ChatResult,
+    Generation,
+    LLMResult,
+)
+
+from bootstrap import cache_root
+
+# "on" caches every completion, "deterministic" only those sampled at temperature 0, "off" none
+CACHE_MODES = ("on", "deterministic", "off")
+DEFAULT_MAX_ENTRIES = 10_000
+DEFAULT_TTL_SECONDS = 30 * 24 * 60 * 60
+# what the OpenAI API samples at when no temperature is given
+DEFAULT_TEMPERATURE = 1.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS completions (
+    model TEXT NOT NULL,
+    temperature REAL NOT NULL,
+    digest TEXT NOT NULL,
+    generations TEXT NOT NULL,
+    created INTEGER NOT NULL,
+    last_used INTEGER NOT NULL,
+    PRIMARY KEY (model, temperature, digest)
+);
+CREATE INDEX IF NOT EXISTS completions_last_used ON completions (last_used);
+"""
+
+
+def cache_mode() -> str:
+    """
+    Reads the completion cache mode from the BOOTSTRAP_LLM_CACHE environment variable (e.g. set in .env).
+    """
+    mode = os.environ.get("BOOTSTRAP_LLM_CACHE", "on")
+    if mode not in CACHE_MODES:
+        raise ValueError(f"Unknown completion cache mode {mode!r}, expected one of {CACHE_MODES}")
+    return mode
+
+
+def prompt_hash(prompt: Any, stop: Optional[Sequence[str]] = None, params: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Returns a stable hash of everything besides the model and temperature that determines a completion.
+    """
+    key = json.dumps({"prompt": prompt, "stop": stop, "params": params or {}}, sort_keys=True, default=str)
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class CompletionCache:
+    """
+    Persistent LLM completion store keyed by (model, temperature, prompt hash), shared by every chain.
+
+    Entries older than `ttl_seconds` are treated as missing and dropped. Once the cache holds more than `max_entries`
+    completions the least recently used ones are evicted. Hit, miss, expiry and eviction counts are kept in `stats`.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path, None] = None,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS,
+    ):
+        if path is None:
+            path = cache_root / "completions.sqlite"
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.executescript(_SCHEMA)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def get(self, model: str, temperature: float, digest: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Looks up a cached completion.
+
+        Returns:
+            The generations (dicts with "text" and "generation_info") of the completion, or None if it is not cached
+            or has expired.
+        """
+        now = time.time_ns()
+        key = (model, temperature, digest)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT generations, created FROM completions WHERE model = ? AND temperature = ? AND digest = ?", key
+            ).fetchone()
+            if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds * 1e9:
+                self._connection.execute(
+                    "DELETE FROM completions WHERE model = ? AND temperature = ? AND digest = ?", key
+                )
+                self._connection.commit()
+                self.stats["expired"] += 1
+                row = None
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self._connection.execute(
+                "UPDATE completions SET last_used = ? WHERE model = ? AND temperature = ? AND digest = ?",
+                (now, *key),
+            )
+            self._connection.commit()
+            self.stats["hits"] += 1
+        return json.loads(row[0])
+
+    def put(self, model: str, temperature: float, digest: str, generations: List[Dict[str, Any]]):
+        """
+        Stores a completion, evicting the least recently used entries if the cache is full.
+        """
+        now = time.time_ns()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?, ?, ?)",
+                (model, temperature, digest, json.dumps(generations), now, now),
+            )
+            (count,) = self._connection.execute("SELECT COUNT(*) FROM completions").fetchone()
+            if count > self.max_entries:
+                self._connection.execute(
+                    "DELETE FROM completions WHERE rowid IN "
+                    "(SELECT rowid FROM completions ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+                self.stats["evictions"] += count - self.max_entries
+            self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+
+_completion_cache: Optional[CompletionCache] = None
+
+
+def get_completion_cache() -> CompletionCache:
+    """
+    Returns the process-wide completion cache, opening it on first use.
+    """
+    global _completion_cache
+    if _completion_cache is None:
+        _completion_cache = CompletionCache()
+    return _completion_cache
+
+
+def sampling_key(model: Any) -> Tuple[str, float, Dict[str, Any]]:
+    """
+    Returns the name, sampling temperature and other generation parameters of a langchain LLM or chat model.
+    """
+    name = getattr(model, "model_name", None) or type(model).__name__
+    params = dict(getattr(model, "model_kwargs", None) or {})
+    temperature = getattr(model, "temperature", None)
+    if temperature is None:
+        temperature = params.pop("temperature", DEFAULT_TEMPERATURE)
+    for field in ("max_tokens", "n", "top_p"):
+        if getattr(model, field, None) is not None:
+            params[field] = getattr(model, field)
+    return name, float(temperature), params
+
+
+class _Cached:
+    # shared by the LLM and chat model wrappers
+
+    def _cache(self) -> Optional[CompletionCache]:
+        mode = self.mode or cache_mode()
+        if mode == "off":
+            return None
+        if mode == "deterministic" and sampling_key(self.model)[1] != 0:
+            return None
+        return self.completion_cache if self.completion_cache is not None else get_completion_cache()
+
+
+class CachedLLM(_Cached, BaseLLM):
+    """
+    Wraps a langchain LLM so that completions of prompts it has already seen are read from the completion cache.
+
+    `mode` overrides the BOOTSTRAP_LLM_CACHE environment variable, e.g. "deterministic" to always call the model
+    when it samples at a non-zero temperature.
+    """
+
+    model: BaseLLM
+    completion_cache: Any = None
+    mode: Optional[str] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cached-{self.model._llm_type}"
+
+    def _lookup(self, prompts: List[str], stop) -> Tuple[Dict[int, List[Generation]], List[int]]:
+        cache = self._cache()
+        if cache is None:
+            return {}, list(range(len(prompts)))
+        name, temperature, params = sampling_key(self.model)
+        cached = {}
+        for i, prompt in enumerate(prompts):
+            generations = cache.get(name, temperature, prompt_hash(prompt, stop, params))
+            if generations is not None:
+                cached[i] = [Generation(**generation) for generation in generations]
+        return cached, [i for i in range(len(prompts)) if i not in cached]
+
+    def _store(self, prompts: List[str], stop, missing: List[int], result: LLMResult, cached):
+        cache = self._cache()
+        name, temperature, params = sampling_key(self.model)
+        for i, generations in zip(missing, result.generations):
+            cached[i] = generations
+            if cache is not None:
+                value = [{"text": g.text, "generation_info": g.generation_info} for g in generations]
+                cache.put(name, temperature, prompt_hash(prompts[i], stop, params), value)
+        return LLMResult(generations=[cached[i] for i in range(len(prompts))], llm_output=result.llm_output)
+
+    def _generate(self, prompts: List[str], stop: Optional[List[str]] = None) -> LLMResult:
+        cached, missing = self._lookup(prompts, stop)
+        result = (
+            self.model._generate([prompts[i] for i in missing], stop=stop) if missing else LLMResult(generations=[])
+        )
+        return self._store(prompts, stop, missing, result, cached)
+
+    async def _agenerate(self, prompts: List[str], stop: Optional[List[str]] = None) -> LLMResult:
+        cached, missing = self._lookup(prompts, stop)
+        result = (
+            await self.model._agenerate([prompts[i] for i in missing], stop=stop)
+            if missing
+            else LLMResult(generations=[])
+        )
+        return self._store(prompts, stop, missing, result, cached)
+
+
+def _messages_key(messages: List[BaseMessage]) -> List[Tuple[str, str]]:
+    return [(getattr(message, "role", message.type), message.content) for message in messages]
+
+
+class CachedChatModel(_Cached, BaseChatModel):
+    """
+    Wraps a langchain chat model so that replies to conversations it has already seen are read from the completion
+    cache. See `CachedLLM` for `mode`.
+    """
+
+    model: BaseChatModel
+    completion_cache: Any = None
+    mode: Optional[str] = None
+
+    def _lookup(self, messages: List[BaseMessage], stop) -> Tuple[Optional[ChatResult], Optional[tuple]]:
+        cache = self._cache()
+        if cache is None:
+            return None, None
+        name, temperature, params = sampling_key(self.model)
+        key = (name, temperature, prompt_hash(_messages_key(messages), stop, params))
+        generations = cache.get(*key)
+        if generations is None:
+            return None, (cache, key)
+        return (
+            ChatResult(
+                generations=[
+                    ChatGeneration(message=AIMessage(content=g["text"]), generation_info=g["generation_info"])
+                    for g in generations
+                ]
+            ),
+            None,
+        )
+
+    @staticmethod
+    def _store(result: ChatResult, pending: Optional[tuple]) -> ChatResult:
+        if pending is not None:
+            cache, key = pending
+            cache.put(*key, [{"text": g.text, "generation_info": g.generation_info} for g in result.generations])
+        return result
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None) -> ChatResult:
+        cached, pending = self._lookup(messages, stop)
+        if cached is not None:
+            return cached
+        return self._store(self.model._generate(messages, stop=stop), pending)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None) -> ChatResult:
+        cached, pending = self._lookup(messages, stop)
+        if cached is not None:
+            return cached
+        return self._store(await self.model._agenerate(messages, stop=stop), pending)
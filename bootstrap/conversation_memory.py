@@ -0,0 +1,245 @@
+import re
+from typing import Any, Dict, List, Optional
+
+from langchain.chains.llm import LLMChain
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain.memory.prompt import SUMMARY_PROMPT
+from langchain.schema import (
+    BaseLanguageModel,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    get_buffer_string,
+)
+from pydantic import Field
+
+from bootstrap.token_counting import CHARS_PER_TOKEN, count_tokens
+
+DEFAULT_MAX_HISTORY_TOKENS = 3000
+# role and separator tokens the chat format adds to every message
+MESSAGE_OVERHEAD_TOKENS = 4
+# the longest line a compacted message contributes to the extractive summary
+SUMMARY_LINE_CHARS = 200
+# ends a message of the latest turn that was cut to fit the budget
+TRUNCATION_NOTE = "\n[... truncated to fit the conversation memory]"
+
+CODE_BLOCK = re.compile(r"```[^\n]*\n.*?```", re.S)
+TASK_LINE = re.compile(r"^\s*(?:[-*]|\d+\.)\s+\[[ xX]\]\s+\S.*$", re.M)
+OPEN_TASK_LINE = re.compile(r"^\s*(?:[-*]|\d+\.)\s+\[ \]\s+\S", re.M)
+DEFINED_NAME = re.compile(r"^\s*(?:async\s+def|def|class)\s+(\w+)|^(\w+)\s*(?::[^=\n]*)?=[^=]", re.M)
+
+
+def message_tokens(message: BaseMessage) -> int:
+    return count_tokens(message.content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def code_blocks(text: str) -> List[Dict[str, Any]]:
+    """
+    Finds the fenced code blocks of a message, with the names they define (functions, classes and assignments),
+    which are how later messages refer to them.
+    """
+    blocks = []
+    for match in CODE_BLOCK.finditer(text):
+        names = [def_name or assigned for def_name, assigned in DEFINED_NAME.findall(match.group())]
+        if names:
+            blocks.append({"kind": "code", "text": match.group(), "anchors": sorted(set(names))})
+    return blocks
+
+
+def task_list(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Finds the checklist ("- [ ] do something") of a message, if it has any.
+    """
+    lines = [match.group().rstrip() for match in TASK_LINE.finditer(text)]
+    return {"kind": "tasks", "text": "\n".join(lines), "anchors": []} if lines else None
+
+
+def _is_referenced(pin: Dict[str, Any], text: str) -> bool:
+    if pin["kind"] == "tasks":
+        # a task list matters until everything on it is done
+        return OPEN_TASK_LINE.search(pin["text"]) is not None
+    return any(re.search(rf"\b{re.escape(anchor)}\b", text) for anchor in pin["anchors"])
+
+
+def _last_tokens(text: str, max_tokens: int) -> str:
+    # keeps the most recent lines of a text that fit in a number of tokens
+    kept = []
+    total = 0
+    for line in reversed(text.split("\n")):
+        total += count_tokens(line) + 1
+        if total > max_tokens:
+            break
+        kept.append(line)
+    return "\n".join(reversed(kept))
+
+
+def _first_tokens(text: str, max_tokens: int) -> str:
+    # keeps the first lines of a text that fit in a number of tokens, or the start of the first line if none does
+    kept = []
+    total = 0
+    for line in text.split("\n"):
+        total += count_tokens(line) + 1
+        if total > max_tokens:
+            break
+        kept.append(line)
+    if kept:
+        return "\n".join(kept)
+    head = text[: max_tokens * CHARS_PER_TOKEN]
+    while head and count_tokens(head) > max_tokens:
+        head = head[: len(head) * 3 // 4]
+    return head
+
+
+class TokenBudgetMemory(BaseChatMemory):
+    """
+    Conversation memory that never takes up more than `max_token_limit` tokens of the prompt.
+
+    The most recent turns are kept verbatim. Once they no longer fit, the oldest turns are folded into a rolling
+    summary of at most `summary_token_limit` tokens and a quarter of the budget, written by `llm` if one is given
+    and otherwise made of the first line of each message. The latest turn is never folded. Code blocks
+    that later messages still refer to by name, and task lists with open items, are pinned rather than summarized.
+    When even the summary and pins do not fit, the oldest pins are dropped first, then the oldest part of the
+    summary, and if the latest turn alone is over budget (e.g. a long paste), its longest message is cut short.
+
+    The token counts of every turn are recorded in `turn_stats`.
+    """
+
+    max_token_limit: int = DEFAULT_MAX_HISTORY_TOKENS
+    summary_token_limit: int = 500
+    llm: Optional[BaseLanguageModel] = None
+    memory_key: str = "history"
+    human_prefix: str = "Human"
+    ai_prefix: str = "AI"
+    summary: str = ""
+    pinned: List[Dict[str, Any]] = Field(default_factory=list)
+    turn_stats: List[Dict[str, int]] = Field(default_factory=list)
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def history_messages(self) -> List[BaseMessage]:
+        messages = []
+        if self.summary:
+            messages.append(SystemMessage(content=f"Summary of the earlier conversation:\n{self.summary}"))
+        if self.pinned:
+            pins = "\n\n".join(pin["text"] for pin in self.pinned)
+            messages.append(SystemMessage(content=f"Code and tasks from the earlier conversation:\n{pins}"))
+        return messages + self.chat_memory.messages
+
+    def history_tokens(self) -> int:
+        return sum(message_tokens(message) for message in self.history_messages())
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        messages = self.history_messages()
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {self.memory_key: get_buffer_string(messages, self.human_prefix, self.ai_prefix)}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        super().save_context(inputs, outputs)
+        human, ai = self.chat_memory.messages[-2:]
+        summarized = self._compact()
+        self.turn_stats.append(
+            {
+                "turn": len(self.turn_stats) + 1,
+                "input_tokens": message_tokens(human),
+                "output_tokens": message_tokens(ai),
+                "history_tokens": self.history_tokens(),
+                "verbatim_messages": len(self.chat_memory.messages),
+                "summarized_messages": summarized,
+                "summary_tokens": count_tokens(self.summary),
+                "pinned_tokens": sum(count_tokens(pin["text"]) for pin in self.pinned),
+            }
+        )
+
+    def clear(self) -> None:
+        super().clear()
+        self.summary = ""
+        self.pinned = []
+        self.turn_stats = []
+
+    def _compact(self) -> int:
+        messages = self.chat_memory.messages
+        folded = []
+        # the latest turn always stays verbatim
+        while len(messages) > 2 and self.history_tokens() > self.max_token_limit:
+            # turns leave the verbatim window whole, a human message together with the reply to it
+            count = 2 if isinstance(messages[0], HumanMessage) else 1
+            turn = messages[:count]
+            del messages[:count]
+            folded.extend(turn)
+            self._pin(turn)
+            self._unpin_unreferenced()
+            if self.llm is None:
+                self._summarize(turn)
+        if folded and self.llm is not None:
+            # one call for everything folded, rather than one per turn
+            self._summarize(folded)
+        self._unpin_unreferenced()
+
+        while self.pinned and self.history_tokens() > self.max_token_limit:
+            self.pinned.pop(0)
+        if self.history_tokens() > self.max_token_limit:
+            budget = self.max_token_limit - (self.history_tokens() - count_tokens(self.summary))
+            self.summary = _last_tokens(self.summary, max(budget, 0))
+        self._truncate_latest_turn()
+        return len(folded)
+
+    def _truncate_latest_turn(self):
+        messages = self.chat_memory.messages
+        while (excess := self.history_tokens() - self.max_token_limit) > 0:
+            i = max(range(len(messages)), key=lambda i: message_tokens(messages[i]))
+            text = messages[i].content
+            if text.endswith(TRUNCATION_NOTE):
+                text = text[: -len(TRUNCATION_NOTE)]
+            else:
+                excess += count_tokens(TRUNCATION_NOTE)
+            content = _first_tokens(text, max(count_tokens(text) - excess, 0)) + TRUNCATION_NOTE
+            if content == messages[i].content:
+                # nothing left to cut, the budget is smaller than the overhead of the messages
+                break
+            messages[i] = messages[i].copy(update={"content": content})
+
+    def _unpin_unreferenced(self):
+        recent = "\n".join([self.summary] + [message.content for message in self.chat_memory.messages])
+        self.pinned = [pin for pin in self.pinned if _is_referenced(pin, recent)]
+
+    def _pin(self, messages: List[BaseMessage]):
+        for message in messages:
+            for block in code_blocks(message.content):
+                # a newer version of the same definitions replaces the pinned one
+                self.pinned = [pin for pin in self.pinned if pin["anchors"] != block["anchors"]]
+                self.pinned.append(block)
+            tasks = task_list(message.content)
+            if tasks is not None:
+                self.pinned = [pin for pin in self.pinned if pin["kind"] != "tasks"] + [tasks]
+
+    def _summarize(self, messages: List[BaseMessage]):
+        if self.llm is not None:
+            new_lines = get_buffer_string(messages, self.human_prefix, self.ai_prefix)
+            summary = LLMChain(llm=self.llm, prompt=SUMMARY_PROMPT).predict(summary=self.summary, new_lines=new_lines)
+        else:
+            lines = [self.summary] if self.summary else []
+            for message in messages:
+                prefix = self.human_prefix if isinstance(message, HumanMessage) else self.ai_prefix
+                text = CODE_BLOCK.sub("[code]", message.content).strip()
+                first_line = text.split("\n", 1)[0]
+                if len(first_line) > SUMMARY_LINE_CHARS:
+                    first_line = first_line[:SUMMARY_LINE_CHARS] + "..."
+                lines.append(f"{prefix}: {first_line}")
+            summary = "\n".join(lines)
+        # the summary never takes more than a quarter of the budget, the rest is for pins and recent turns
+        self.summary = _last_tokens(summary.strip(), min(self.summary_token_limit, self.max_token_limit // 4))
+
+    def token_report(self) -> str:
+        """
+        Formats `turn_stats` as a table, to tune `max_token_limit` with.
+        """
+        header = "turn  input  output  history  verbatim  summarized  summary  pinned"
+        rows = [
+            f"{s['turn']:4d} {s['input_tokens']:6d} {s['output_tokens']:7d} {s['history_tokens']:8d} "
+            f"{s['verbatim_messages']:9d} {s['summarized_messages']:11d} {s['summary_tokens']:8d} {s['pinned_tokens']:7d}"
+            for s in self.turn_stats
+        ]
+        return "\n".join([header] + rows)
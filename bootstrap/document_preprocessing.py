@@ -0,0 +1,213 @@
+import json
+import os
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional, Union
+
+from bootstrap.token_counting import CHARS_PER_TOKEN, count_tokens
+
+# case-insensitive markers that code generators leave in the header of their output
+GENERATED_MARKERS = (
+    "do not edit",
+    "@generated",
+    "automatically generated",
+    "autogenerated by",
+    "generated by the protocol buffer compiler",
+)
+GENERATED_SUFFIXES = ("_pb2.py", "_pb2_grpc.py", ".min.js", ".min.css")
+# the script and asset formats that get minified, prose, notebooks and python modules never are
+MINIFIABLE_SUFFIXES = (".js", ".mjs", ".cjs", ".css", ".json", ".map", ".svg", ".html")
+# only the header is searched, so prose that merely mentions generated code is kept
+_MARKER_SEARCH_LINES = 5
+
+
+@dataclass
+class PreprocessingPolicy:
+    """
+    What to leave out of a document before it is embedded.
+
+    Attributes:
+        max_file_bytes (int): The largest document to embed, measured after notebooks are reduced to their cells.
+        oversized (str): "truncate" to keep the first `max_file_bytes` of larger documents, "skip" to drop them.
+        skip_generated (bool): Whether to drop generated files (protobuf stubs, files marked "do not edit") and
+            minified ones.
+        max_line_length (int): Script and asset files (see MINIFIABLE_SUFFIXES) whose lines are longer than this on
+            average are considered minified. Longer lines of the documents that are kept are cut to this length.
+    """
+
+    max_file_bytes: int = 100_000
+    oversized: str = "truncate"
+    skip_generated: bool = True
+    max_line_length: int = 1000
+
+    def __post_init__(self):
+        if self.oversized not in ("truncate", "skip"):
+            raise ValueError(f"Unknown oversized file policy {self.oversized!r}, expected 'truncate' or 'skip'")
+
+
+@dataclass
+class PreprocessingStats:
+    """
+    What preprocessing did to the documents of a repo. Tokens are counted with `count_tokens`, except in the parts of
+    oversized files that were never read, which are estimated from their size.
+    """
+
+    files: int = 0
+    notebooks: int = 0
+    skipped: int = 0
+    truncated: int = 0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    tokens_in: int = 0
+    tokens_out: int = 0
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_in - self.bytes_out
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_in - self.tokens_out
+
+    def to_dict(self) -> Dict[str, int]:
+        return {**asdict(self), "bytes_saved": self.bytes_saved, "tokens_saved": self.tokens_saved}
+
+
+def notebook_text(raw: str) -> Optional[str]:
+    """
+    Reduces a Jupyter notebook to the source of its markdown and code cells, dropping outputs (and their base64
+    images), execution counts and metadata.
+
+    Returns:
+        The cells separated by blank lines, with code cells fenced as python, or None if the notebook does not parse.
+    """
+    try:
+        cells = json.loads(raw)["cells"]
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return None
+    parts = []
+    for cell in cells:
+        source = cell.get("source", "")
+        if isinstance(source, list):
+            source = "".join(source)
+        source = source.strip()
+        if not source:
+            continue
+        if cell.get("cell_type") == "code":
+            parts.append(f"```python\n{source}\n```")
+        elif cell.get("cell_type") == "markdown":
+            parts.append(source)
+    return "\n\n".join(parts)
+
+
+def is_generated(rel_path: str, text: str, policy: PreprocessingPolicy) -> bool:
+    """
+    Whether a file looks machine-generated or minified, and so is not worth embedding.
+    """
+    if rel_path.endswith(GENERATED_SUFFIXES):
+        return True
+    head = "\n".join(text.split("\n", _MARKER_SEARCH_LINES)[:_MARKER_SEARCH_LINES]).lower()
+    if any(marker in head for marker in GENERATED_MARKERS):
+        return True
+    if not rel_path.endswith(MINIFIABLE_SUFFIXES):
+        return False
+    # averaged, so a bundle is caught but a stylesheet with one long data URI is not
+    lines = text.splitlines()
+    return bool(lines) and len(text) / len(lines) > policy.max_line_length
+
+
+def _cut_long_lines(text: str, max_line_length: int) -> str:
+    if all(len(line) <= max_line_length for line in text.split("\n")):
+        return text
+    return "\n".join(line[:max_line_length] for line in text.split("\n"))
+
+
+def _unread_tokens(size: int, text: str) -> int:
+    # the estimated tokens of the part of a file beyond the text that was read
+    return -(-max(size - len(text.encode("utf-8")), 0) // CHARS_PER_TOKEN)
+
+
+def preprocess_document(
+    rel_path: str,
+    text: str,
+    policy: PreprocessingPolicy,
+    stats: Optional[PreprocessingStats] = None,
+    size: Optional[int] = None,
+) -> Optional[str]:
+    """
+    Applies a preprocessing policy to the text of a file.
+
+    Parameters:
+        rel_path (str): The path of the file, relative to the root of its repo.
+        text (str): The content of the file.
+        policy (PreprocessingPolicy): What to leave out.
+        stats (PreprocessingStats): Updated with what was left out, if given.
+        size (int): The size of the whole file in bytes, when `text` is only its beginning.
+
+    Returns:
+        The text to embed, or None if the file should not be indexed.
+    """
+    processed = text
+    if rel_path.endswith(".ipynb"):
+        cells = notebook_text(text)
+        if cells is not None:
+            processed = cells
+            if stats is not None:
+                stats.notebooks += 1
+
+    if policy.skip_generated and is_generated(rel_path, processed, policy):
+        processed = None
+    else:
+        # e.g. markdown paragraphs kept on one line, or a long string literal, are not worth embedding in full
+        processed = _cut_long_lines(processed, policy.max_line_length)
+        encoded = processed.encode("utf-8")
+        if len(encoded) > policy.max_file_bytes:
+            if policy.oversized == "skip":
+                processed = None
+            else:
+                # cut at the last full line that fits
+                kept = encoded[: policy.max_file_bytes].decode("utf-8", errors="ignore")
+                processed = kept[: kept.rfind("\n") + 1] or kept
+                if stats is not None:
+                    stats.truncated += 1
+
+    if stats is not None:
+        stats.files += 1
+        stats.bytes_in += size if size is not None else len(text.encode("utf-8"))
+        stats.tokens_in += count_tokens(text) + (_unread_tokens(size, text) if size is not None else 0)
+        if processed is None:
+            stats.skipped += 1
+        else:
+            stats.bytes_out += len(processed.encode("utf-8"))
+            stats.tokens_out += count_tokens(processed)
+    return processed
+
+
+def read_document(
+    path: Union[str, os.PathLike],
+    rel_path: str,
+    policy: PreprocessingPolicy,
+    stats: Optional[PreprocessingStats] = None,
+) -> Optional[str]:
+    """
+    Reads a file and applies a preprocessing policy to it (see `preprocess_document`), without reading more of an
+    oversized file than the policy keeps: skipped files are not read at all, and only the beginning of truncated ones
+    is. Notebooks are read whole, since their size only counts once their outputs are dropped.
+
+    Returns:
+        The text to embed, or None if the file should not be indexed.
+    """
+    size = os.stat(path).st_size
+    if size <= policy.max_file_bytes or rel_path.endswith(".ipynb"):
+        with open(path, "r", errors="ignore") as f:
+            return preprocess_document(rel_path, f.read(), policy, stats)
+    if policy.oversized == "skip":
+        if stats is not None:
+            stats.files += 1
+            stats.skipped += 1
+            stats.bytes_in += size
+            stats.tokens_in += _unread_tokens(size, "")
+        return None
+    with open(path, "r", errors="ignore") as f:
+        # every character takes at least a byte, so one more than fits is enough to cut the text at its last full line
+        head = f.read(policy.max_file_bytes + 1)
+    return preprocess_document(rel_path, head, policy, stats, size=size)
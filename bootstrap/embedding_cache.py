@@ -0,0 +1,206 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+from llama_index.embeddings.base import BaseEmbedding
+from llama_index.embeddings.openai import OpenAIEmbedding
+
+from bootstrap import cache_root
+from bootstrap.embedding_client import ClientEmbedding
+
+# roughly 600MB of ada-002 vectors stored as float32
+DEFAULT_MAX_ENTRIES = 100_000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    last_used INTEGER NOT NULL,
+    PRIMARY KEY (model, digest)
+);
+CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+"""
+
+
+def text_hash(text: str) -> str:
+    """
+    Returns a short, stable hash of a text to embed.
+    """
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding store keyed by (embedding model, content hash), shared by every index builder.
+
+    Vectors are stored as float32 blobs in SQLite. Once the cache holds more than `max_entries` vectors the least
+    recently used ones are evicted. Hit, miss and eviction counts are kept in `stats`.
+    """
+
+    def __init__(self, path: Union[str, Path, None] = None, max_entries: int = DEFAULT_MAX_ENTRIES):
+        if path is None:
+            path = cache_root / "embeddings.sqlite"
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.executescript(_SCHEMA)
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        Looks up the cached embeddings of some texts.
+
+        Parameters:
+            model (str): The name of the embedding model.
+            texts (Sequence[str]): The texts to look up.
+
+        Returns:
+            The cached embedding of every text, or None where the text has not been embedded with this model yet.
+        """
+        digests = [text_hash(text) for text in texts]
+        found = {}
+        with self._lock:
+            # stay well below sqlite's limit on the number of query parameters
+            unique_digests = list(set(digests))
+            for start in range(0, len(unique_digests), 500):
+                chunk = unique_digests[start : start + 500]
+                rows = self._connection.execute(
+                    f"SELECT digest, vector FROM embeddings WHERE model = ? AND digest IN ({','.join('?' * len(chunk))})",
+                    [model, *chunk],
+                )
+                for digest, vector in rows:
+                    found[digest] = array("f", vector).tolist()
+            if found:
+                now = time.time_ns()
+                self._connection.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND digest = ?",
+                    [(now, model, digest) for digest in found],
+                )
+                self._connection.commit()
+            hits = sum(digest in found for digest in digests)
+            self.stats["hits"] += hits
+            self.stats["misses"] += len(digests) - hits
+        return [found.get(digest) for digest in digests]
+
+    def put_many(self, model: str, texts: Sequence[str], embeddings: Sequence[Sequence[float]]):
+        """
+        Stores the embeddings of some texts, evicting the least recently used entries if the cache is full.
+        """
+        now = time.time_ns()
+        rows = [
+            (model, text_hash(text), array("f", embedding).tobytes(), now) for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            (count,) = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if count > self.max_entries:
+                self._connection.execute(
+                    "DELETE FROM embeddings WHERE rowid IN "
+                    "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+                self.stats["evictions"] += count - self.max_entries
+            self._connection.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        self._connection.close()
+
+
+_embedding_cache: Optional[EmbeddingCache] = None
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """
+    Returns the process-wide embedding cache, opening it on first use.
+    """
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache()
+    return _embedding_cache
+
+
+def embed_model_name(embed_model: BaseEmbedding) -> str:
+    """
+    Returns a name that identifies the vectors an embedding model produces, so different models never share entries.
+    """
+    if isinstance(embed_model, ClientEmbedding):
+        return embed_model.model_name
+    if isinstance(embed_model, OpenAIEmbedding):
+        if embed_model.deployment_name is not None:
+            return f"openai:{embed_model.deployment_name}"
+        return f"openai:{embed_model.mode.value}:{embed_model.model.value}"
+    return type(embed_model).__name__
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Embedding model that consults an `EmbeddingCache` before calling the wrapped model, and only sends it the texts
+    that have not been embedded before.
+    """
+
+    def __init__(
+        self,
+        embed_model: Optional[BaseEmbedding] = None,
+        cache: Optional[EmbeddingCache] = None,
+        model_name: Optional[str] = None,
+    ):
+        self.embed_model = embed_model if embed_model is not None else ClientEmbedding()
+        super().__init__(embed_batch_size=self.embed_model._embed_batch_size)
+        self.cache = cache if cache is not None else get_embedding_cache()
+        self.model_name = model_name or embed_model_name(self.embed_model)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return self.cache.stats
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        # queries can be embedded differently from documents, so they are cached under their own name
+        model = f"{self.model_name}:query"
+        (embedding,) = self.cache.get_many(model, [query])
+        if embedding is None:
+            embedding = self.embed_model._get_query_embedding(query)
+            self.cache.put_many(model, [query], [embedding])
+        return embedding
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        embeddings = self.cache.get_many(self.model_name, texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            new_embeddings = self.embed_model._get_text_embeddings([texts[i] for i in missing])
+            self._fill(texts, embeddings, missing, new_embeddings)
+        return embeddings
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        embeddings = self.cache.get_many(self.model_name, texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            new_embeddings = await self.embed_model._aget_text_embeddings([texts[i] for i in missing])
+            self._fill(texts, embeddings, missing, new_embeddings)
+        return embeddings
+
+    def _fill(self, texts, embeddings, missing, new_embeddings):
+        for i, embedding in zip(missing, new_embeddings):
+            embeddings[i] = embedding
+        self.cache.put_many(self.model_name, [texts[i] for i in missing], new_embeddings)
+
+
+def cached_embed_model(embed_model: Optional[BaseEmbedding] = None) -> CachedEmbedding:
+    """
+    Wraps an embedding model (the shared embedding client's by default, see `ClientEmbedding`) with the shared on-disk
+    embedding cache.
+    """
+    return CachedEmbedding(embed_model)
@@ -0,0 +1,284 @@
+import asyncio
+import hashlib
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from llama_index.embeddings.base import BaseEmbedding
+
+from bootstrap.token_counting import count_tokens
+
+BACKENDS = ("openai", "fake")
+
+
+@dataclass
+class EmbeddingClientConfig:
+    """
+    How an EmbeddingClient batches, parallelizes and paces its requests.
+
+    Attributes:
+        backend (str): "openai", or "fake" for the deterministic local embedder of tests and benchmarks.
+        batch_size (int): The most texts sent in one request (OpenAI accepts up to 2048).
+        max_concurrency (int): The most requests in flight at once for one call to `aembed`.
+        requests_per_minute (int): The request rate limit the client stays under.
+        tokens_per_minute (int): The token rate limit the client stays under.
+        max_retries (int): How many times a failed request is retried before giving up.
+        initial_backoff (float): The delay before the first retry in seconds, doubled after each failure.
+        max_backoff (float): The longest delay between two retries in seconds.
+    """
+
+    backend: str = "openai"
+    batch_size: int = 256
+    max_concurrency: int = 4
+    requests_per_minute: int = 3_000
+    tokens_per_minute: int = 1_000_000
+    max_retries: int = 6
+    initial_backoff: float = 1.0
+    max_backoff: float = 60.0
+
+    def __post_init__(self):
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend {self.backend!r}, expected one of {BACKENDS}")
+
+    @classmethod
+    def from_env(cls) -> "EmbeddingClientConfig":
+        """
+        Reads the config from BOOTSTRAP_EMBED_* environment variables (e.g. set in .env), e.g.
+        BOOTSTRAP_EMBED_MAX_CONCURRENCY=8 and BOOTSTRAP_EMBED_TOKENS_PER_MINUTE=350000.
+        """
+        config = cls()
+        for field, default in asdict(config).items():
+            value = os.environ.get(f"BOOTSTRAP_EMBED_{field.upper()}")
+            if value is not None:
+                setattr(config, field, type(default)(value))
+        config.__post_init__()
+        return config
+
+
+class EmbeddingBackend:
+    """
+    Where embeddings come from. A backend embeds one batch per call and says which of its errors are worth retrying;
+    batching, concurrency, rate limiting and retries are left to the EmbeddingClient.
+    """
+
+    # identifies the vectors the backend produces, e.g. in the embedding cache
+    model_name: str
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    def is_retryable(self, error: Exception) -> bool:
+        return False
+
+
+class OpenAIBackend(EmbeddingBackend):
+    def __init__(self, model: str = "text-embedding-ada-002"):
+        self.model = model
+        # the name llama_index's OpenAIEmbedding was cached under, so existing cache entries stay valid
+        self.model_name = f"openai:similarity:{model}"
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        import openai
+
+        # newlines hurt the quality of ada embeddings, llama_index replaces them the same way
+        response = await openai.Embedding.acreate(input=[text.replace("\n", " ") for text in texts], engine=self.model)
+        return [item["embedding"] for item in sorted(response["data"], key=lambda item: item["index"])]
+
+    def is_retryable(self, error: Exception) -> bool:
+        import openai.error
+
+        return isinstance(
+            error,
+            (
+                openai.error.RateLimitError,
+                openai.error.APIError,
+                openai.error.Timeout,
+                openai.error.APIConnectionError,
+                openai.error.ServiceUnavailableError,
+                openai.error.TryAgain,
+            ),
+        )
+
+
+class FakeBackend(EmbeddingBackend):
+    """
+    Deterministic local embedder for tests and benchmarks: the same text always gets the same unit vector, without
+    any network access. `latency` simulates the duration of a request.
+    """
+
+    def __init__(self, dim: int = 64, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.model_name = f"fake:{dim}"
+        self.batches: List[int] = []
+
+    def embed_text(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dim)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        self.batches.append(len(texts))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self.embed_text(text) for text in texts]
+
+
+class TokenBucket:
+    """
+    Paces requests to a rate limit: `acquire` waits until the bucket has refilled enough for the amount asked.
+
+    The bucket is shared by every thread and event loop of the process, so concurrent index builders stay under the
+    same limit together.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None, clock=time.monotonic):
+        self.rate = per_minute / 60
+        # a minute's worth by default, so a cold start can burst up to the limit
+        self.capacity = capacity if capacity is not None else per_minute
+        self.clock = clock
+        self._available = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _take(self, amount: float) -> float:
+        # takes the amount and returns 0, or returns how long to wait before it is available
+        with self._lock:
+            now = self.clock()
+            self._available = min(self.capacity, self._available + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._available >= amount:
+                self._available -= amount
+                return 0.0
+            return (amount - self._available) / self.rate
+
+    async def acquire(self, amount: float = 1):
+        # anything larger than the bucket would never fit, it gets the whole bucket instead
+        amount = min(amount, self.capacity)
+        while (wait := self._take(amount)) > 0:
+            await asyncio.sleep(wait)
+
+
+class EmbeddingClient:
+    """
+    Embeds texts through a backend in batches of `batch_size`, with up to `max_concurrency` requests in flight,
+    staying under the request and token rate limits and retrying failed requests with exponential backoff and
+    jitter. Request, retry, text and token counts are kept in `stats`.
+    """
+
+    def __init__(self, backend: Optional[EmbeddingBackend] = None, config: Optional[EmbeddingClientConfig] = None):
+        self.config = config or EmbeddingClientConfig.from_env()
+        if backend is None:
+            backend = FakeBackend() if self.config.backend == "fake" else OpenAIBackend()
+        self.backend = backend
+        self.request_bucket = TokenBucket(self.config.requests_per_minute)
+        self.token_bucket = TokenBucket(self.config.tokens_per_minute)
+        self.stats = {"requests": 0, "retries": 0, "texts": 0, "tokens": 0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def model_name(self) -> str:
+        return self.backend.model_name
+
+    def _count(self, **counts: int):
+        with self._stats_lock:
+            for key, value in counts.items():
+                self.stats[key] += value
+
+    async def _embed_batch(self, texts: List[str], semaphore: asyncio.Semaphore) -> List[List[float]]:
+        tokens = sum(count_tokens(text) for text in texts)
+        async with semaphore:
+            for attempt in range(self.config.max_retries + 1):
+                await self.request_bucket.acquire(1)
+                await self.token_bucket.acquire(tokens)
+                try:
+                    embeddings = await self.backend.aembed(texts)
+                except Exception as e:
+                    if attempt == self.config.max_retries or not self.backend.is_retryable(e):
+                        raise
+                    self._count(retries=1)
+                    backoff = min(self.config.max_backoff, self.config.initial_backoff * 2**attempt)
+                    await asyncio.sleep(backoff * random.uniform(0.5, 1))
+                    continue
+                self._count(requests=1, texts=len(texts), tokens=tokens)
+                return embeddings
+
+    async def aembed(self, texts: Sequence[str]) -> List[List[float]]:
+        """
+        Embeds texts, in the order they are given.
+        """
+        texts = list(texts)
+        semaphore = asyncio.Semaphore(self.config.max_concurrency)
+        batches = [
+            texts[start : start + self.config.batch_size] for start in range(0, len(texts), self.config.batch_size)
+        ]
+        results = await asyncio.gather(*(self._embed_batch(batch, semaphore) for batch in batches))
+        return [embedding for batch in results for embedding in batch]
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        """
+        Embeds texts from synchronous code, in the order they are given.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.aembed(texts))
+        # called from inside an event loop (e.g. a notebook), which cannot be blocked on, so use another one
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, self.aembed(texts)).result()
+
+
+_embedding_client: Optional[EmbeddingClient] = None
+_embedding_client_lock = threading.Lock()
+
+
+def get_embedding_client() -> EmbeddingClient:
+    """
+    Returns the process-wide embedding client, so every index builder shares its rate limits.
+    """
+    global _embedding_client
+    with _embedding_client_lock:
+        if _embedding_client is None:
+            _embedding_client = EmbeddingClient()
+        return _embedding_client
+
+
+class ClientEmbedding(BaseEmbedding):
+    """
+    llama_index embedding model backed by an EmbeddingClient.
+
+    llama_index hands its queued texts over `embed_batch_size` at a time and waits for each handful before sending
+    the next, so the handful is made large enough for the client to keep `max_concurrency` requests busy.
+    """
+
+    def __init__(self, client: Optional[EmbeddingClient] = None):
+        self.client = client if client is not None else get_embedding_client()
+        super().__init__(embed_batch_size=self.client.config.batch_size * self.client.config.max_concurrency)
+
+    @property
+    def model_name(self) -> str:
+        return self.client.model_name
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return self.client.stats
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self.client.embed([query])[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self.client.embed([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self.client.embed(texts)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self.client.aembed([text]))[0]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await self.client.aembed(texts)
@@ -0,0 +1,607 @@
+import json
+import mmap
+import os
+import shutil
+import uuid
+from collections import defaultdict
+from collections.abc import MutableMapping
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+import faiss
+import numpy as np
+from llama_index import Document, GPTVectorStoreIndex
+from llama_index.data_structs.data_structs import IndexDict, Node
+from llama_index.docstore import DocumentStore
+from llama_index.token_counter.token_counter import llm_token_counter
+from llama_index.utils import get_new_id
+from llama_index.vector_stores.types import (
+    NodeEmbeddingResult,
+    VectorStore,
+    VectorStoreQueryResult,
+)
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+VECTOR_DTYPES = ("float32", "float16")
+
+# bump whenever the layout of a saved index directory changes
+PERSIST_VERSION = 1
+
+# extra_info keys that say where a document is rather than what it says: they stay on the nodes (and in query
+# results) but are left out of the embedded text, so a symbol that moved or a file indexed at a new commit embeds to
+# the same text as before and is served from the embedding cache
+LOCATION_INFO_KEYS = ("start_lineno", "end_lineno", "source")
+
+# rows of memory-mapped vectors scored at a time by exact search, to bound the temporary float32 copies
+_SCAN_BLOCK_ROWS = 65536
+
+
+@dataclass
+class FaissIndexConfig:
+    """
+    Which kind of FAISS index to build, and how to tune it.
+
+    Attributes:
+        index_type (str): "flat" for exact search, "ivf" or "hnsw" for approximate search that stays fast on large
+            indices.
+        ivf_nlist (int): The number of IVF clusters. IVF indices are searched exactly until they hold enough vectors
+            to train the clusters on (39 per cluster).
+        ivf_nprobe (int): The number of IVF clusters visited by each query.
+        hnsw_m (int): The number of neighbours of each HNSW node.
+        hnsw_ef_construction (int): The HNSW search depth when adding vectors.
+        hnsw_ef_search (int): The HNSW search depth when querying.
+        vector_dtype (str): "float32" or "float16", the precision of the saved embedding matrix.
+    """
+
+    index_type: str = "hnsw"
+    ivf_nlist: int = 256
+    ivf_nprobe: int = 16
+    hnsw_m: int = 32
+    hnsw_ef_construction: int = 80
+    hnsw_ef_search: int = 64
+    vector_dtype: str = "float32"
+
+    def __post_init__(self):
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown FAISS index type {self.index_type!r}, expected one of {INDEX_TYPES}")
+        if self.vector_dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unknown vector dtype {self.vector_dtype!r}, expected one of {VECTOR_DTYPES}")
+
+    @classmethod
+    def from_env(cls) -> "FaissIndexConfig":
+        """
+        Reads the config from BOOTSTRAP_FAISS_* environment variables (e.g. set in .env), e.g.
+        BOOTSTRAP_FAISS_INDEX_TYPE=ivf and BOOTSTRAP_FAISS_IVF_NPROBE=32.
+        """
+        config = cls()
+        for field, default in asdict(config).items():
+            value = os.environ.get(f"BOOTSTRAP_FAISS_{field.upper()}")
+            if value is not None:
+                setattr(config, field, type(default)(value))
+        config.__post_init__()
+        return config
+
+
+def _normalized(embeddings: List[List[float]]) -> np.ndarray:
+    # inner product of unit vectors is the cosine similarity the simple vector store ranks by
+    vectors = np.array(embeddings, dtype="float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def _rows_by_doc_id(row_doc_ids: np.ndarray) -> Dict[str, List[int]]:
+    rows = {}
+    for row, doc_id in enumerate(row_doc_ids.tolist()):
+        rows.setdefault(doc_id, []).append(row)
+    return rows
+
+
+class FaissStore(VectorStore):
+    """
+    Approximate nearest neighbour vector store backed by a FAISS index.
+
+    Unlike llama_index's FaissVectorStore it supports deleting documents, so indices built on it can be updated
+    incrementally: deleted vectors are excluded from searches straight away and dropped from the FAISS index the next
+    time the store is saved. The texts stay in the index struct, the store only maps FAISS ids to text ids.
+
+    A saved store is loaded read-only: the embedding matrix (vectors.npy) and the FAISS index are memory-mapped, so
+    loading is near-instant and the pages are shared by every process that queries the same index. The store is only
+    read into memory ("thawed") the first time vectors are added or deleted.
+    """
+
+    stores_text: bool = False
+
+    def __init__(self, config: Optional[FaissIndexConfig] = None):
+        self.config = config or FaissIndexConfig.from_env()
+        self._index = None
+        self._next_id = 0
+        self._text_ids: Dict[int, str] = {}
+        self._doc_ids: Dict[str, List[int]] = {}
+        self._deleted = set()
+        # set while the store is backed by the memory-mapped files of a saved store
+        self._path: Optional[Path] = None
+        self._vectors: Optional[np.ndarray] = None
+        self._row_doc_ids: Optional[np.ndarray] = None
+        self._ann = None
+        self._frozen_rows: Optional[Dict[str, List[int]]] = None
+
+    @property
+    def client(self) -> Any:
+        return self._ann if self._path is not None else self._index
+
+    @property
+    def config_dict(self) -> dict:
+        # the store is saved along with the rest of the index, see GPTFaissVectorIndex
+        return {}
+
+    @property
+    def vectors(self) -> Optional[np.ndarray]:
+        """
+        The read-only, memory-mapped embedding matrix of a loaded store (row i holds the vector with FAISS id i).
+        """
+        return self._vectors
+
+    def _new_index(self, dim: int, trained_on: Optional[np.ndarray] = None):
+        config = self.config
+        if config.index_type == "hnsw":
+            inner = faiss.IndexHNSWFlat(dim, config.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            inner.hnsw.efConstruction = config.hnsw_ef_construction
+        elif config.index_type == "ivf" and trained_on is not None and len(trained_on) >= 39 * config.ivf_nlist:
+            inner = faiss.IndexIVFFlat(faiss.IndexFlatIP(dim), dim, config.ivf_nlist, faiss.METRIC_INNER_PRODUCT)
+            inner.train(trained_on)
+            # lets the vectors be read back when the index is compacted or saved
+            inner.make_direct_map()
+        else:
+            inner = faiss.IndexFlatIP(dim)
+        return faiss.IndexIDMap2(inner)
+
+    def _is_ann(self) -> bool:
+        return self.config.index_type == "hnsw" or isinstance(faiss.downcast_index(self._index.index), faiss.IndexIVF)
+
+    def _compact(self):
+        # drops deleted vectors and renumbers the others so FAISS ids are 0..n-1 again, i.e. row numbers on disk
+        ids = faiss.vector_to_array(self._index.id_map)
+        vectors = self._index.index.reconstruct_n(0, self._index.ntotal)
+        keep = ~np.isin(ids, list(self._deleted))
+        ids, vectors = ids[keep], vectors[keep]
+        order = np.argsort(ids)
+        ids, vectors = ids[order], vectors[order]
+
+        new_ids = {old_id: new_id for new_id, old_id in enumerate(ids.tolist())}
+        self._text_ids = {new_ids[faiss_id]: text_id for faiss_id, text_id in self._text_ids.items()}
+        self._doc_ids = {
+            doc_id: [new_ids[faiss_id] for faiss_id in faiss_ids] for doc_id, faiss_ids in self._doc_ids.items()
+        }
+        self._next_id = len(new_ids)
+        self._deleted.clear()
+        self._index = self._new_index(vectors.shape[1], trained_on=vectors)
+        self._index.add_with_ids(vectors, np.arange(len(new_ids), dtype="int64"))
+
+    def _thaw(self):
+        if self._path is None:
+            return
+        count = len(self._row_doc_ids)
+        if self._ann is not None:
+            self._index = faiss.read_index(str(self._path / "faiss.index"))
+        elif count:
+            self._index = self._new_index(self._vectors.shape[1])
+            self._index.add_with_ids(np.ascontiguousarray(self._vectors, dtype="float32"), np.arange(count))
+        self._text_ids = {row: str(row) for row in range(count)}
+        self._doc_ids = _rows_by_doc_id(self._row_doc_ids)
+        self._next_id = count
+        self._path = self._vectors = self._row_doc_ids = self._ann = self._frozen_rows = None
+
+    def add(self, embedding_results: List[NodeEmbeddingResult]) -> List[str]:
+        if not embedding_results:
+            return []
+        self._thaw()
+        vectors = _normalized([result.embedding for result in embedding_results])
+        if self._index is None:
+            self._index = self._new_index(vectors.shape[1])
+
+        ids = np.arange(self._next_id, self._next_id + len(embedding_results), dtype="int64")
+        self._next_id += len(embedding_results)
+        self._index.add_with_ids(vectors, ids)
+        for faiss_id, result in zip(ids.tolist(), embedding_results):
+            self._text_ids[faiss_id] = result.id
+            self._doc_ids.setdefault(result.doc_id, []).append(faiss_id)
+
+        if not self._is_ann() and self.config.index_type == "ivf" and len(self._text_ids) >= 39 * self.config.ivf_nlist:
+            self._compact()
+        return [result.id for result in embedding_results]
+
+    def delete(self, doc_id: str, **delete_kwargs: Any) -> None:
+        self._thaw()
+        for faiss_id in self._doc_ids.pop(doc_id, []):
+            del self._text_ids[faiss_id]
+            self._deleted.add(faiss_id)
+
+    def _search_params(self, index, similarity_top_k: int):
+        inner = faiss.downcast_index(index.index)
+        if isinstance(inner, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(efSearch=max(self.config.hnsw_ef_search, similarity_top_k))
+        if isinstance(inner, faiss.IndexIVF):
+            return faiss.SearchParametersIVF(nprobe=self.config.ivf_nprobe)
+        return faiss.SearchParameters()
+
+    def _query_frozen(
+        self, query_vector: np.ndarray, similarity_top_k: int, doc_ids: Optional[List[str]]
+    ) -> VectorStoreQueryResult:
+        rows = None
+        if doc_ids is not None:
+            if self._frozen_rows is None:
+                self._frozen_rows = _rows_by_doc_id(self._row_doc_ids)
+            rows = np.array(
+                sorted(row for doc_id in doc_ids for row in self._frozen_rows.get(doc_id, [])), dtype="int64"
+            )
+
+        if self._ann is not None:
+            params = self._search_params(self._ann, similarity_top_k)
+            if rows is not None:
+                selector = faiss.IDSelectorBatch(rows)
+                params.sel = selector
+            similarities, found = self._ann.search(query_vector[np.newaxis, :], similarity_top_k, params=params)
+            hits = [(float(s), int(row)) for s, row in zip(similarities[0], found[0]) if row != -1]
+        else:
+            # exact search straight over the memory-mapped matrix, a block of rows at a time
+            candidates = self._vectors if rows is None else self._vectors[rows]
+            scores = np.concatenate(
+                [
+                    np.asarray(candidates[start : start + _SCAN_BLOCK_ROWS], dtype="float32") @ query_vector
+                    for start in range(0, len(candidates), _SCAN_BLOCK_ROWS)
+                ]
+            )
+            top = np.argsort(-scores)[:similarity_top_k]
+            hits = [(float(scores[i]), int(i if rows is None else rows[i])) for i in top]
+        return VectorStoreQueryResult(similarities=[s for s, _ in hits], ids=[str(row) for _, row in hits])
+
+    def query(
+        self,
+        query_embedding: List[float],
+        similarity_top_k: int,
+        doc_ids: Optional[List[str]] = None,
+        query_str: Optional[str] = None,
+    ) -> VectorStoreQueryResult:
+        query_vector = _normalized([query_embedding])[0]
+        if self._path is not None:
+            if not len(self._row_doc_ids):
+                return VectorStoreQueryResult(similarities=[], ids=[])
+            return self._query_frozen(query_vector, similarity_top_k, doc_ids)
+        if not self._text_ids:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+
+        # restrict the search with an id selector rather than over-fetching and filtering afterwards
+        if doc_ids is not None:
+            allowed = [faiss_id for doc_id in doc_ids for faiss_id in self._doc_ids.get(doc_id, [])]
+            selector = faiss.IDSelectorBatch(np.array(allowed, dtype="int64"))
+        elif self._deleted:
+            deleted = faiss.IDSelectorBatch(np.array(sorted(self._deleted), dtype="int64"))
+            selector = faiss.IDSelectorNot(deleted)
+        else:
+            selector = None
+
+        params = self._search_params(self._index, similarity_top_k)
+        if selector is not None:
+            params.sel = selector
+
+        similarities, faiss_ids = self._index.search(query_vector[np.newaxis, :], similarity_top_k, params=params)
+        # faiss pads the results with -1 when fewer than k vectors match
+        hits = [(float(s), int(i)) for s, i in zip(similarities[0], faiss_ids[0]) if i != -1]
+        return VectorStoreQueryResult(
+            similarities=[similarity for similarity, _ in hits],
+            ids=[self._text_ids[faiss_id] for _, faiss_id in hits],
+        )
+
+    def save(self, directory: Union[str, Path]) -> List[str]:
+        """
+        Writes the store into a directory, dropping any deleted vectors first:
+
+        - vectors.npy: the normalized embeddings, one row per FAISS id, as config.vector_dtype
+        - doc_ids.npy: the doc_id each row belongs to
+        - faiss.index: the IVF or HNSW index, if there is one (exact search reads vectors.npy)
+        - store.json: the config
+
+        Returns:
+            The text id of every row, in row order.
+        """
+        self._thaw()
+        directory = Path(directory)
+        if self._index is not None and (self._deleted or self._next_id != len(self._text_ids)):
+            self._compact()
+
+        count = len(self._text_ids)
+        if count:
+            vectors = self._index.index.reconstruct_n(0, count)
+        else:
+            vectors = np.zeros((0, 0), dtype="float32")
+        row_doc_ids = [None] * count
+        for doc_id, faiss_ids in self._doc_ids.items():
+            for faiss_id in faiss_ids:
+                row_doc_ids[faiss_id] = doc_id
+
+        np.save(directory / "vectors.npy", vectors.astype(self.config.vector_dtype))
+        np.save(directory / "doc_ids.npy", np.array(row_doc_ids, dtype=str))
+        has_ann = count > 0 and self._is_ann()
+        if has_ann:
+            faiss.write_index(self._index, str(directory / "faiss.index"))
+        with open(directory / "store.json", "w") as f:
+            json.dump({"config": asdict(self.config), "ann": has_ann}, f)
+        return [self._text_ids[row] for row in range(count)]
+
+    @classmethod
+    def load(cls, directory: Union[str, Path]) -> "FaissStore":
+        """
+        Opens a saved store read-only, memory-mapping its vectors and FAISS index instead of reading them.
+        """
+        directory = Path(directory)
+        with open(directory / "store.json", "r") as f:
+            metadata = json.load(f)
+        store = cls(FaissIndexConfig(**metadata["config"]))
+        store._path = directory
+        store._vectors = np.load(directory / "vectors.npy", mmap_mode="r")
+        store._row_doc_ids = np.load(directory / "doc_ids.npy", mmap_mode="r")
+        if metadata["ann"]:
+            store._ann = faiss.read_index(str(directory / "faiss.index"), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        return store
+
+
+class _NodeFile:
+    """
+    The nodes of a saved index, one JSON object per line, parsed only when they are looked up.
+    """
+
+    def __init__(self, directory: Path):
+        self._file = open(directory / "nodes.jsonl", "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._offsets = np.load(directory / "nodes.offsets.npy", mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, row: int) -> Node:
+        return Node.from_json(self._data[self._offsets[row] : self._offsets[row + 1]].decode("utf-8"))
+
+
+class _LazyNodesDict(MutableMapping):
+    """
+    int id -> Node mapping of a loaded index: saved rows are read from the node file on demand, changes are kept in
+    memory on top of it.
+    """
+
+    def __init__(self, node_file: _NodeFile):
+        self._node_file = node_file
+        self._added: Dict[int, Node] = {}
+        self._removed = set()
+
+    def _is_saved_row(self, key) -> bool:
+        return isinstance(key, int) and 0 <= key < len(self._node_file) and key not in self._removed
+
+    def __getitem__(self, key: int) -> Node:
+        if key in self._added:
+            return self._added[key]
+        if self._is_saved_row(key):
+            return self._node_file[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: int, node: Node):
+        self._added[key] = node
+
+    def __delitem__(self, key: int):
+        if key in self._added:
+            del self._added[key]
+        elif self._is_saved_row(key):
+            self._removed.add(key)
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        return key in self._added or self._is_saved_row(key)
+
+    def __iter__(self) -> Iterator[int]:
+        yield from (row for row in range(len(self._node_file)) if row not in self._removed)
+        yield from self._added
+
+    def __len__(self) -> int:
+        return len(self._node_file) - len(self._removed) + len(self._added)
+
+
+class _LazyIdMap(MutableMapping):
+    """
+    text id -> int id mapping of a loaded index, where saved row i has text id str(i) and int id i.
+    """
+
+    def __init__(self, row_count: int):
+        self._row_count = row_count
+        self._added: Dict[str, int] = {}
+        self._removed = set()
+
+    def _saved_row(self, text_id) -> Optional[int]:
+        if isinstance(text_id, str) and text_id.isdigit() and text_id not in self._removed:
+            row = int(text_id)
+            if row < self._row_count:
+                return row
+        return None
+
+    def __getitem__(self, text_id: str) -> int:
+        if text_id in self._added:
+            return self._added[text_id]
+        row = self._saved_row(text_id)
+        if row is None:
+            raise KeyError(text_id)
+        return row
+
+    def __setitem__(self, text_id: str, int_id: int):
+        self._added[text_id] = int_id
+
+    def __delitem__(self, text_id: str):
+        if text_id in self._added:
+            del self._added[text_id]
+        elif self._saved_row(text_id) is not None:
+            self._removed.add(text_id)
+        else:
+            raise KeyError(text_id)
+
+    def __contains__(self, text_id) -> bool:
+        return text_id in self._added or self._saved_row(text_id) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        yield from (str(row) for row in range(self._row_count) if str(row) not in self._removed)
+        yield from self._added
+
+    def __len__(self) -> int:
+        return self._row_count - len(self._removed) + len(self._added)
+
+
+class _LazyIndexDict(IndexDict):
+    """
+    The index struct of a loaded GPTFaissVectorIndex, whose nodes stay on disk until they are needed.
+    """
+
+    row_doc_ids: Any = None
+
+    def delete(self, doc_id: str) -> None:
+        # the doc_id of every saved row is known up front, so deleting does not parse every node
+        rows = np.flatnonzero(self.row_doc_ids == doc_id).tolist() if self.row_doc_ids is not None else []
+        for row in rows:
+            if row in self.nodes_dict:
+                del self.nodes_dict[row]
+                del self.id_map[str(row)]
+        added = [
+            (text_id, int_id)
+            for text_id, int_id in self.id_map._added.items()
+            if self.nodes_dict[int_id].ref_doc_id == doc_id
+        ]
+        for text_id, int_id in added:
+            del self.nodes_dict[int_id]
+            del self.id_map[text_id]
+
+
+def embedding_text(node: Node) -> str:
+    """
+    The text a node is embedded as: `node.get_text()` without the LOCATION_INFO_KEYS of its extra_info.
+    """
+    extra_info = {k: v for k, v in (node.extra_info or {}).items() if k not in LOCATION_INFO_KEYS}
+    return replace(node, extra_info=extra_info or None).get_text()
+
+
+class GPTFaissVectorIndex(GPTVectorStoreIndex):
+    """
+    A llama_index vector index whose embeddings live in a FaissStore instead of python lists, so queries stay fast
+    as the index grows. The index type is picked by FaissIndexConfig (BOOTSTRAP_FAISS_* environment variables).
+
+    Indices are saved as a directory of binary files instead of one JSON document: the store's memory-mapped vectors
+    and FAISS index, plus the nodes as JSON lines with a table of their byte offsets, so that loading only reads a
+    few small files and nodes are parsed when a query returns them.
+    """
+
+    def __init__(self, documents=None, index_struct=None, faiss_store: Optional[FaissStore] = None, **kwargs: Any):
+        self.faiss_store = faiss_store if faiss_store is not None else FaissStore()
+        super().__init__(documents=documents, index_struct=index_struct, vector_store=self.faiss_store, **kwargs)
+
+    @llm_token_counter("insert_batch")
+    def insert_batch(self, documents: Sequence[Document]) -> None:
+        """
+        Inserts several documents at once. `insert` makes one embedding request per document, this queues the nodes of
+        every document and embeds them in batches of the embedding model's `embed_batch_size`.
+        """
+        documents = self._process_documents(documents, self._docstore, self._index_registry)
+        self._validate_documents(documents)
+        pending = []
+        for document in documents:
+            for node in self._get_nodes_from_document(document):
+                text_id = str(uuid.uuid4())
+                if node.embedding is None:
+                    self._embed_model.queue_text_for_embeddding(text_id, embedding_text(node))
+                pending.append((text_id, node, document.get_doc_id()))
+        embeddings = dict(zip(*self._embed_model.get_queued_text_embeddings()))
+
+        results = [
+            NodeEmbeddingResult(text_id, node, embeddings.get(text_id, node.embedding), doc_id=doc_id)
+            for text_id, node, doc_id in pending
+        ]
+        for result, new_id in zip(results, self.faiss_store.add(results)):
+            self._index_struct.add_node(result.node, text_id=new_id)
+
+    def _queue_nodes(self, nodes: List[Node], existing_node_ids: Set) -> Tuple[Dict[str, Node], Dict[str, Any], list]:
+        # llama_index's id assignment, with the nodes queued as their `embedding_text`
+        id_to_node = {}
+        id_to_embedding = {}
+        text_queue = []
+        for node in nodes:
+            new_id = get_new_id(existing_node_ids.union(id_to_node.keys()))
+            if node.embedding is None:
+                text_queue.append((new_id, embedding_text(node)))
+            else:
+                id_to_embedding[new_id] = node.embedding
+            id_to_node[new_id] = node
+        return id_to_node, id_to_embedding, text_queue
+
+    def _get_node_embedding_results(
+        self, nodes: List[Node], existing_node_ids: Set, doc_id: str
+    ) -> List[NodeEmbeddingResult]:
+        id_to_node, id_to_embedding, text_queue = self._queue_nodes(nodes, existing_node_ids)
+        for new_id, text in text_queue:
+            self._embed_model.queue_text_for_embeddding(new_id, text)
+        id_to_embedding.update(zip(*self._embed_model.get_queued_text_embeddings()))
+        return [NodeEmbeddingResult(i, id_to_node[i], e, doc_id=doc_id) for i, e in id_to_embedding.items()]
+
+    async def _aget_node_embedding_results(
+        self, nodes: List[Node], existing_node_ids: Set, doc_id: str
+    ) -> List[NodeEmbeddingResult]:
+        id_to_node, id_to_embedding, text_queue = self._queue_nodes(nodes, existing_node_ids)
+        id_to_embedding.update(zip(*await self._embed_model.aget_queued_text_embeddings(text_queue)))
+        return [NodeEmbeddingResult(i, id_to_node[i], e, doc_id=doc_id) for i, e in id_to_embedding.items()]
+
+    def save_to_disk(self, save_path: str, **save_kwargs: Any) -> None:
+        save_path = Path(save_path)
+        tmp_path = save_path.with_name(save_path.name + ".tmp")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir(parents=True)
+
+        text_ids = self.faiss_store.save(tmp_path)
+        offsets = [0]
+        with open(tmp_path / "nodes.jsonl", "wb") as f:
+            for text_id in text_ids:
+                node = self._index_struct.nodes_dict[self._index_struct.id_map[text_id]]
+                offsets.append(offsets[-1] + f.write(node.to_json().encode("utf-8") + b"\n"))
+        np.save(tmp_path / "nodes.offsets.npy", np.array(offsets, dtype="int64"))
+        with open(tmp_path / "index.json", "w") as f:
+            json.dump(
+                {
+                    "version": PERSIST_VERSION,
+                    "index_struct_id": self._index_struct.get_doc_id(),
+                    "ref_doc_info": self._docstore.ref_doc_info,
+                },
+                f,
+            )
+
+        # swap the directories so readers never see a half-written index
+        old_path = save_path.with_name(save_path.name + ".old")
+        shutil.rmtree(old_path, ignore_errors=True)
+        if save_path.is_dir():
+            save_path.rename(old_path)
+        elif save_path.exists():
+            save_path.unlink()
+        tmp_path.rename(save_path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    @classmethod
+    def load_from_disk(cls, save_path: str, **kwargs: Any) -> "GPTFaissVectorIndex":
+        save_path = Path(save_path)
+        with open(save_path / "index.json", "r") as f:
+            metadata = json.load(f)
+        if metadata.get("version") != PERSIST_VERSION:
+            raise ValueError(f"{save_path} was saved in an unsupported format, it needs to be rebuilt")
+
+        faiss_store = FaissStore.load(save_path)
+        node_file = _NodeFile(save_path)
+        index_struct = _LazyIndexDict(
+            doc_id=metadata["index_struct_id"],
+            nodes_dict=_LazyNodesDict(node_file),
+            id_map=_LazyIdMap(len(node_file)),
+        )
+        index_struct.row_doc_ids = faiss_store._row_doc_ids
+        docstore = DocumentStore(ref_doc_info=defaultdict(dict, metadata["ref_doc_info"]))
+        return cls(index_struct=index_struct, docstore=docstore, faiss_store=faiss_store, **kwargs)
@@ -0,0 +1,224 @@
+import os
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple, Union
+
+# gitignore-style patterns that are never worth indexing, whatever the repo's .gitignore says
+DEFAULT_EXCLUDES = (
+    ".git/",
+    "__pycache__/",
+    ".ipynb_checkpoints/",
+    ".venv/",
+    "venv/",
+    "node_modules/",
+    ".mypy_cache/",
+    ".pytest_cache/",
+    ".ruff_cache/",
+    ".tox/",
+    ".nox/",
+    "*.egg-info/",
+)
+
+# (regex, negated, directory only)
+Rule = Tuple[re.Pattern, bool, bool]
+
+
+def _glob_to_regex(pattern: str) -> str:
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            regex += "/.*"
+            i += 3
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 1 :]:
+            end = pattern.index("]", i + 1)
+            char_class = pattern[i + 1 : end]
+            regex += "[" + ("^" + char_class[1:] if char_class.startswith("!") else char_class) + "]"
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return regex
+
+
+def parse_gitignore_patterns(lines: Iterable[str]) -> List[Rule]:
+    """
+    Compiles gitignore-style patterns into matching rules.
+
+    Parameters:
+        lines (Iterable[str]): The lines of a .gitignore file, or any other gitignore-style patterns.
+
+    Returns:
+        A list of (regex, negated, directory only) rules, in the order they should be evaluated.
+    """
+    rules = []
+    for line in lines:
+        line = line.rstrip("\n").rstrip()
+        if not line or line.startswith("#"):
+            continue
+        negated = line.startswith("!")
+        if negated:
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        # patterns with an inner or leading slash are relative to the .gitignore, others match at any depth
+        anchored = "/" in line
+        line = line.lstrip("/")
+        regex = _glob_to_regex(line)
+        if not anchored:
+            regex = "(?:.*/)?" + regex
+        rules.append((re.compile(regex + "$"), negated, dir_only))
+    return rules
+
+
+class _IgnoreRules:
+    """
+    The rules of the default excludes and of every .gitignore between the root and the current directory.
+    """
+
+    def __init__(self, layers: List[Tuple[str, List[Rule]]]):
+        self.layers = layers
+
+    def extended(self, base: str, rules: List[Rule]) -> "_IgnoreRules":
+        return _IgnoreRules(self.layers + [(base, rules)]) if rules else self
+
+    def is_ignored(self, rel_path: str, is_dir: bool) -> bool:
+        ignored = False
+        # deeper .gitignore files come later, so the last matching rule wins like in git
+        for base, rules in self.layers:
+            if base:
+                if not rel_path.startswith(base + "/"):
+                    continue
+                path = rel_path[len(base) + 1 :]
+            else:
+                path = rel_path
+            for regex, negated, dir_only in rules:
+                if dir_only and not is_dir:
+                    continue
+                if regex.match(path):
+                    ignored = not negated
+        return ignored
+
+
+# cache key -> (mtime_ns of every directory and .gitignore read during the walk, listing)
+_listing_cache: Dict[Tuple, Tuple[Dict[str, int], List[Path]]] = {}
+
+
+def _listing_is_fresh(mtimes: Dict[str, int]) -> bool:
+    for path, mtime_ns in mtimes.items():
+        try:
+            if os.stat(path).st_mtime_ns != mtime_ns:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def _walk(
+    root: str, extensions: Tuple[str, ...], exclude: Sequence[str], use_gitignore: bool
+) -> Tuple[Dict[str, int], List[Path]]:
+    mtimes = {}
+    files = []
+    base_rules = _IgnoreRules([("", parse_gitignore_patterns(exclude))])
+    stack = [("", base_rules)]
+    while stack:
+        rel_dir, rules = stack.pop()
+        abs_dir = os.path.join(root, rel_dir) if rel_dir else root
+        try:
+            mtimes[abs_dir] = os.stat(abs_dir).st_mtime_ns
+            entries = list(os.scandir(abs_dir))
+        except OSError:
+            continue
+
+        if use_gitignore:
+            gitignore_path = os.path.join(abs_dir, ".gitignore")
+            if os.path.isfile(gitignore_path):
+                mtimes[gitignore_path] = os.stat(gitignore_path).st_mtime_ns
+                with open(gitignore_path, "r", errors="ignore") as file:
+                    rules = rules.extended(rel_dir, parse_gitignore_patterns(file))
+
+        subdirs = []
+        for entry in entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                # prune ignored directories up front instead of filtering their files afterwards
+                if not rules.is_ignored(rel_path, is_dir=True):
+                    subdirs.append(rel_path)
+            elif entry.name.endswith(extensions) and not rules.is_ignored(rel_path, is_dir=False):
+                files.append(Path(root) / rel_path)
+        stack.extend((subdir, rules) for subdir in reversed(sorted(subdirs)))
+
+    files.sort()
+    return mtimes, files
+
+
+def enumerate_files(
+    root: Union[str, Path],
+    extensions: Sequence[str],
+    exclude: Sequence[str] = DEFAULT_EXCLUDES,
+    use_gitignore: bool = True,
+    cache: bool = True,
+) -> List[Path]:
+    """
+    Lists all the files under a root with any of the given extensions in a single walk of the tree.
+
+    Directories matched by `exclude` or by any .gitignore on the way down are pruned before they are walked.
+    Listings are cached and only recomputed once a directory or .gitignore under the root has been modified.
+
+    Parameters:
+        root (str or Path): The directory to search.
+        extensions (Sequence[str]): The file extensions to keep, e.g. [".py", ".toml"].
+        exclude (Sequence[str]): Gitignore-style patterns to leave out, relative to the root.
+        use_gitignore (bool): Whether to honour the .gitignore files found in the tree.
+        cache (bool): Whether to reuse (and store) the cached listing for these arguments.
+
+    Returns:
+        The sorted paths of the matching files.
+    """
+    root = os.path.abspath(root)
+    extensions = tuple(extensions)
+    key = (root, extensions, tuple(exclude), use_gitignore)
+    if cache:
+        cached = _listing_cache.get(key)
+        if cached is not None and _listing_is_fresh(cached[0]):
+            return list(cached[1])
+
+    mtimes, files = _walk(root, extensions, exclude, use_gitignore)
+    if cache:
+        _listing_cache[key] = (mtimes, files)
+    return list(files)
+
+
+def refresh_listing_mtimes(directory: Union[str, Path], previous_mtime_ns: int):
+    """
+    Records the current mtime of a directory in the cached listings that walked it when it still had
+    `previous_mtime_ns`, so those listings stay valid. Listings that recorded any other mtime were already stale and
+    are left to be recomputed.
+
+    Only for callers that know what changed in the directory since `previous_mtime_ns` (taken before the change) does
+    not change what a walk would find, e.g. replacing a file by renaming a temporary file over it.
+    """
+    directory = os.path.abspath(directory)
+    try:
+        mtime_ns = os.stat(directory).st_mtime_ns
+    except OSError:
+        return
+    for mtimes, _ in _listing_cache.values():
+        if mtimes.get(directory) == previous_mtime_ns:
+            mtimes[directory] = mtime_ns
+
+
+def clear_listing_cache():
+    """
+    Forgets all the cached listings.
+    """
+    _listing_cache.clear()
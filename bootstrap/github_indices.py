@@ -1,13 +1,40 @@
-import pathlib
+import itertools
+import json
+import os
+import shutil
 import subprocess
-import tempfile
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 
-from langchain.schema import Document as LangChainDocument
-from llama_index import Document, GPTSimpleVectorIndex
+import click
+from tqdm import tqdm
 
-from bootstrap import vectorstores_root
+from bootstrap import cache_root, vectorstores_root
 from bootstrap.auth import set_environment_vars
+from bootstrap.document_preprocessing import (
+    PreprocessingPolicy,
+    PreprocessingStats,
+    read_document,
+)
+from bootstrap.file_enumeration import enumerate_files
+
+if TYPE_CHECKING:
+    from llama_index import Document
+
+mirrors_root = cache_root / "mirrors"
 
 REPO_CONFIGS = (
     ("hwchase17", "langchain"),
@@ -15,58 +42,476 @@ REPO_CONFIGS = (
 )
 
 
-def create_llama_index(repo_owner, repo_name, savepath):
+# bump whenever the documents or the index format change, so the next refresh rebuilds the index from scratch
+MANIFEST_VERSION = 2
+DOC_EXTENSIONS = (".md", ".mdx", ".ipynb", ".py", ".rst")
+
+
+def _git(*args, cwd=None) -> str:
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout
+
+
+class RepoMirror:
+    """
+    A persistent clone of a repo under the cache, fetched on every refresh instead of cloned from scratch.
+    """
+
+    def __init__(self, repo_owner: str, repo_name: str, url: str = None, root: Union[str, Path] = None):
+        self.repo_owner = repo_owner
+        self.repo_name = repo_name
+        self.url = url or f"https://github.com/{repo_owner}/{repo_name}.git"
+        self.path = Path(root or mirrors_root) / f"{repo_owner}__{repo_name}"
+
+    @property
+    def head_sha(self) -> str:
+        return _git("rev-parse", "HEAD", cwd=self.path).strip()
+
+    def sync(self) -> str:
+        """
+        Clones the repo the first time, afterwards fetches the latest commit of its default branch and checks it out.
+
+        Returns:
+            The SHA of the checked out commit.
+        """
+        if not (self.path / ".git").exists():
+            # anything already there is a clone that did not finish
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            _git("clone", "--depth", "1", self.url, str(self.path))
+        else:
+            _git("fetch", "--depth", "1", "origin", "HEAD", cwd=self.path)
+            _git("reset", "--hard", "FETCH_HEAD", cwd=self.path)
+            _git("clean", "-fd", cwd=self.path)
+        return self.head_sha
+
+    def changed_files(self, since_sha: str) -> Optional[Dict[str, str]]:
+        """
+        Lists the files that differ between a previous commit and the checked out one.
+
+        Parameters:
+            since_sha (str): The commit to compare against, e.g. the last indexed one.
+
+        Returns:
+            A mapping of relative path to "A" (added), "M" (modified) or "D" (deleted), with renames split into a
+            deletion and an addition. None if the previous commit is no longer in the mirror.
+        """
+        try:
+            output = _git("diff", "--name-status", "--no-renames", "-z", since_sha, "HEAD", cwd=self.path)
+        except subprocess.CalledProcessError:
+            return None
+        fields = output.split("\0")[:-1]
+        # type changes (e.g. a file that became a symlink) are treated as modifications
+        return {path: "M" if status == "T" else status for status, path in zip(fields[::2], fields[1::2])}
+
+    def doc_files(self) -> List[str]:
+        """
+        Returns the relative paths of every file in the checkout that belongs in the index.
+        """
+        return [
+            Path(os.path.relpath(path, self.path)).as_posix()
+            for path in enumerate_files(self.path, DOC_EXTENSIONS, cache=False)
+        ]
+
+    def github_url(self, sha: str, rel_path: str) -> str:
+        return f"https://github.com/{self.repo_owner}/{self.repo_name}/blob/{sha}/{rel_path}"
+
+
+def iter_mirror_documents(
+    mirror: RepoMirror,
+    sha: str,
+    rel_paths: Iterable[str],
+    policy: PreprocessingPolicy = None,
+    stats: PreprocessingStats = None,
+) -> Iterator["Document"]:
+    """
+    Reads files of a mirror into documents whose doc_id is their relative path, so a changed file can replace its
+    previous document. Files are read one at a time as the documents are consumed, and preprocessed according to
+    `policy` (see `preprocess_document`), which can leave some of them out. The source URL names the commit, it is
+    kept out of the embedded text (see `faiss_store.LOCATION_INFO_KEYS`) so unchanged files embed the same at any
+    commit.
+    """
+    from llama_index import Document
+
+    if policy is None:
+        policy = PreprocessingPolicy()
+    for rel_path in rel_paths:
+        text = read_document(mirror.path / rel_path, rel_path, policy, stats)
+        if text is not None:
+            extra_info = {"file_name": rel_path, "source": mirror.github_url(sha, rel_path)}
+            yield Document(text=text, doc_id=rel_path, extra_info=extra_info)
+
+
+def batched(items: Iterable, batch_size: int) -> Iterator[List]:
+    iterator = iter(items)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        yield batch
+
+
+def manifest_path_for(savepath: Union[str, Path]) -> Path:
+    """
+    The manifest of the last indexed commit and files lives next to the index it describes.
+    """
+    return Path(f"{savepath}.manifest.json")
+
+
+def load_manifest(savepath: Union[str, Path]) -> Optional[Dict]:
+    """
+    Reads the manifest of a saved index, or returns None if it is missing or outdated.
+    """
+    try:
+        with open(manifest_path_for(savepath), "r") as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(savepath: Union[str, Path], sha: str, files: Iterable[str]):
+    manifest_path = manifest_path_for(savepath)
+    tmp_path = manifest_path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({"version": MANIFEST_VERSION, "sha": sha, "files": sorted(files)}, f, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+
+def plan_github_update(
+    changes: Dict[str, str], indexed_files: Set[str], doc_files: Set[str]
+) -> Tuple[List[str], List[str], Dict[str, int]]:
+    """
+    It turns a git diff into the edits of an index: deleted files are dropped and added or modified files are
+    re-embedded, while every other document keeps its stored vectors (and the source URL of the commit it was
+    indexed at).
+
+    :param changes: the changed files since the last indexed commit, see `RepoMirror.changed_files`
+    :param indexed_files: the files the index currently holds
+    :param doc_files: the files of the checkout that belong in the index
+    :return: the documents to delete, the files to embed, and counts of added, changed and deleted documents
+    """
+    stats = {"added": 0, "changed": 0, "deleted": 0}
+    to_delete = []
+    to_embed = []
+    for rel_path in sorted(changes):
+        # a changed file can also enter or leave the index because of its .gitignore
+        if rel_path in indexed_files:
+            to_delete.append(rel_path)
+            stats["changed" if rel_path in doc_files else "deleted"] += 1
+        elif rel_path in doc_files:
+            stats["added"] += 1
+        if rel_path in doc_files:
+            to_embed.append(rel_path)
+    return to_delete, to_embed, stats
+
+
+# the stages of refreshing an index, each of which can run for several repos at once
+STAGES = ("sync", "read", "embed", "save")
+
+# files read and embedded at a time, which bounds how much of a repo is held in memory
+DEFAULT_BATCH_SIZE = 64
+
+
+class RepoIngestion:
+    """
+    The refresh of one repo's index, split into stages so that an ingestion pipeline can overlap the stages of
+    different repos: while one repo is being embedded, the next one is already being fetched and read.
+
+    Files are read and embedded in batches of `batch_size`, and only the batch being embedded and the one being read
+    are in memory at any time, whatever the size of the repo.
+    """
+
+    def __init__(
+        self,
+        repo_owner: str,
+        repo_name: str,
+        savepath: Union[str, Path] = None,
+        url: str = None,
+        mirror_root: Union[str, Path] = None,
+        incremental: bool = True,
+        embed_model=None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        policy: PreprocessingPolicy = None,
+    ):
+        if savepath is None:
+            savepath = Path(vectorstores_root) / f"github:{repo_name}"
+        self.savepath = savepath
+        self.incremental = incremental
+        self.embed_model = embed_model
+        self.batch_size = batch_size
+        self.policy = policy if policy is not None else PreprocessingPolicy()
+        self.preprocessing = PreprocessingStats()
+        self.mirror = RepoMirror(repo_owner, repo_name, url=url, root=mirror_root)
+        self.stats = {"added": 0, "changed": 0, "deleted": 0}
+        self.sha = None
+        self.doc_files = []
+        # the files the index holds a document for, which leaves out those preprocessing skipped
+        self.indexed_files = set()
+        self.manifest = None
+        self.to_delete = []
+        self.to_embed = []
+        self.index = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.mirror.repo_owner}/{self.mirror.repo_name}"
+
+    @property
+    def up_to_date(self) -> bool:
+        # set once sync finds that nothing changed since the last indexed commit
+        return self.manifest is not None and self.sha == self.manifest["sha"]
+
+    def sync(self):
+        """
+        Fetches the repo and works out which files need to be embedded.
+        """
+        self.sha = self.mirror.sync()
+        self.doc_files = self.mirror.doc_files()
+        if self.incremental and Path(self.savepath).exists():
+            self.manifest = load_manifest(self.savepath)
+        changes = self.mirror.changed_files(self.manifest["sha"]) if self.manifest is not None else None
+        if changes is None:
+            self.manifest = None
+            self.to_embed = self.doc_files
+            self.stats["added"] = len(self.doc_files)
+        else:
+            self.to_delete, self.to_embed, self.stats = plan_github_update(
+                changes, set(self.manifest["files"]), set(self.doc_files)
+            )
+
+    def batches(self) -> Iterator[List[str]]:
+        return batched(self.to_embed, self.batch_size)
+
+    def open_index(self):
+        """
+        Starts a new index, or loads the saved one and drops the documents that are deleted or about to be replaced.
+        """
+        from bootstrap.embedding_cache import cached_embed_model
+        from bootstrap.faiss_store import GPTFaissVectorIndex
+
+        embed_model = self.embed_model if self.embed_model is not None else cached_embed_model()
+        if self.manifest is None:
+            self.index = GPTFaissVectorIndex([], embed_model=embed_model)
+            self.indexed_files = set()
+        else:
+            self.index = GPTFaissVectorIndex.load_from_disk(self.savepath, embed_model=embed_model)
+            for rel_path in self.to_delete:
+                self.index.delete(rel_path)
+            self.indexed_files = set(self.manifest["files"]) - set(self.to_delete)
+
+    def read(self, rel_paths: List[str]) -> List["Document"]:
+        return list(iter_mirror_documents(self.mirror, self.sha, rel_paths, self.policy, self.preprocessing))
+
+    def embed(self, documents: List["Document"]):
+        self.index.insert_batch(documents)
+        self.indexed_files.update(document.doc_id for document in documents)
+
+    def save(self):
+        Path(self.savepath).parent.mkdir(parents=True, exist_ok=True)
+        self.index.save_to_disk(self.savepath)
+        # only recorded once the index is saved, so an interrupted refresh is retried from the same commit
+        save_manifest(self.savepath, self.sha, self.indexed_files)
+        self.index = None
+
+
+def refresh_github_index(
+    repo_owner: str,
+    repo_name: str,
+    savepath: Union[str, Path] = None,
+    url: str = None,
+    mirror_root: Union[str, Path] = None,
+    incremental: bool = True,
+    embed_model=None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    progress: bool = False,
+) -> Dict[str, int]:
+    """
+    It brings the saved index of a repo up to date with the repo's latest commit. The repo is kept as a local mirror,
+    and when the index was built from an earlier commit only the files changed since then are re-embedded.
+
+    :param repo_owner: the owner of the GitHub repo
+    :param repo_name: the name of the GitHub repo
+    :param savepath: where the index is saved
+    :param url: where to clone the repo from, GitHub by default
+    :param mirror_root: the directory that holds the mirrors
+    :param incremental: when false, rebuild the index from every file of the repo
+    :param embed_model: the embedding model, OpenAI's behind the shared embedding cache by default
+    :param batch_size: how many files are read and embedded at a time
+    :param progress: show a progress bar of the embedded files
+    :return: counts of added, changed and deleted documents
+    """
+    ingestion = RepoIngestion(repo_owner, repo_name, savepath, url, mirror_root, incremental, embed_model, batch_size)
+    result = ingest_github_repos([ingestion], concurrency=1, progress=progress)[ingestion.name]
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+
+def ingest_github_repos(
+    ingestions: Sequence[RepoIngestion],
+    concurrency: int = 4,
+    stage_workers: Dict[str, int] = None,
+    progress: bool = True,
+) -> Dict[str, Union[Dict[str, int], BaseException]]:
+    """
+    It refreshes the indices of several repos concurrently. Every stage has its own bounded thread pool, and each
+    batch of files moves on to the next stage as soon as it is done with the previous one, so the stages of different
+    repos (and of consecutive batches of one repo) overlap and the total time approaches that of the slowest repo.
+
+    :param ingestions: the repos to refresh
+    :param concurrency: how many repos each stage works on at once
+    :param stage_workers: overrides of the pool size of individual stages, e.g. {"embed": 2} to stay below a rate
+        limit
+    :param progress: show a progress bar of the embedded files of every repo
+    :return: the stats of every repo by "owner/name", or the exception its refresh raised
+    """
     set_environment_vars()
-    sources = list(get_github_docs(repo_owner, repo_name))
-    docs = [Document.from_langchain_format(doc) for doc in sources]
-    index = GPTSimpleVectorIndex(docs)  #  not sure if this is the right index type, just a Simple way to start
+    workers = {stage: concurrency for stage in STAGES}
+    workers.update(stage_workers or {})
+    pools = {stage: ThreadPoolExecutor(max_workers=workers[stage], thread_name_prefix=stage) for stage in STAGES}
+
+    def run(ingestion: RepoIngestion, position: int) -> Dict[str, int]:
+        pools["sync"].submit(ingestion.sync).result()
+        if ingestion.up_to_date:
+            return ingestion.stats
+        pools["embed"].submit(ingestion.open_index).result()
+        with tqdm(
+            total=len(ingestion.to_embed), desc=ingestion.name, unit="file", position=position, disable=not progress
+        ) as progress_bar:
+            # the next batch is read while the previous one is embedded
+            embedding, batch_files = None, 0
+            for rel_paths in ingestion.batches():
+                documents = pools["read"].submit(ingestion.read, rel_paths).result()
+                if embedding is not None:
+                    embedding.result()
+                    progress_bar.update(batch_files)
+                embedding, batch_files = pools["embed"].submit(ingestion.embed, documents), len(rel_paths)
+            if embedding is not None:
+                embedding.result()
+                progress_bar.update(batch_files)
+        pools["save"].submit(ingestion.save).result()
+        return ingestion.stats
+
+    results = {}
+    try:
+        # the drivers only wait on the stage pools, which bound the actual work
+        with ThreadPoolExecutor(max_workers=max(len(ingestions), 1)) as drivers:
+            futures = {
+                ingestion.name: drivers.submit(run, ingestion, position)
+                for position, ingestion in enumerate(ingestions)
+            }
+            for repo, future in futures.items():
+                try:
+                    results[repo] = future.result()
+                except Exception as e:
+                    results[repo] = e
+    finally:
+        for pool in pools.values():
+            pool.shutdown()
+    return results
+
+
+def create_llama_index(repo_owner, repo_name, savepath, batch_size: int = DEFAULT_BATCH_SIZE):
     if savepath is None:
         savepath = Path(vectorstores_root) / f"github:{repo_name}"
+    stats = refresh_github_index(repo_owner, repo_name, savepath, batch_size=batch_size, progress=True)
+    print(f"{repo_owner}/{repo_name}: {stats}")
     print(savepath)
-    index.save_to_disk(savepath)
     return savepath
 
 
 def get_github_docs(repo_owner, repo_name):
+    from langchain.schema import Document as LangChainDocument
+
     # might be less good than https://llamahub.ai/l/github_repo but is more flexible
-    with tempfile.TemporaryDirectory() as d:
-        subprocess.check_call(
-            f"git clone --depth 1 https://github.com/{repo_owner}/{repo_name}.git .",
-            cwd=d,
-            shell=True,
-        )
-        git_sha = subprocess.check_output("git rev-parse HEAD", shell=True, cwd=d).decode("utf-8").strip()
-        repo_path = pathlib.Path(d)
-        doc_files = []
-        for extension in [
-            ".md",
-            ".mdx",
-            ".ipynb",
-            ".py",
-            ".rst",
-        ]:  # might make sense to split this into separate indices for source code vs docs?
-            doc_files.extend(list(repo_path.glob(f"**/*{extension}")))
-        for doc_file in doc_files:
-            with open(doc_file, "r") as f:
-                relative_path = doc_file.relative_to(repo_path)
-                github_url = f"https://github.com/{repo_owner}/{repo_name}/blob/{git_sha}/{relative_path}"
-                yield LangChainDocument(page_content=f.read(), metadata={"source": github_url})
-
-
-def save_github_indices():
-    for repo_owner, repo_name in REPO_CONFIGS:
-        savepath = Path(vectorstores_root) / f"github:{repo_name}"
-        create_llama_index(repo_owner, repo_name, savepath.as_posix())
+    mirror = RepoMirror(repo_owner, repo_name)
+    git_sha = mirror.sync()
+    # might make sense to split this into separate indices for source code vs docs?
+    for document in iter_mirror_documents(mirror, git_sha, mirror.doc_files()):
+        yield LangChainDocument(page_content=document.text, metadata=document.extra_info)
+
+
+def save_github_indices(
+    repo_configs: Sequence[Tuple[str, str]] = REPO_CONFIGS,
+    concurrency: int = 4,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    policy: PreprocessingPolicy = None,
+):
+    """
+    Refreshes the index of every repo in `repo_configs`, several repos at a time, and prints what changed and how
+    much preprocessing saved.
+
+    Returns:
+        True if every refresh succeeded.
+    """
+    ingestions = [
+        RepoIngestion(repo_owner, repo_name, batch_size=batch_size, policy=policy)
+        for repo_owner, repo_name in repo_configs
+    ]
+    results = ingest_github_repos(ingestions, concurrency=concurrency)
+    for ingestion in ingestions:
+        result = results[ingestion.name]
+        if isinstance(result, BaseException):
+            print(f"{ingestion.name}: {result!r}")
+        else:
+            print(f"{ingestion.name}: {result}, preprocessing: {ingestion.preprocessing.to_dict()}")
+    return not any(isinstance(result, BaseException) for result in results.values())
+
+
+def _load_github_index(repo_name):
+    from bootstrap.embedding_cache import cached_embed_model
+    from bootstrap.faiss_store import GPTFaissVectorIndex
+
+    set_environment_vars()
+    return GPTFaissVectorIndex.load_from_disk(
+        Path(vectorstores_root) / f"github:{repo_name}", embed_model=cached_embed_model()
+    )
 
 
 # dont love the magic paths
 def load_langchain_index():
-    return GPTSimpleVectorIndex.load_from_disk(Path(vectorstores_root) / "github:langchain")
+    return _load_github_index("langchain")
 
 
 def load_llama_index_index():
-    return GPTSimpleVectorIndex.load_from_disk(Path(vectorstores_root) / "github:llama_index")
+    return _load_github_index("llama_index")
+
+
+@click.command()
+@click.argument("repos", nargs=-1)
+@click.option("--concurrency", "-j", default=4, show_default=True, help="How many repos each stage works on at once.")
+@click.option(
+    "--batch-size",
+    default=DEFAULT_BATCH_SIZE,
+    show_default=True,
+    help="How many files are read and embedded at a time.",
+)
+@click.option(
+    "--max-file-bytes",
+    default=PreprocessingPolicy.max_file_bytes,
+    show_default=True,
+    help="Files larger than this (notebooks after dropping their outputs) are truncated or skipped.",
+)
+@click.option(
+    "--oversized",
+    type=click.Choice(["truncate", "skip"]),
+    default=PreprocessingPolicy.oversized,
+    show_default=True,
+    help="What to do with files larger than --max-file-bytes.",
+)
+def main(repos, concurrency, batch_size, max_file_bytes, oversized):
+    """
+    Refreshes the GitHub indices of REPOS, given as owner/name (by default the repos in REPO_CONFIGS).
+    """
+    repo_configs = []
+    for repo in repos:
+        repo_owner, _, repo_name = repo.partition("/")
+        if not repo_owner or not repo_name:
+            raise click.BadParameter(f"expected owner/name, got {repo!r}", param_hint="REPOS")
+        repo_configs.append((repo_owner, repo_name))
+    policy = PreprocessingPolicy(max_file_bytes=max_file_bytes, oversized=oversized)
+    if not save_github_indices(repo_configs or REPO_CONFIGS, concurrency, batch_size, policy):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
-    save_github_indices()  # This will parse arguments and execute the command.
+    main()  # This will parse arguments and execute the command.
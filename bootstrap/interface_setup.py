@@ -1,6 +1,5 @@
 from langchain import ConversationChain
 from langchain.chat_models import ChatOpenAI
-from langchain.memory import ConversationBufferMemory
 from langchain.prompts.chat import (
     ChatPromptTemplate,
     HumanMessagePromptTemplate,
@@ -8,24 +7,25 @@ from langchain.prompts.chat import (
 )
 
 from bootstrap.auth import set_environment_vars
-from bootstrap.base_prompts import system_prompt
-
-set_environment_vars()
+from bootstrap.base_prompts import DEFAULT_PROMPT_MODE, prompt_registry
+from bootstrap.completion_cache import CachedChatModel
+from bootstrap.conversation_memory import DEFAULT_MAX_HISTORY_TOKENS, TokenBudgetMemory
 
 
 def create_human_message_template():
     return HumanMessagePromptTemplate.from_template("{input}")
 
 
-def create_chat_prompt(human_message):
+def create_chat_prompt(human_message, mode=DEFAULT_PROMPT_MODE):
     return ChatPromptTemplate.from_messages(
-        [system_prompt, MessagesPlaceholder(variable_name="history"), human_message]
+        [prompt_registry.template(mode), MessagesPlaceholder(variable_name="history"), human_message]
     )
 
 
-def create_conversation_chain(chat_prompt):
+def create_conversation_chain(chat_prompt, max_history_tokens=DEFAULT_MAX_HISTORY_TOKENS):
+    set_environment_vars()
     return ConversationChain(
-        llm=ChatOpenAI(model_name="gpt-4-0314"),
+        llm=CachedChatModel(model=ChatOpenAI(model_name="gpt-4-0314")),
         prompt=chat_prompt,
-        memory=ConversationBufferMemory(return_messages=True),
+        memory=TokenBudgetMemory(return_messages=True, max_token_limit=max_history_tokens),
     )
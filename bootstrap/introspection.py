@@ -1,61 +1,178 @@
 import ast
 import json
+import mmap
 import os
-from typing import Dict, List, Union
-
-from langchain.agents import tool
+import tempfile
+import textwrap
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
 
 from bootstrap import repo_root
+from bootstrap.code_editing import (
+    EditorChain,
+    editor_request,
+    extract_code,
+    parse_patch,
+)
+from bootstrap.file_enumeration import enumerate_files
+from bootstrap.symbol_records import SymbolRecord
+
+# below this many modules, process pool startup costs more than parsing serially
+PARALLEL_MIN_MODULES = 200
+
+
+def module_qualname(rel_path: str) -> str:
+    """
+    Converts the relative path of a module to its dotted qualname, e.g. `bootstrap/auth.py` -> `bootstrap.auth`.
+
+    Parameters:
+        rel_path (str): The relative path of the module.
+
+    Returns:
+        The qualname of the module.
+    """
+    return rel_path.replace(os.path.sep, ".").replace(".py", "")
+
+
+def get_line_offsets(source: str) -> List[int]:
+    """
+    Computes the byte offset at which each line of a module starts, so definitions can be addressed by byte span.
+
+    Parameters:
+        source (str): The source code of the module.
+
+    Returns:
+        A list whose i-th item is the byte offset of line i + 1 in the utf-8 encoded source, followed by one past the
+        end of the source.
+    """
+    offsets = [0]
+    for line in source.encode("utf-8").split(b"\n"):
+        offsets.append(offsets[-1] + len(line) + 1)
+    return offsets
+
+
+def get_byte_span(line_offsets: List[int], start_lineno: int, end_lineno: int) -> Tuple[int, int]:
+    """
+    Converts an inclusive range of line numbers to a byte span, from the start of the first line to the end of the last
+    line (excluding its newline).
+    """
+    return line_offsets[start_lineno - 1], line_offsets[end_lineno] - 1
 
 
-def get_full_definition(source: str, start_lineno: int, end_lineno: int) -> str:
+def decode_module_source(data: bytes) -> str:
     """
-    Extracts the full definition of a code block from a given source code.
+    Decodes the raw bytes of a module as utf-8, keeping its line endings, so the byte spans of its records match the
+    file on disk (see `read_source_span`). Modules that are not valid utf-8 decode to an empty source.
+    """
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return ""
+
+
+def read_source_span(path: Union[str, os.PathLike], start_byte: int, end_byte: int) -> str:
+    """
+    Reads the full definition of a code block from a module, given its byte span.
+
+    The module is memory-mapped, so only the pages holding the definition are actually read.
 
     Parameters:
-        source (str): The source code to extract the full definition from.
-        start_lineno (int): The starting line number of the code block to extract.
-        end_lineno (int): The ending line number of the code block to extract.
+        path (str or PathLike): The path of the module.
+        start_byte (int): The byte offset at which the code block starts.
+        end_byte (int): The byte offset at which the code block ends.
+
+    Returns:
+        The full definition of the code block as a string, dedented if the block is nested in a class or function.
+    """
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return textwrap.dedent(mapped[start_byte:end_byte].decode("utf-8")).strip()
+
+
+def get_full_definition(item: SymbolRecord, root: Union[str, os.PathLike] = repo_root) -> str:
+    """
+    Loads the full definition of an extracted function, class or method from its module.
+
+    Parameters:
+        item (SymbolRecord): The record of the function, class or method, as built by `process_nodes`.
+        root (str or PathLike): The root that the record's path is relative to.
 
     Returns:
         The full definition of the code block as a string.
     """
-    source_lines = source.split("\n")
-    full_definition_lines = source_lines[start_lineno - 1 : end_lineno]
-    return "\n".join(full_definition_lines).strip()
+    return read_source_span(os.path.join(root, item.path), item.start_byte, item.end_byte)
+
+
+def _iter_nested_definitions(statements: List[ast.stmt]):
+    # definitions can hide inside if/for/while/with/try blocks, but not inside other definitions' bodies
+    for statement in statements:
+        if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            yield statement
+            continue
+        for field in ("body", "orelse", "finalbody", "handlers"):
+            yield from _iter_nested_definitions(getattr(statement, field, []))
+
+
+def extract_nested_info(node: ast.AST, line_offsets: List[int], rel_path: str, qualname: str) -> List[SymbolRecord]:
+    """
+    Extracts information about the functions and classes defined inside a function or method body.
+
+    Parameters:
+        node (ast.AST): The function or method node whose body to search.
+        line_offsets (List[int]): The line offsets of the module containing the node.
+        rel_path (str): The relative path of the module containing the node.
+        qualname (str): The qualname of the enclosing function or method.
+
+    Returns:
+        A list of SymbolRecords for the nested functions and classes.
+    """
+    nested = []
+    for child in _iter_nested_definitions(node.body):
+        if isinstance(child, ast.ClassDef):
+            nested.append(extract_class_info(child, line_offsets, rel_path, parent_qualname=qualname))
+        else:
+            nested.append(extract_function_info(child, line_offsets, rel_path, parent_qualname=qualname))
+    return nested
+
+
+def _decorated_lineno(node: Union[ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef]) -> int:
+    return min([decorator.lineno for decorator in node.decorator_list], default=node.lineno)
 
 
 def extract_function_info(
-    node: Union[ast.FunctionDef, ast.AsyncFunctionDef], source: str, rel_path: str
-) -> Dict[str, Union[str, List[Dict[str, Union[str, int]]], None]]:
+    node: Union[ast.FunctionDef, ast.AsyncFunctionDef],
+    line_offsets: List[int],
+    rel_path: str,
+    parent_qualname: str = None,
+) -> SymbolRecord:
     """
     Extracts information about a given function or async function node.
 
     Parameters:
         node (ast.FunctionDef or ast.AsyncFunctionDef): The function or async function node to extract information from.
-        source (str): The source code of the module containing the function node.
+        line_offsets (List[int]): The line offsets of the module containing the function node.
         rel_path (str): The relative path of the module containing the function node.
+        parent_qualname (str): The qualname of the enclosing function, if the function is nested.
 
     Returns:
-        A dictionary containing the extracted information.
+        A SymbolRecord containing the extracted information.
     """
     # Extract function signature
     args = [arg.arg for arg in node.args.args]
     vararg = node.args.vararg.arg if node.args.vararg else None
     kwarg = node.args.kwarg.arg if node.args.kwarg else None
-    defaults = [ast.literal_eval(default) for default in node.args.defaults] if node.args.defaults else []
+    # unparse rather than literal_eval so defaults like `x=SOME_CONSTANT` don't break extraction
+    defaults = [ast.unparse(default) for default in node.args.defaults] if node.args.defaults else []
     signature = f"{node.name}({', '.join(args)}"
     if vararg:
         signature += f", *{vararg}"
     if kwarg:
         signature += f", **{kwarg}"
     if defaults:
-        defaults_str = [repr(default) for default in defaults]
-        signature += f", {', '.join(defaults_str)}"
+        signature += f", {', '.join(defaults)}"
     signature += ")"
 
     # get fully qualified name
-    qualname = f"{rel_path.replace(os.path.sep, '.').replace('.py', '')}.{node.name}"
+    qualname = f"{parent_qualname or module_qualname(rel_path)}.{node.name}"
 
     # Extract function docstring and return annotation
     docstring = ast.get_docstring(node)
@@ -64,34 +181,39 @@ def extract_function_info(
     start_lineno = node.lineno
     end_lineno = node.end_lineno
 
-    # Extract the full function definition
-    full_definition = get_full_definition(source, start_lineno, end_lineno)
-
-    return {
-        "name": node.name,
-        "qualname": qualname,
-        "type": "function",
-        "path": rel_path,
-        "signature": signature,
-        "docstring": docstring,
-        "start_lineno": start_lineno,
-        "end_lineno": end_lineno,
-        "full_definition": full_definition,
-    }
+    # Locate the full function definition, which is only read from the module when needed
+    start_byte, end_byte = get_byte_span(line_offsets, start_lineno, end_lineno)
+
+    return SymbolRecord(
+        "function",
+        node.name,
+        qualname=qualname,
+        path=rel_path,
+        signature=signature,
+        docstring=docstring,
+        start_lineno=start_lineno,
+        end_lineno=end_lineno,
+        start_byte=start_byte,
+        end_byte=end_byte,
+        body=tuple(extract_nested_info(node, line_offsets, rel_path, qualname)),
+        decorated_lineno=_decorated_lineno(node),
+    )
 
 
 def extract_method_info(
-    node: Union[ast.FunctionDef, ast.AsyncFunctionDef], source: str
-) -> Dict[str, Union[str, int, None]]:
+    node: Union[ast.FunctionDef, ast.AsyncFunctionDef], line_offsets: List[int], rel_path: str, class_qualname: str
+) -> SymbolRecord:
     """
     Extracts information about a given method node.
 
     Parameters:
         node (ast.FunctionDef or ast.AsyncFunctionDef): The method node to extract information from.
-        source (str): The source code of the module containing the method node.
+        line_offsets (List[int]): The line offsets of the module containing the method node.
+        rel_path (str): The relative path of the module containing the method node.
+        class_qualname (str): The qualname of the class the method belongs to.
 
     Returns:
-        A dictionary containing the extracted information.
+        A SymbolRecord containing the extracted information.
     """
     # Extract method signature
     signature = f"{node.name}({', '.join([arg.arg for arg in node.args.args])})"
@@ -102,42 +224,64 @@ def extract_method_info(
     start_lineno = node.lineno
     end_lineno = node.end_lineno
 
-    # Extract the full method definition
-    full_definition = get_full_definition(source, start_lineno, end_lineno)
-
-    return {
-        "type": "method",
-        "name": node.name,
-        "signature": signature,
-        "docstring": docstring,
-        "start_lineno": start_lineno,
-        "end_lineno": end_lineno,
-        "full_definition": full_definition,
-    }
+    # Locate the full method definition
+    start_byte, end_byte = get_byte_span(line_offsets, start_lineno, end_lineno)
+
+    qualname = f"{class_qualname}.{node.name}"
+
+    return SymbolRecord(
+        "method",
+        node.name,
+        qualname=qualname,
+        path=rel_path,
+        signature=signature,
+        docstring=docstring,
+        start_lineno=start_lineno,
+        end_lineno=end_lineno,
+        start_byte=start_byte,
+        end_byte=end_byte,
+        body=tuple(extract_nested_info(node, line_offsets, rel_path, qualname)),
+        decorated_lineno=_decorated_lineno(node),
+    )
 
 
 def extract_class_info(
-    node: ast.ClassDef, source: str, rel_path: str
-) -> Dict[str, Union[str, List[Dict[str, Union[str, int, None]]]]]:
+    node: ast.ClassDef, line_offsets: List[int], rel_path: str, parent_qualname: str = None
+) -> SymbolRecord:
     """
     Extracts information about a given class node.Parameters:
         node (ast.ClassDef): The class node to extract information from.
-        source (str): The source code of the module containing the class node.
+        line_offsets (List[int]): The line offsets of the module containing the class node.
         rel_path (str): The relative path of the module containing the class node.
+        parent_qualname (str): The qualname of the enclosing class or function, if the class is nested.
 
     Returns:
-        A dictionary containing the extracted information.
+        A SymbolRecord containing the extracted information.
     """
+    # get fully qualified name
+    qualname = f"{parent_qualname or module_qualname(rel_path)}.{node.name}"
+
     class_body = []
 
     # Process each class node in the class body
     for class_node in node.body:
         if isinstance(class_node, (ast.FunctionDef, ast.AsyncFunctionDef)):
-            class_body.append(extract_method_info(class_node, source))
-        elif isinstance(class_node, ast.Assign):
-            class_body.append({"type": "assignment", "name": class_node.targets[0].id, "lineno": class_node.lineno})
-        elif isinstance(class_node, ast.Expr):
-            class_body.append({"type": "expression", "value": ast.dump(class_node.value), "lineno": class_node.lineno})
+            class_body.append(extract_method_info(class_node, line_offsets, rel_path, qualname))
+        elif isinstance(class_node, ast.ClassDef):
+            class_body.append(extract_class_info(class_node, line_offsets, rel_path, parent_qualname=qualname))
+        elif isinstance(class_node, (ast.Assign, ast.AnnAssign)):
+            targets = class_node.targets if isinstance(class_node, ast.Assign) else [class_node.target]
+            for target in targets:
+                if isinstance(target, ast.Name):
+                    class_body.append(
+                        SymbolRecord(
+                            "assignment",
+                            target.id,
+                            path=rel_path,
+                            start_lineno=class_node.lineno,
+                            end_lineno=class_node.end_lineno,
+                        )
+                    )
 
     # Extract class docstring, signature, and start and end line numbers
     docstring = ast.get_docstring(node)
@@ -145,29 +289,26 @@ def extract_class_info(
     start_lineno = node.lineno
     end_lineno = node.end_lineno
 
-    # Extract the full class definition
-    full_definition = get_full_definition(source, start_lineno, end_lineno)
-
-    # get fully qualified name
-    qualname = f"{rel_path.replace(os.path.sep, '.').replace('.py', '')}.{node.name}"
-
-    return {
-        "name": node.name,
-        "qualname": qualname,
-        "type": "class",
-        "path": rel_path,
-        "signature": signature,
-        "docstring": docstring,
-        "body": class_body,
-        "start_lineno": start_lineno,
-        "end_lineno": end_lineno,
-        "full_definition": full_definition,
-    }
-
-
-def process_nodes(
-    module_ast: ast.Module, source: str, rel_path: str
-) -> List[Dict[str, Union[str, List[Dict[str, Union[str, int, None]]]]]]:
+    # Locate the full class definition
+    start_byte, end_byte = get_byte_span(line_offsets, start_lineno, end_lineno)
+
+    return SymbolRecord(
+        "class",
+        node.name,
+        qualname=qualname,
+        path=rel_path,
+        signature=signature,
+        docstring=docstring,
+        start_lineno=start_lineno,
+        end_lineno=end_lineno,
+        start_byte=start_byte,
+        end_byte=end_byte,
+        body=tuple(class_body),
+        decorated_lineno=_decorated_lineno(node),
+    )
+
+
+def process_nodes(module_ast: ast.Module, source: str, rel_path: str) -> List[SymbolRecord]:
     """
     Processes all nodes in a given module AST.Parameters:
         module_ast (ast.Module): The module AST to process.
@@ -175,72 +316,137 @@ def process_nodes(
         rel_path (str): The relative path of the module.
 
     Returns:
-        A list of dictionaries containing the extracted information for all functions and classes in the module.
+        A list of SymbolRecords for all functions and classes in the module.
     """
     result = []
+    # Computed once per module, the records only keep byte spans into the source
+    line_offsets = get_line_offsets(source)
 
     # Process each node in the module AST
     for node in module_ast.body:
         if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
-            result.append(extract_function_info(node, source, rel_path))
+            result.append(extract_function_info(node, line_offsets, rel_path))
         elif isinstance(node, ast.ClassDef):
-            result.append(extract_class_info(node, source, rel_path))
+            result.append(extract_class_info(node, line_offsets, rel_path))
 
     return result
 
 
-def extract_functions_and_classes(path: str) -> List[Dict[str, Union[str, List[Dict[str, Union[str, int, None]]]]]]:
+def parse_module_source(source: str, rel_path: str) -> Union[List[SymbolRecord], None]:
+    """
+    Parses the source code of a single module and extracts its functions and classes.
+
+    Parameters:
+        source (str): The source code of the module.
+        rel_path (str): The relative path of the module.
+
+    Returns:
+        A list of SymbolRecords for the functions and classes in the module, or None if the module has syntax errors.
+    """
+    try:
+        module_ast = ast.parse(source)
+    except SyntaxError:
+        return None
+    return process_nodes(module_ast, source, rel_path)
+
+
+def _parse_module_source_item(item: Tuple[str, str]):
+    return parse_module_source(*item)
+
+
+def parse_module_sources(
+    items: Sequence[Tuple[str, str]], workers: int = None
+) -> List[Union[List[SymbolRecord], None]]:
+    """
+    Parses many modules, fanning the work out across a process pool when there are enough of them.
+
+    Parameters:
+        items (Sequence[Tuple[str, str]]): (source, rel_path) pairs of the modules to parse.
+        workers (int): The number of worker processes. None uses one per CPU and 1 forces serial parsing.
+
+    Returns:
+        The results of `parse_module_source` for each module, in the same order as `items`.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(items) < PARALLEL_MIN_MODULES:
+        return [parse_module_source(source, rel_path) for source, rel_path in items]
+
+    # a few chunks per worker keeps the pool busy without paying IPC overhead for every module
+    chunksize = max(1, len(items) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_parse_module_source_item, items, chunksize=chunksize))
+
+
+def extract_functions_and_classes(path: str, workers: int = None) -> List[SymbolRecord]:
     """
     Extracts information about all the functions and classes in a given path.Parameters:
         path (str): The path to the directory to search for Python modules.
+        workers (int): The number of processes to parse modules with. None uses one per CPU and 1 forces serial parsing.
 
     Returns:
-        A list of dictionaries representing the functions and classes found in the modules.
+        A list of SymbolRecords representing the functions and classes found in the modules.
     """
-    functions_and_classes = []
+    items = []
 
-    # Recursively search for Python modules in the given directory
-    for root, dirs, files in os.walk(path):
-        for filename in files:
-            if filename.endswith(".py"):
-                file_path = os.path.join(root, filename)
+    # Recursively search for Python modules in the given directory, skipping ignored ones
+    for file_path in enumerate_files(path, [".py"]):
+        with open(file_path, "rb") as file:
+            source = decode_module_source(file.read())
 
-                with open(file_path, "r") as file:
-                    source = file.read()
+        items.append((source, os.path.relpath(file_path, path)))
 
-                try:
-                    module_ast = ast.parse(source)
-                except SyntaxError:
-                    # Ignore modules with syntax errors
-                    continue
-
-                # Extract information about all functions and classes in the module
-                rel_path = os.path.relpath(file_path, path)
-                functions_and_classes.extend(process_nodes(module_ast, source, rel_path))
+    functions_and_classes = []
+    # Extract information about all functions and classes in the modules
+    for module_info in parse_module_sources(items, workers=workers):
+        if module_info is None:
+            # Ignore modules with syntax errors
+            continue
+        functions_and_classes.extend(module_info)
 
     return functions_and_classes
 
 
-def get_current_repo_functions_and_classes(
-    *args, **kwargs
-) -> List[Dict[str, Union[str, List[Dict[str, Union[str, int, None]]]]]]:
+def get_current_repo_functions_and_classes(*args, **kwargs) -> List[SymbolRecord]:
     """
     Extracts information about all the functions and classes in the current repo.
 
     Returns:
-        A list of dictionaries representing the functions and classes found in the repo modules.
+        A list of SymbolRecords representing the functions and classes found in the repo modules.
+    """
+    return get_current_repo_symbol_index().symbols()
+
+
+def get_current_repo_symbol_index(refresh: bool = True):
+    """
+    Returns the persistent symbol index of the current repo, re-parsing only the modules that changed since the
+    last call (or the last process that used the on-disk cache) unless `refresh` is False.
     """
-    return extract_functions_and_classes(repo_root)
+    # imported here because the symbol index is built on top of the extractors in this module
+    from bootstrap.symbol_index import get_symbol_index
+
+    return get_symbol_index(repo_root, refresh=refresh)
 
 
-@tool("get_current_repo_definitions_summary")
 def get_current_repo_definitions_summary(*args, **kwargs):
     """
-    Extracts names of all the functions and classes in the current repo. This tool takes no inputs.
+    Extracts names of all the functions, classes and methods in the current repo. This tool takes no inputs.
+    """
+    return [
+        {"qualname": item.qualname, "type": item.kind, "signature": item.signature, "docstring": item.docstring}
+        for item in get_current_repo_symbol_table()
+    ]
+
+
+def get_current_repo_symbol_table():
+    """
+    Returns the up to date symbol table of the current repo, for constant time lookups by qualname, module or prefix.
     """
-    info = get_current_repo_functions_and_classes()
-    keep_keys = ["qualname", "type", "signature", "docstring"]
-    return [{k: v for k, v in item.items() if k in keep_keys} for item in info]
+    return get_current_repo_symbol_index().table
+
+
+def _read_module_source(rel_path: str) -> str:
+    with open(os.path.join(repo_root, rel_path), "r") as file:
+        return file.read()
 
 
 def _get_parent_module_source_code(function_qualname: str) -> Union[str, None]:
@@ -253,42 +459,38 @@ def _get_parent_module_source_code(function_qualname: str) -> Union[str, None]:
     Returns:
         The source code of the parent module if found, otherwise None.
     """
-    functions_and_classes = get_current_repo_functions_and_classes()
-    for item in functions_and_classes:
-        if item["qualname"] == function_qualname:
-            rel_path = item.get("path", None)
-            if rel_path:
-                with open(os.path.join(repo_root, rel_path), "r") as file:
-                    source = file.read()
-                return source
-    return None
+    item = get_current_repo_symbol_table().get(function_qualname)
+    if item is None or not item.path:
+        return None
+    return _read_module_source(item.path)
 
 
 def _get_source_code(qualname: str) -> Union[str, None]:
     """
-    Given a function or class qualname, returns its source code.
+    Given a function, class or method qualname, returns its source code.
 
     Parameters:
-        qualname (str): The qualname of the function or class.
+        qualname (str): The qualname of the function, class or method.
 
     Returns:
-        The source code of the function or class if found, otherwise None.
+        The source code of the function, class or method if found, otherwise None.
     """
-    functions_and_classes = get_current_repo_functions_and_classes()
-
-    for item in functions_and_classes:
-        if item["qualname"] == qualname:
-            return item.get("full_definition", None)
-
-    all_qualnames = [item["qualname"] for item in functions_and_classes]
+    table = get_current_repo_symbol_table()
+    item = table.get(qualname)
+    if item is not None:
+        return get_full_definition(item)
+
+    # narrow the hint down to the module the agent was looking at if we can
+    candidates = table.with_prefix(qualname.rsplit(".", 1)[0] + ".") or table
+    all_qualnames = [item.qualname for item in candidates]
     return f"Could not find source code. Valid qualnames are: {all_qualnames}"
 
 
-@tool("get_source_code")
 def get_source_code(input: str):
     """
-    Given a function or class qualname, returns its source code. The input to this tool should be formatted as follows:
-    {'qualname': '<qualname of the function or class>'}
+    Given a function, class or method qualname, returns its source code. The input to this tool should be formatted as follows:
+    {'qualname': '<qualname of the function, class or method>'}
+    Methods and nested functions or classes can be fetched on their own, e.g. with the qualname `module.Class.method`.
     """
     try:
         parsed_inputs = json.loads(input)
@@ -297,64 +499,241 @@ def get_source_code(input: str):
     return _get_source_code(**parsed_inputs)
 
 
-def _edit_source_code(qualname: str, new_code: str) -> bool:
-    """
-    Replaces the source code of a function or class with new code and saves the module.
+def _replace_lines(source_lines: List[str], item: SymbolRecord, new_code: str) -> List[str]:
+    # nested symbols are fetched dedented, so put the new code back at the original indentation
+    first_line = source_lines[item.start_lineno - 1]
+    indentation = first_line[: len(first_line) - len(first_line.lstrip())]
+    new_code = textwrap.indent(textwrap.dedent(new_code), indentation)
+    return source_lines[: item.start_lineno - 1] + new_code.split("\n") + source_lines[item.end_lineno :]
 
-    Parameters:
-        qualname (str): The qualname of the function or class.
-        new_code (str): The new code to replace the original code.
+
+def _write_atomically(path: str, text: str) -> str:
+    """
+    Writes text next to `path` in a temporary file with the same permissions, to be renamed over it.
 
     Returns:
-        True if the source code was successfully updated, otherwise False.
+        The path of the temporary file.
     """
-    functions_and_classes = get_current_repo_functions_and_classes()
-    parent_module_source = _get_parent_module_source_code(qualname)
-    if parent_module_source is None:
-        return False
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as file:
+            file.write(text)
+        if os.path.exists(path):
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return tmp_path
 
-    function_info = None
-    for item in functions_and_classes:
-        if item["qualname"] == qualname:
-            function_info = item
-            break
 
-    if function_info is None:
-        return False
+def _edit_source_code_batch(edits: Sequence[Tuple[str, str]]) -> bool:
+    """
+    Replaces the source code of many functions, classes or methods at once, as a single transaction.
 
-    start_lineno = function_info.get("start_lineno", None)
-    end_lineno = function_info.get("end_lineno", None)
-    rel_path = function_info.get("path", None)
+    All spans are resolved from one snapshot of the symbol table and applied bottom-up within each module, so earlier
+    edits never shift the lines of later ones. Each edited module is validated with a single `ast.parse` and written
+    atomically (temporary file + rename). If any edit cannot be applied, no module is modified.
 
-    if start_lineno and end_lineno and rel_path:
-        source_lines = parent_module_source.split("\n")
-        updated_source_lines = source_lines[: start_lineno - 1] + new_code.split("\n") + source_lines[end_lineno:]
-        updated_source = "\n".join(updated_source_lines)
+    Parameters:
+        edits (Sequence[Tuple[str, str]]): (qualname, new_code) pairs.
 
+    Returns:
+        True if every edit was applied, otherwise False.
+    """
+    table = get_current_repo_symbol_table()
+    edits_by_path: Dict[str, List[Tuple[SymbolRecord, str]]] = {}
+    for qualname, new_code in edits:
+        item = table.get(qualname)
+        if item is None or not (item.start_lineno and item.end_lineno and item.path):
+            return False
+        edits_by_path.setdefault(item.path, []).append((item, new_code))
+
+    updated_sources = {}
+    for rel_path, module_edits in edits_by_path.items():
+        module_edits.sort(key=lambda edit: edit[0].start_lineno, reverse=True)
+        # overlapping edits (e.g. a class and one of its methods) cannot both be applied
+        for (below, _), (above, _) in zip(module_edits, module_edits[1:]):
+            if above.end_lineno >= below.start_lineno:
+                return False
+
+        source_lines = _read_module_source(rel_path).split("\n")
+        for item, new_code in module_edits:
+            source_lines = _replace_lines(source_lines, item, new_code)
+        updated_source = "\n".join(source_lines)
         try:
             ast.parse(updated_source)
-            with open(os.path.join(repo_root, rel_path), "w") as file:
-                file.write(updated_source)
-            return True
         except SyntaxError:
             return False
+        updated_sources[rel_path] = updated_source
+
+    original_sources = {rel_path: _read_module_source(rel_path) for rel_path in updated_sources}
+    # taken before the temporary files touch the directories, see `SymbolIndex.update_module`
+    directory_mtimes = {
+        rel_path: os.stat(os.path.dirname(os.path.join(repo_root, rel_path))).st_mtime_ns
+        for rel_path in updated_sources
+    }
+    tmp_paths = {}
+    replaced = []
+    try:
+        for rel_path, updated_source in updated_sources.items():
+            tmp_paths[rel_path] = _write_atomically(os.path.join(repo_root, rel_path), updated_source)
+        for rel_path, tmp_path in tmp_paths.items():
+            os.replace(tmp_path, os.path.join(repo_root, rel_path))
+            replaced.append(rel_path)
+    except OSError:
+        for rel_path in replaced:
+            path = os.path.join(repo_root, rel_path)
+            os.replace(_write_atomically(path, original_sources[rel_path]), path)
+        for rel_path, tmp_path in tmp_paths.items():
+            if rel_path not in replaced and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        return False
+
+    # re-index just the edited modules, so the next lookup does not have to re-parse anything
+    index = get_current_repo_symbol_index(refresh=False)
+    for rel_path, updated_source in updated_sources.items():
+        index.update_module(rel_path, updated_source, directory_mtimes[rel_path])
+    return True
+
+
+def _edit_source_code(qualname: str, new_code: str) -> bool:
+    """
+    Replaces the source code of a function, class or method with new code and saves the module.
+
+    Parameters:
+        qualname (str): The qualname of the function, class or method, e.g. `module.Class.method`.
+        new_code (str): The new code to replace the original code.
 
-    return False
+    Returns:
+        True if the source code was successfully updated, otherwise False.
+    """
+    return _edit_source_code_batch([(qualname, new_code)])
 
 
-@tool("edit_source_code")
 def edit_source_code(inputs: str) -> bool:
     """
-    Replaces the source code of a function or class with new code and saves the module.
+    Replaces the source code of a function, class or method with new code and saves the module.
+    Methods and nested functions or classes can be edited on their own, e.g. with the qualname `module.Class.method`.
 
     The inputs to this tool should be a dictionary formatted as follows:
-        {'qualname': '<qualname of the function or class>', 'new_code': '<new code>'}
+        {'qualname': '<qualname of the function, class or method>', 'new_code': '<new code>'}
     """
     try:
         parsed_inputs = json.loads(inputs)
     except json.JSONDecodeError:
         return """
 Error parsing inputs. Please ensure that the inputs are formatted as follows:
-{'qualname': '<qualname of the function or class>', 'new_code': '<new code>'}
+{'qualname': '<qualname of the function, class or method>', 'new_code': '<new code>'}
 """
     return _edit_source_code(**parsed_inputs)
+
+
+def edit_source_code_batch(inputs: str) -> bool:
+    """
+    Replaces the source code of several functions, classes or methods at once. Either every edit is applied or none is.
+
+    The inputs to this tool should be a list formatted as follows:
+        [{'qualname': '<qualname of the function, class or method>', 'new_code': '<new code>'}, ...]
+    """
+    try:
+        parsed_inputs = json.loads(inputs)
+        edits = [(edit["qualname"], edit["new_code"]) for edit in parsed_inputs]
+    except (json.JSONDecodeError, TypeError, KeyError):
+        return """
+Error parsing inputs. Please ensure that the inputs are formatted as follows:
+[{'qualname': '<qualname of the function, class or method>', 'new_code': '<new code>'}, ...]
+"""
+    return _edit_source_code_batch(edits)
+
+
+def apply_patch(code: str, hunks: Sequence[Tuple[str, str]]) -> Optional[str]:
+    """
+    Applies search/replace hunks to the code of a definition, in order.
+
+    Parameters:
+        code (str): The code of the function, class or method, as returned by `get_full_definition`.
+        hunks (Sequence[Tuple[str, str]]): (search, replace) pairs, as returned by `parse_patch`.
+
+    Returns:
+        The patched code, or None if there are no hunks, a search block does not occur exactly once in the code, or
+        the patched code does not parse.
+    """
+    if not hunks:
+        return None
+    # hunks are made of whole lines, including the last one
+    patched = code + "\n"
+    for search, replace in hunks:
+        if not search.strip() or patched.count(search) != 1:
+            return None
+        patched = patched.replace(search, replace, 1)
+    patched = patched.strip()
+    try:
+        ast.parse(textwrap.dedent(patched))
+    except SyntaxError:
+        return None
+    return patched
+
+
+def _edit_source_code_with_instructions(
+    qualname: str,
+    instructions: str,
+    patch_chain=None,
+    rewrite_chain=None,
+    rewrite_chain_factory: Optional[Callable[[], Any]] = None,
+) -> Optional[str]:
+    """
+    Edits a function, class or method according to instructions and saves the module.
+
+    The editor is first asked for a patch, which only costs output tokens for the lines that change. If the patch
+    does not apply to the current definition, it is asked to rewrite the whole definition instead.
+
+    Parameters:
+        qualname (str): The qualname of the function, class or method, e.g. `module.Class.method`.
+        instructions (str): How to edit it.
+        patch_chain: A patch mode EditorChain, built with the default LLM if not given.
+        rewrite_chain: A rewrite mode EditorChain, only built if it is needed and not given.
+        rewrite_chain_factory: Builds the rewrite chain when it is needed and not given, by default with the default
+            LLM.
+
+    Returns:
+        "patch" or "rewrite", whichever edit was applied, or None if the symbol was not found or neither applied.
+    """
+    item = get_current_repo_symbol_table().get(qualname)
+    if item is None or not item.path:
+        return None
+    code = get_full_definition(item)
+    request = editor_request(code, instructions)
+
+    patch_chain = patch_chain if patch_chain is not None else EditorChain(mode="patch")
+    patched = apply_patch(code, parse_patch(patch_chain.run(request)))
+    if patched is not None and _edit_source_code(qualname, patched):
+        return "patch"
+
+    if rewrite_chain is None:
+        rewrite_chain = rewrite_chain_factory() if rewrite_chain_factory is not None else EditorChain()
+    if _edit_source_code(qualname, extract_code(rewrite_chain.run(request))):
+        return "rewrite"
+    return None
+
+
+def edit_source_code_with_instructions(
+    inputs: str, patch_chain=None, rewrite_chain=None, rewrite_chain_factory: Optional[Callable[[], Any]] = None
+) -> Union[str, bool]:
+    """
+    Edits a function, class or method according to instructions and saves the module.
+
+    The inputs to this tool should be a dictionary formatted as follows:
+        {'qualname': '<qualname of the function, class or method>', 'instructions': '<how to edit it>'}
+    """
+    try:
+        parsed_inputs = json.loads(inputs)
+        qualname, instructions = parsed_inputs["qualname"], parsed_inputs["instructions"]
+    except (json.JSONDecodeError, TypeError, KeyError):
+        return """
+Error parsing inputs. Please ensure that the inputs are formatted as follows:
+{'qualname': '<qualname of the function, class or method>', 'instructions': '<how to edit it>'}
+"""
+    applied = _edit_source_code_with_instructions(
+        qualname, instructions, patch_chain, rewrite_chain, rewrite_chain_factory
+    )
+    return applied if applied is not None else False
@@ -0,0 +1,324 @@
+import atexit
+import bisect
+import hashlib
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from bootstrap import cache_root
+from bootstrap.file_enumeration import enumerate_files, refresh_listing_mtimes
+from bootstrap.introspection import (
+    decode_module_source,
+    module_qualname,
+    parse_module_source,
+    parse_module_sources,
+)
+from bootstrap.symbol_records import SymbolRecord
+
+# bump whenever the shape of the cached records changes so stale caches are rebuilt instead of misread
+INDEX_VERSION = 5
+
+# (mtime_ns, size, content hash, records)
+ModuleEntry = Tuple[int, int, str, List[SymbolRecord]]
+
+
+def content_hash(data: bytes) -> str:
+    """
+    Returns a short, stable hash of some file content.
+
+    Parameters:
+        data (bytes): The raw file content.
+
+    Returns:
+        The hex digest of the content.
+    """
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def default_cache_path(root: Union[str, Path]) -> Path:
+    """
+    Returns the on-disk location of the symbol index for a given source root.
+
+    Parameters:
+        root (str or Path): The root directory that is being indexed.
+
+    Returns:
+        The path of the pickle file holding the index.
+    """
+    root_key = hashlib.blake2b(str(Path(root).resolve()).encode("utf-8"), digest_size=6).hexdigest()
+    return Path(cache_root) / f"symbol_index-{root_key}.pickle"
+
+
+def _iter_addressable(records: List[SymbolRecord]) -> Iterator[SymbolRecord]:
+    for record in records:
+        if record.qualname is not None:
+            yield record
+        yield from _iter_addressable(record.body)
+
+
+class SymbolTable:
+    """
+    Lookup tables over the records of a SymbolIndex.
+
+    Lookups by qualname and by module are plain dict accesses; prefix lookups bisect a sorted list of qualnames, so
+    none of them scan the whole repository. Methods and nested functions and classes are addressable by their own
+    qualname, e.g. `module.Class.method`. The tables are updated one module at a time when modules change.
+    """
+
+    def __init__(self, modules: Dict[str, ModuleEntry]):
+        self._by_qualname: Dict[str, SymbolRecord] = {}
+        self._by_module: Dict[str, List[SymbolRecord]] = {}
+        for rel_path in sorted(modules):
+            records = modules[rel_path][3]
+            self._by_module[module_qualname(rel_path)] = records
+            for record in _iter_addressable(records):
+                self._by_qualname.setdefault(record.qualname, record)
+        self._sorted_qualnames = sorted(self._by_qualname)
+
+    def replace_module(self, rel_path: str, records: List[SymbolRecord]):
+        """
+        Swaps the records of one module for new ones, without touching the rest of the table.
+
+        Parameters:
+            rel_path (str): The relative path of the module.
+            records (List[SymbolRecord]): The new top level records of the module, empty if it was removed.
+        """
+        module = module_qualname(rel_path)
+        for record in _iter_addressable(self._by_module.pop(module, [])):
+            if self._by_qualname.get(record.qualname) is record:
+                del self._by_qualname[record.qualname]
+                del self._sorted_qualnames[bisect.bisect_left(self._sorted_qualnames, record.qualname)]
+        if records:
+            self._by_module[module] = records
+        for record in _iter_addressable(records):
+            if record.qualname not in self._by_qualname:
+                self._by_qualname[record.qualname] = record
+                bisect.insort(self._sorted_qualnames, record.qualname)
+
+    def __len__(self) -> int:
+        return len(self._by_qualname)
+
+    def __iter__(self) -> Iterator[SymbolRecord]:
+        """
+        Iterates over every addressable symbol in module order, each one followed by the symbols nested in it.
+        """
+        for module in sorted(self._by_module):
+            for record in _iter_addressable(self._by_module[module]):
+                if self._by_qualname.get(record.qualname) is record:
+                    yield record
+
+    def __contains__(self, qualname: str) -> bool:
+        return qualname in self._by_qualname
+
+    def get(self, qualname: str) -> Union[SymbolRecord, None]:
+        """
+        Returns the record of a function or class given its qualname, or None if it is not indexed.
+        """
+        return self._by_qualname.get(qualname)
+
+    def by_module(self, module: str) -> List[SymbolRecord]:
+        """
+        Returns the records of all the top level functions and classes of a module given its dotted qualname.
+        """
+        return self._by_module.get(module, [])
+
+    def with_prefix(self, prefix: str) -> List[SymbolRecord]:
+        """
+        Returns the records of all the symbols whose qualname starts with `prefix`, ordered by qualname.
+        """
+        start = bisect.bisect_left(self._sorted_qualnames, prefix)
+        matches = []
+        for qualname in self._sorted_qualnames[start:]:
+            if not qualname.startswith(prefix):
+                break
+            matches.append(self._by_qualname[qualname])
+        return matches
+
+
+class SymbolIndex:
+    """
+    Persistent, incremental index of the functions and classes under a source root.
+
+    Each module is keyed by its relative path and fingerprinted by mtime, size and content hash. A refresh only
+    re-parses modules that are new or whose content changed; everything else is served from the cache, which is
+    shared across calls (one instance per root) and across processes (a pickle file under `cache_root`). Cold
+    builds of large trees parse modules in a process pool of `workers` processes. Code that writes a module itself
+    can hand the new source to `update_module` so the next refresh has nothing left to do.
+    """
+
+    def __init__(self, root: Union[str, Path], cache_path: Union[str, Path] = None, workers: int = None):
+        self.root = Path(root)
+        self.workers = workers
+        self.cache_path = Path(cache_path) if cache_path is not None else default_cache_path(root)
+        self.modules: Dict[str, ModuleEntry] = {}
+        self.last_refresh = {"parsed": 0, "reused": 0, "removed": 0}
+        self._table = None
+        self._unsaved = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_path, "rb") as file:
+                cached = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return
+        if cached.get("version") == INDEX_VERSION and cached.get("root") == str(self.root.resolve()):
+            self.modules = cached["modules"]
+
+    def save(self):
+        """
+        Atomically writes the index to its cache file.
+        """
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {"version": INDEX_VERSION, "root": str(self.root.resolve()), "modules": self.modules}
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_path.parent, prefix=self.cache_path.name, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                pickle.dump(payload, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.cache_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._unsaved = False
+
+    def save_if_unsaved(self):
+        """
+        Writes the index to its cache file if `update_module` changed it since the last save.
+        """
+        if self._unsaved:
+            self.save()
+
+    def _iter_module_paths(self):
+        for file_path in enumerate_files(self.root, [".py"]):
+            yield str(file_path), os.path.relpath(file_path, self.root)
+
+    def _set_module(self, rel_path: str, entry: Union[ModuleEntry, None]):
+        if entry is None:
+            del self.modules[rel_path]
+        else:
+            self.modules[rel_path] = entry
+        if self._table is not None:
+            self._table.replace_module(rel_path, entry[3] if entry is not None else [])
+
+    def refresh(self) -> "SymbolIndex":
+        """
+        Brings the index up to date with the files on disk, re-parsing only new or changed modules.
+
+        Returns:
+            The index itself, for chaining.
+        """
+        stats = {"parsed": 0, "reused": 0, "removed": 0}
+        seen = set()
+        dirty = False
+        to_parse = []
+
+        for file_path, rel_path in self._iter_module_paths():
+            seen.add(rel_path)
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            entry = self.modules.get(rel_path)
+            if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+                stats["reused"] += 1
+                continue
+
+            with open(file_path, "rb") as file:
+                data = file.read()
+            digest = content_hash(data)
+            dirty = True
+            if entry is not None and entry[2] == digest:
+                # touched but unchanged, only the fingerprint needs updating
+                self.modules[rel_path] = (stat.st_mtime_ns, stat.st_size, digest, entry[3])
+                stats["reused"] += 1
+                continue
+            to_parse.append(((stat.st_mtime_ns, stat.st_size, digest), decode_module_source(data), rel_path))
+
+        parsed = parse_module_sources([(source, rel_path) for _, source, rel_path in to_parse], workers=self.workers)
+        for (fingerprint, _, rel_path), records in zip(to_parse, parsed):
+            # modules with syntax errors are remembered as empty so they are not re-parsed until they change
+            self._set_module(rel_path, (*fingerprint, records or []))
+        stats["parsed"] = len(to_parse)
+
+        for rel_path in set(self.modules) - seen:
+            self._set_module(rel_path, None)
+            stats["removed"] += 1
+            dirty = True
+
+        self.last_refresh = stats
+        if dirty:
+            self.save()
+        return self
+
+    def update_module(self, rel_path: str, source: str, directory_mtime_ns: Optional[int] = None):
+        """
+        Re-indexes a single module from source that was just written to disk, without walking the rest of the tree.
+
+        Only the module itself is re-parsed, which also moves the spans of every symbol below an edited one. The
+        new fingerprint is recorded so the next refresh reuses the records instead of parsing the module again.
+        Writing the module by renaming a temporary file over it bumps the directory's mtime, which would make the next
+        refresh walk the whole tree again, so given the directory's mtime from before the write, the cached listings
+        that were fresh at that point are marked as unchanged. Persisting to the cache file is deferred to the next
+        refresh that changes something, or to interpreter exit.
+
+        Parameters:
+            rel_path (str): The relative path of the module.
+            source (str): The source code that was written to the module.
+            directory_mtime_ns (int): The mtime of the module's directory just before the module was written.
+        """
+        path = self.root / rel_path
+        stat = os.stat(path)
+        if directory_mtime_ns is not None:
+            refresh_listing_mtimes(path.parent, directory_mtime_ns)
+        records = parse_module_source(source, rel_path) or []
+        self._set_module(rel_path, (stat.st_mtime_ns, stat.st_size, content_hash(source.encode("utf-8")), records))
+        self._unsaved = True
+
+    @property
+    def table(self) -> SymbolTable:
+        """
+        The lookup tables over the current records, kept up to date module by module once built.
+        """
+        if self._table is None:
+            self._table = SymbolTable(self.modules)
+        return self._table
+
+    def symbols(self) -> List[SymbolRecord]:
+        """
+        Returns the records of all top level functions and classes, ordered by module path.
+        """
+        return [record for rel_path in sorted(self.modules) for record in self.modules[rel_path][3]]
+
+
+_symbol_indices: Dict[Path, SymbolIndex] = {}
+
+
+def get_symbol_index(root: Union[str, Path], refresh: bool = True, workers: int = None) -> SymbolIndex:
+    """
+    Returns the shared symbol index for a source root, creating it from the on-disk cache if needed.
+
+    Parameters:
+        root (str or Path): The root directory to index.
+        refresh (bool): Whether to bring the index up to date with the files on disk before returning it.
+        workers (int): The number of processes used to parse changed modules, see `parse_module_sources`.
+
+    Returns:
+        The SymbolIndex for the root.
+    """
+    key = Path(root).resolve()
+    index = _symbol_indices.get(key)
+    if index is None:
+        index = _symbol_indices[key] = SymbolIndex(key, workers=workers)
+    elif workers is not None:
+        index.workers = workers
+    if refresh:
+        index.refresh()
+    return index
+
+
+@atexit.register
+def _save_unsaved_indices():
+    for index in _symbol_indices.values():
+        index.save_if_unsaved()
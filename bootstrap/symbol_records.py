@@ -0,0 +1,90 @@
+from typing import Dict, Tuple, Union
+
+
+class SymbolRecord:
+    """
+    Compact record of a function, class, method or assignment extracted from a module.
+
+    Records use `__slots__` instead of a per-instance dict and pickle as a flat tuple of their fields, which keeps
+    large symbol tables small in memory and cheap to cache on disk or send between processes.
+
+    Attributes:
+        kind (str): One of "function", "class", "method" or "assignment".
+        name (str): The name of the symbol.
+        qualname (str): The fully qualified name of the symbol, or None if it is not addressable on its own.
+        path (str): The path of the module containing the symbol, relative to the indexed root.
+        signature (str): The signature of functions, methods and classes.
+        docstring (str): The docstring of the symbol, if any.
+        start_lineno (int): The line on which the symbol starts.
+        end_lineno (int): The line on which the symbol ends.
+        start_byte (int): The byte offset at which the symbol's source starts.
+        end_byte (int): The byte offset at which the symbol's source ends.
+        body (tuple): The records of the methods and assignments in a class body.
+        decorated_lineno (int): The line on which the symbol's first decorator starts, or start_lineno if it has none.
+    """
+
+    __slots__ = (
+        "kind",
+        "name",
+        "qualname",
+        "path",
+        "signature",
+        "docstring",
+        "start_lineno",
+        "end_lineno",
+        "start_byte",
+        "end_byte",
+        "body",
+        "decorated_lineno",
+    )
+
+    def __init__(
+        self,
+        kind: str,
+        name: str,
+        qualname: Union[str, None] = None,
+        path: Union[str, None] = None,
+        signature: Union[str, None] = None,
+        docstring: Union[str, None] = None,
+        start_lineno: int = 0,
+        end_lineno: int = 0,
+        start_byte: int = 0,
+        end_byte: int = 0,
+        body: Tuple["SymbolRecord", ...] = (),
+        decorated_lineno: int = 0,
+    ):
+        self.kind = kind
+        self.name = name
+        self.qualname = qualname
+        self.path = path
+        self.signature = signature
+        self.docstring = docstring
+        self.start_lineno = start_lineno
+        self.end_lineno = end_lineno
+        self.start_byte = start_byte
+        self.end_byte = end_byte
+        self.body = body
+        self.decorated_lineno = decorated_lineno or start_lineno
+
+    def as_tuple(self) -> tuple:
+        """
+        Returns the fields of the record in `__slots__` order.
+        """
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def __reduce__(self):
+        return (SymbolRecord, self.as_tuple())
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, SymbolRecord) and self.as_tuple() == other.as_tuple()
+
+    def __repr__(self) -> str:
+        return f"SymbolRecord({self.kind!r}, {self.qualname or self.name!r}, {self.path!r}:{self.start_lineno})"
+
+    def to_dict(self) -> Dict:
+        """
+        Returns the record as a plain dictionary, e.g. for JSON serialization.
+        """
+        result = {"type" if field == "kind" else field: getattr(self, field) for field in self.__slots__}
+        result["body"] = [child.to_dict() for child in self.body]
+        return result
@@ -0,0 +1,31 @@
+from functools import lru_cache
+
+# the encoding of gpt-3.5, gpt-4 and text-embedding-ada-002
+ENCODING_NAME = "cl100k_base"
+
+# OpenAI's rule of thumb for english text, used when the encoding cannot be loaded
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def get_encoding():
+    """
+    Returns the tiktoken encoding, or None if it is not available (tiktoken downloads it on first use, which fails
+    offline). The outcome is remembered, so a missing encoding is only looked for once per process.
+    """
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(ENCODING_NAME)
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Counts the tokens of a text for OpenAI's models, or estimates them from its length if the encoding is unavailable.
+    """
+    encoding = get_encoding()
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
@@ -1,44 +1,114 @@
-from langchain.agents import Tool
-from llama_index.langchain_helpers.agents import IndexToolConfig, LlamaIndexTool
+import threading
+from functools import partial
+from typing import Any, Callable, Dict, List, Tuple
 
 from bootstrap.code_editing import EditorChain
 from bootstrap.codebase_index import load_codebase_index
 from bootstrap.github_indices import load_langchain_index, load_llama_index_index
 from bootstrap.introspection import (
+    edit_source_code_with_instructions,
     get_current_repo_definitions_summary,
     get_source_code,
 )
 
 
-def get_tools():
-    return [
-        LlamaIndexTool.from_tool_config(
-            IndexToolConfig(
-                index=load_codebase_index(),
-                name="Codebase query",
-                description="Useful for when you want to answer queries about the current repo. This is the best place to start looking for answers about the codebase.",
-                index_query_kwargs={"similarity_top_k": 3},
-                tool_kwargs={"return_direct": False},
-            )
-        ),
-        LlamaIndexTool.from_tool_config(
-            IndexToolConfig(
-                index=load_langchain_index(),
-                name="Langchain repo query",
-                description="Useful for when you want to look up documentation or source code for the langchain library.",
-                index_query_kwargs={"similarity_top_k": 8},
-                tool_kwargs={"return_direct": False},
-            )
-        ),
-        LlamaIndexTool.from_tool_config(
-            IndexToolConfig(
-                index=load_llama_index_index(),
-                name="llama_index repo query",
-                description="Useful for when you want to look up documentation or source code  for the llama_index library.",
-                index_query_kwargs={"similarity_top_k": 8},
-                tool_kwargs={"return_direct": False},
-            )
-        ),
+class LazyResource:
+    """
+    Something expensive to build (an index, a chain) that is only built the first time it is needed.
+
+    Building is thread-safe, so a resource can be prefetched on a background thread while the agent starts up and
+    a tool that needs it in the meantime simply waits for the same build to finish.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self.factory = factory
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self) -> Any:
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._value = self.factory()
+                    self._loaded = True
+        return self._value
+
+    def prefetch(self) -> threading.Thread:
+        """
+        Starts building the resource on a daemon thread.
+        """
+        thread = threading.Thread(target=self.get, daemon=True)
+        thread.start()
+        return thread
+
+
+# shared by every call to get_tools, so each index is loaded at most once per process
+resources: Dict[str, LazyResource] = {
+    "codebase_index": LazyResource(load_codebase_index),
+    "langchain_index": LazyResource(load_langchain_index),
+    "llama_index_index": LazyResource(load_llama_index_index),
+    "editor_chain": LazyResource(EditorChain),
+    "patch_chain": LazyResource(partial(EditorChain, mode="patch")),
+}
+
+# (tool name, resource, similarity_top_k, description)
+INDEX_TOOLS: Tuple[Tuple[str, str, int, str], ...] = (
+    (
+        "Codebase query",
+        "codebase_index",
+        3,
+        "Useful for when you want to answer queries about the current repo. This is the best place to start looking for answers about the codebase.",
+    ),
+    (
+        "Langchain repo query",
+        "langchain_index",
+        8,
+        "Useful for when you want to look up documentation or source code for the langchain library.",
+    ),
+    (
+        "llama_index repo query",
+        "llama_index_index",
+        8,
+        "Useful for when you want to look up documentation or source code  for the llama_index library.",
+    ),
+)
+
+
+def _index_query(resource: LazyResource, similarity_top_k: int) -> Callable[[str], str]:
+    def query(tool_input: str) -> str:
+        return str(resource.get().query(tool_input, similarity_top_k=similarity_top_k))
+
+    return query
+
+
+def prefetch_resources(names=None) -> List[threading.Thread]:
+    """
+    Starts loading the given resources (all of them by default) in the background.
+    """
+    if names is None:
+        names = list(resources)
+    return [resources[name].prefetch() for name in names if not resources[name].loaded]
+
+
+def get_tools(prefetch: bool = False):
+    """
+    Returns the agent's tools. Nothing is loaded up front: each index (and the editor chain) is loaded the first time
+    a tool that needs it is invoked, unless `prefetch` starts loading all of them on background threads.
+    """
+    from langchain.agents import Tool
+
+    if prefetch:
+        prefetch_resources()
+    tools = [
+        Tool(name=name, func=_index_query(resources[resource], top_k), description=description)
+        for name, resource, top_k, description in INDEX_TOOLS
+    ]
+    return tools + [
         Tool(
             name="Get repo definitions summary",
             func=get_current_repo_definitions_summary,
@@ -51,7 +121,24 @@ def get_tools():
         ),
         Tool(
             name="Edit a function/class definition",
-            func=EditorChain().run,
+            func=lambda tool_input: resources["editor_chain"].get().run(tool_input),
             description="Rewrites a piece of source code according to instructions.",
         ),
+        Tool(
+            name="Edit source code in place",
+            func=lambda tool_input: edit_source_code_with_instructions(
+                tool_input,
+                patch_chain=resources["patch_chain"].get(),
+                # the rewrite chain is only built if the patch does not apply
+                rewrite_chain_factory=resources["editor_chain"].get,
+            ),
+            description=edit_source_code_with_instructions.__doc__,
+        ),
     ]
+
+
+def list_tools() -> List[Tuple[str, str]]:
+    """
+    Returns the name and description of every tool, without loading any index.
+    """
+    return [(tool.name, tool.description) for tool in get_tools()]
@@ -0,0 +1,38 @@
+import pytest
+from llama_index.embeddings.base import BaseEmbedding
+from llama_index.utils import globals_helper
+
+
+class CountingEmbedding(BaseEmbedding):
+    """
+    Embeds a text as [1.0, its length] and records every text it embeds.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.texts = []
+
+    def _get_query_embedding(self, query):
+        return [1.0, float(len(query))]
+
+    def _get_text_embedding(self, text):
+        self.texts.append(text)
+        return [1.0, float(len(text))]
+
+
+@pytest.fixture
+def counting_embedding():
+    """
+    The CountingEmbedding class, for tests that need one or more embedding models that record what they embed.
+    """
+    return CountingEmbedding
+
+
+@pytest.fixture
+def offline_llama_index(monkeypatch):
+    """
+    Lets llama_index build indices offline.
+    """
+    # the default tokenizer downloads its vocabulary on first use, and the default LLM wants a key it never uses here
+    monkeypatch.setattr(globals_helper, "_tokenizer", str.split)
+    monkeypatch.setenv("OPENAI_API_KEY", "unused")
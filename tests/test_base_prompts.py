@@ -0,0 +1,48 @@
+import pytest
+
+from bootstrap.base_prompts import (
+    PROMPT_MODES,
+    PROMPT_SECTIONS,
+    PromptRegistry,
+    actions_code_test_generation,
+    actions_task_management,
+    prompt_registry,
+    system_prompt,
+)
+from bootstrap.interface_setup import create_chat_prompt, create_human_message_template
+
+
+def test_modes_only_carry_their_sections():
+    coding = prompt_registry.render("coding")
+    assert actions_code_test_generation in coding and actions_task_management not in coding
+    # the task list reminder only makes sense with the task actions
+    assert "*UPDATE TASK LIST* action" not in coding
+    assert "*UPDATE TASK LIST* action" in prompt_registry.render("planning")
+    assert system_prompt.prompt.template == prompt_registry.render("full")
+
+    sizes = prompt_registry.token_sizes()
+    assert set(sizes) == set(PROMPT_MODES)
+    assert sizes["chat"] < sizes["coding"] < sizes["full"]
+
+
+def test_templates_are_cached_until_a_section_changes():
+    registry = PromptRegistry(PROMPT_SECTIONS, PROMPT_MODES)
+    chat = registry.template("chat")
+    assert registry.template("chat") is chat
+
+    registry.register_section("communication", "\n## TALK\n")
+    assert registry.template("chat") is not chat and "## TALK" in registry.render("chat")
+    registry.register_mode("review", ("communication", "code"))
+    assert "## TALK" in registry.render("review")
+
+    with pytest.raises(ValueError):
+        registry.register_mode("broken", ("nonexistent",))
+    with pytest.raises(ValueError):
+        registry.render("nonexistent")
+
+
+def test_chat_prompt_uses_the_mode_system_prompt():
+    prompt = create_chat_prompt(create_human_message_template(), mode="chat")
+    messages = prompt.format_prompt(history=[], input="hi").to_messages()
+    assert messages[0].content == prompt_registry.render("chat")
+    assert messages[-1].content == "hi"
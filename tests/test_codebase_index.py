@@ -0,0 +1,102 @@
+from unittest.mock import MagicMock
+
+from bootstrap.codebase_index import (
+    codebase_documents,
+    document_manifest,
+    symbol_documents,
+    update_index,
+)
+from bootstrap.embedding_cache import CachedEmbedding, EmbeddingCache
+from bootstrap.faiss_store import GPTFaissVectorIndex
+
+
+def test_update_index_only_touches_changed_documents(tmp_path):
+    (tmp_path / "a.py").write_text("a = 1\n")
+    (tmp_path / "b.py").write_text("b = 1\n")
+    (tmp_path / "c.toml").write_text("[c]\n")
+    documents = codebase_documents(tmp_path, chunk_symbols=False)
+    assert [doc.get_doc_id() for doc in documents] == ["a.py", "b.py", "c.toml"]
+    manifest = document_manifest(documents)
+
+    (tmp_path / "b.py").write_text("b = 2\n")
+    (tmp_path / "c.toml").unlink()
+    (tmp_path / "d.py").write_text("d = 1\n")
+    index = MagicMock()
+    new_manifest, stats = update_index(index, codebase_documents(tmp_path, chunk_symbols=False), manifest)
+
+    assert stats == {"added": 1, "changed": 1, "moved": 0, "deleted": 1, "unchanged": 1}
+    assert sorted(call.args[0] for call in index.delete.call_args_list) == ["b.py", "c.toml"]
+    assert [call.args[0].get_doc_id() for call in index.insert.call_args_list] == ["b.py", "d.py"]
+    assert sorted(new_manifest) == ["a.py", "b.py", "d.py"]
+    assert new_manifest["a.py"] == manifest["a.py"]
+
+
+def test_codebase_documents_of_a_relative_root(tmp_path, monkeypatch):
+    (tmp_path / "proj" / "pkg").mkdir(parents=True)
+    (tmp_path / "proj" / "pkg" / "a.py").write_text("a = 1\n")
+    monkeypatch.chdir(tmp_path)
+
+    assert [doc.get_doc_id() for doc in codebase_documents("proj", chunk_symbols=False)] == ["pkg/a.py"]
+
+
+def test_symbol_documents_split_modules_by_symbol():
+    source = (
+        "import os\n\nCONSTANT = 1\n\n\ndef f():\n    return CONSTANT\n\n\n"
+        'class C:\n    """Docs."""\n\n    x = 1\n\n    def m(self):\n        return self.x\n'
+    )
+    documents = {doc.extra_info["qualname"]: doc for doc in symbol_documents(source, "pkg/mod.py")}
+
+    assert list(documents) == ["pkg.mod", "pkg.mod.f", "pkg.mod.C", "pkg.mod.C.m"]
+    assert documents["pkg.mod"].text == "import os\nCONSTANT = 1"
+    assert documents["pkg.mod.f"].get_doc_id() == "pkg/mod.py::pkg.mod.f"
+    assert documents["pkg.mod.C"].text == 'class C:\n    """Docs."""\n\n    x = 1\n\n    def m(self):'
+    assert documents["pkg.mod.C.m"].text == "def m(self):\n    return self.x"
+    assert (documents["pkg.mod.C.m"].extra_info["start_lineno"], documents["pkg.mod.C.m"].extra_info["end_lineno"]) == (
+        15,
+        16,
+    )
+
+
+def test_symbols_sharing_a_qualname_get_distinct_doc_ids():
+    source = (
+        "class A:\n    @property\n    def x(self):\n        return self._x\n\n"
+        "    @x.setter\n    def x(self, value):\n        self._x = value\n"
+    )
+    doc_ids = [doc.get_doc_id() for doc in symbol_documents(source, "m.py")]
+
+    assert doc_ids == ["m.py::m.A", "m.py::m.A.x", "m.py::m.A.x#2"]
+    assert len(document_manifest(symbol_documents(source, "m.py"))) == 3
+
+
+def test_symbols_that_only_moved_are_not_re_embedded(tmp_path, offline_llama_index, counting_embedding):
+    source = "import os\n\n\ndef f():\n    return 1\n\n\nclass C:\n    def m(self):\n        return 2\n"
+    embed_model = counting_embedding()
+    documents = symbol_documents(source, "m.py")
+    index = GPTFaissVectorIndex(
+        documents, embed_model=CachedEmbedding(embed_model, cache=EmbeddingCache(tmp_path / "e.sqlite"))
+    )
+    embed_model.texts.clear()
+
+    documents = symbol_documents("import sys\n" + source, "m.py")
+    _, stats = update_index(index, documents, document_manifest(symbol_documents(source, "m.py")))
+
+    assert stats == {"added": 0, "changed": 1, "moved": 3, "deleted": 0, "unchanged": 0}
+    # only the module header, whose imports changed, reached the embedding model
+    assert embed_model.texts == ["file_name: m.py\nqualname: m\ntype: module\n\nimport sys\nimport os"]
+    f_node = next(node for node in index.index_struct.nodes_dict.values() if node.ref_doc_id == "m.py::m.f")
+    assert (f_node.extra_info["start_lineno"], f_node.extra_info["end_lineno"]) == (5, 6)
+
+
+def test_decorators_stay_with_the_symbols_they_decorate():
+    source = (
+        "import functools\n\n\n@functools.lru_cache(\n    maxsize=None,\n)\ndef f():\n    return 1\n\n\n"
+        "class C:\n    @property\n    def x(self):\n        return 1\n"
+    )
+    documents = {doc.extra_info["qualname"]: doc for doc in symbol_documents(source, "m.py")}
+
+    assert documents["m"].text == "import functools"
+    assert documents["m.f"].text == "@functools.lru_cache(\n    maxsize=None,\n)\ndef f():\n    return 1"
+    assert documents["m.f"].extra_info["start_lineno"] == 4
+    assert documents["m.C"].text == "class C:\n    @property\n    def x(self):"
+    assert documents["m.C.x"].text == "@property\ndef x(self):\n    return 1"
+    assert documents["m.C.x"].extra_info["start_lineno"] == 12
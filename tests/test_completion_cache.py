@@ -0,0 +1,73 @@
+import time
+
+from langchain.chat_models.base import SimpleChatModel
+from langchain.llms.fake import FakeListLLM
+from langchain.schema import HumanMessage, SystemMessage
+
+from bootstrap.code_editing import EditorChain
+from bootstrap.completion_cache import CachedChatModel, CachedLLM, CompletionCache
+
+
+class EchoChatModel(SimpleChatModel):
+    calls: int = 0
+    temperature: float = 0.7
+
+    def _call(self, messages, stop=None):
+        self.calls += 1
+        return f"reply {self.calls} to {messages[-1].content}"
+
+    async def _agenerate(self, messages, stop=None):
+        return self._generate(messages, stop)
+
+
+def test_editor_chain_replays_identical_prompts_from_the_cache(tmp_path):
+    cache = CompletionCache(tmp_path / "completions.sqlite")
+    model = FakeListLLM(responses=["```python\ndef f(): pass\n```", "second"])
+    chain = EditorChain(llm=CachedLLM(model=model, completion_cache=cache))
+
+    first = chain.run("rename g to f")
+    assert chain.run("rename g to f") == first
+    assert model.i == 1 and cache.stats["hits"] == 1 and cache.hit_rate == 0.5
+
+    # a fresh process with the same cache file does not call the model either
+    reopened = CompletionCache(tmp_path / "completions.sqlite")
+    chain = EditorChain(llm=CachedLLM(model=FakeListLLM(responses=["other"]), completion_cache=reopened))
+    assert chain.run("rename g to f") == first
+    assert chain.run("something else") == "other"
+
+
+def test_chat_model_cache_keys_on_the_whole_conversation(tmp_path):
+    cache = CompletionCache(tmp_path / "completions.sqlite")
+    model = EchoChatModel()
+    chat = CachedChatModel(model=model, completion_cache=cache)
+    conversation = [SystemMessage(content="be brief"), HumanMessage(content="hi")]
+
+    assert chat(conversation).content == "reply 1 to hi"
+    assert chat(conversation).content == "reply 1 to hi"
+    assert chat([HumanMessage(content="hi")]).content == "reply 2 to hi"
+
+    # nondeterministic models can be left out of the cache
+    uncached = CachedChatModel(model=model, completion_cache=cache, mode="deterministic")
+    assert uncached(conversation).content == "reply 3 to hi"
+    assert CachedChatModel(model=model, completion_cache=cache, mode="off")(conversation).content == "reply 4 to hi"
+    model.temperature = 0.0
+    assert uncached(conversation).content == "reply 5 to hi"
+    assert uncached(conversation).content == "reply 5 to hi"
+
+
+def test_completions_expire_and_are_evicted(tmp_path):
+    cache = CompletionCache(tmp_path / "completions.sqlite", max_entries=2, ttl_seconds=0.05)
+    generations = [{"text": "a", "generation_info": None}]
+    cache.put("model", 0.0, "one", generations)
+    assert cache.get("model", 0.0, "one") == generations
+    assert cache.get("model", 0.5, "one") is None
+    time.sleep(0.1)
+    assert cache.get("model", 0.0, "one") is None
+    assert cache.stats["expired"] == 1
+
+    cache.ttl_seconds = None
+    for digest in ("one", "two", "three"):
+        cache.put("model", 0.0, digest, generations)
+    assert cache.stats["evictions"] == 1
+    assert cache.get("model", 0.0, "one") is None
+    assert cache.get("model", 0.0, "three") == generations
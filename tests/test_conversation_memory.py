@@ -0,0 +1,87 @@
+from langchain import ConversationChain
+from langchain.chat_models.base import SimpleChatModel
+
+from bootstrap.conversation_memory import TokenBudgetMemory
+from bootstrap.interface_setup import create_chat_prompt, create_human_message_template
+
+
+def _turn(memory, human, ai):
+    memory.save_context({"input": human}, {"response": ai})
+
+
+def test_old_turns_are_summarized_to_stay_within_budget():
+    memory = TokenBudgetMemory(max_token_limit=120, return_messages=True)
+    for i in range(20):
+        _turn(memory, f"question number {i} about the parser", f"answer number {i}\nwith a second line of detail")
+
+    assert all(stats["history_tokens"] <= 120 for stats in memory.turn_stats)
+    assert memory.turn_stats[-1]["turn"] == 20 and memory.turn_stats[-1]["summarized_messages"] > 0
+    messages = memory.load_memory_variables({})["history"]
+    # the latest turn is verbatim, the earlier ones only appear as the first line of each message
+    assert messages[-1].content == "answer number 19\nwith a second line of detail"
+    assert messages[0].content.startswith("Summary of the earlier conversation:")
+    assert "AI: answer number" in messages[0].content and "second line" not in messages[0].content
+    assert "question number 0 " not in memory.summary
+    assert memory.token_report().splitlines()[0].startswith("turn")
+
+
+def test_referenced_code_blocks_and_open_tasks_are_pinned():
+    memory = TokenBudgetMemory(max_token_limit=120, return_messages=True)
+    _turn(
+        memory,
+        "Plan:\n- [x] write tests\n- [ ] implement parse_header",
+        "Here it is:\n```python\ndef parse_header(line):\n    return line.split(':', 1)\n```",
+    )
+    _turn(memory, "Also this one", "```python\ndef unrelated():\n    pass\n```")
+    for i in range(6):
+        _turn(memory, f"does parse_header handle case {i}?", f"yes, case {i} works")
+
+    pins = [pin["text"] for pin in memory.pinned]
+    assert any("def parse_header" in pin for pin in pins)
+    assert not any("def unrelated" in pin for pin in pins)
+    assert "- [ ] implement parse_header" in pins[-1] or any("- [ ]" in pin for pin in pins)
+
+    # once nothing recent mentions it, the code block is let go
+    for i in range(6):
+        _turn(memory, f"now about the lexer {i}", f"lexer answer {i}")
+    assert not any("def parse_header" in pin["text"] for pin in memory.pinned)
+    assert memory.history_tokens() <= 120
+
+
+class EchoChatModel(SimpleChatModel):
+    def _call(self, messages, stop=None):
+        return f"seen {len(messages)} messages"
+
+    async def _agenerate(self, messages, stop=None):
+        return self._generate(messages, stop)
+
+
+def test_conversation_chain_uses_the_budgeted_history():
+    memory = TokenBudgetMemory(max_token_limit=60, return_messages=True)
+    chain = ConversationChain(
+        llm=EchoChatModel(), prompt=create_chat_prompt(create_human_message_template()), memory=memory
+    )
+    replies = [chain.run(f"message {i} " + "padding " * 10) for i in range(5)]
+
+    # system prompt + input, then the history grows until it is compacted
+    assert replies[0] == "seen 2 messages"
+    assert any(stats["summarized_messages"] > 0 for stats in memory.turn_stats)
+    assert all(stats["history_tokens"] <= 60 for stats in memory.turn_stats)
+
+
+def test_an_oversized_latest_turn_is_cut_to_the_budget():
+    memory = TokenBudgetMemory(max_token_limit=300, return_messages=True)
+    _turn(memory, "what does this do?", "first answer")
+    paste = "\n".join(f"line {i}: " + "word " * 20 for i in range(100))
+    _turn(memory, f"and this?\n{paste}", "it repeats a word")
+
+    assert memory.turn_stats[-1]["input_tokens"] > 2000
+    assert memory.history_tokens() <= 300 and memory.turn_stats[-1]["history_tokens"] <= 300
+    human, ai = memory.chat_memory.messages
+    assert human.content.startswith("and this?\nline 0: ") and human.content.endswith("conversation memory]")
+    assert ai.content == "it repeats a word"
+
+    # a single line longer than the budget is cut too
+    memory = TokenBudgetMemory(max_token_limit=50, return_messages=True)
+    _turn(memory, "x" * 4000, "ok")
+    assert memory.history_tokens() <= 50
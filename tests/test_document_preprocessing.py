@@ -0,0 +1,104 @@
+import json
+
+from bootstrap import document_preprocessing
+from bootstrap.document_preprocessing import (
+    PreprocessingPolicy,
+    PreprocessingStats,
+    preprocess_document,
+    read_document,
+)
+
+
+def test_notebooks_keep_only_code_and_markdown_cells():
+    notebook = {
+        "cells": [
+            {"cell_type": "markdown", "source": ["# Title\n", "Some prose."]},
+            {
+                "cell_type": "code",
+                "execution_count": 3,
+                "source": "print('hi')",
+                "outputs": [{"output_type": "display_data", "data": {"image/png": "iVBORw0KGgo" * 1000}}],
+            },
+            {"cell_type": "raw", "source": "raw text"},
+            {"cell_type": "code", "source": []},
+        ],
+        "metadata": {"kernelspec": {"name": "python3"}},
+    }
+    stats = PreprocessingStats()
+    text = preprocess_document("demo.ipynb", json.dumps(notebook), PreprocessingPolicy(), stats)
+
+    assert text == "# Title\nSome prose.\n\n```python\nprint('hi')\n```"
+    assert (stats.files, stats.notebooks, stats.skipped) == (1, 1, 0)
+    assert stats.bytes_saved > 10_000 and stats.tokens_saved > 0
+
+
+def test_generated_and_minified_files_are_skipped():
+    policy = PreprocessingPolicy(max_line_length=200)
+    stats = PreprocessingStats()
+    assert preprocess_document("api_pb2.py", "x = 1\n", policy, stats) is None
+    assert preprocess_document("schema.py", "# Code generated by tool. DO NOT EDIT.\nx = 1\n", policy, stats) is None
+    assert preprocess_document("bundle.js", "a" * 500, policy, stats) is None
+    # mentioning generated code further down is fine
+    kept = "\n" * 10 + "This file was automatically generated? No.\n"
+    assert preprocess_document("notes.md", kept, policy, stats) == kept
+    assert (stats.files, stats.skipped) == (4, 3)
+    # one long line is not enough to make a stylesheet minified
+    stylesheet = "a {}\n" * 10 + "b { background: url(" + "x" * 300 + ") }\n"
+    assert preprocess_document("style.css", stylesheet, policy) is not None
+    assert preprocess_document("api_pb2.py", "x = 1\n", PreprocessingPolicy(skip_generated=False)) == "x = 1\n"
+
+
+def test_long_lines_of_prose_and_code_are_cut_instead_of_skipped():
+    policy = PreprocessingPolicy(max_line_length=20)
+    paragraph = "A paragraph kept on a single line, as markdown allows."
+    assert preprocess_document("notes.md", f"# Notes\n\n{paragraph}\n", policy) == f"# Notes\n\n{paragraph[:20]}\n"
+    module = f'x = 1\nTEXT = "{"y" * 50}"\n'
+    assert preprocess_document("data.py", module, policy) == f'x = 1\nTEXT = "{"y" * 12}\n'
+
+
+def test_oversized_files_are_truncated_at_a_line_or_skipped():
+    text = "".join(f"line {i}\n" for i in range(100))
+    stats = PreprocessingStats()
+    truncated = preprocess_document("big.py", text, PreprocessingPolicy(max_file_bytes=50), stats)
+    assert truncated == "line 0\nline 1\nline 2\nline 3\nline 4\nline 5\nline 6\n"
+    assert (stats.truncated, stats.bytes_in, stats.bytes_out) == (1, len(text), len(truncated))
+
+    assert preprocess_document("big.py", text, PreprocessingPolicy(max_file_bytes=50, oversized="skip")) is None
+    assert preprocess_document("small.py", "x = 1\n", PreprocessingPolicy(max_file_bytes=50)) == "x = 1\n"
+
+
+def test_oversized_files_are_only_read_as_far_as_they_are_kept(tmp_path, monkeypatch):
+    reads = []
+
+    class TrackedFile:
+        def __init__(self, file):
+            self.file = file
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            self.file.close()
+
+        def read(self, size=-1):
+            reads.append(size)
+            return self.file.read(size)
+
+    monkeypatch.setattr(
+        document_preprocessing, "open", lambda *args, **kwargs: TrackedFile(open(*args, **kwargs)), raising=False
+    )
+    path = tmp_path / "big.py"
+    text = "".join(f"line {i}\n" for i in range(10_000))
+    path.write_text(text)
+
+    stats = PreprocessingStats()
+    assert read_document(path, "big.py", PreprocessingPolicy(max_file_bytes=50, oversized="skip"), stats) is None
+    assert reads == []
+    assert (stats.skipped, stats.bytes_in, stats.bytes_out) == (1, len(text), 0)
+
+    stats = PreprocessingStats()
+    truncated = read_document(path, "big.py", PreprocessingPolicy(max_file_bytes=50), stats)
+    assert truncated == "line 0\nline 1\nline 2\nline 3\nline 4\nline 5\nline 6\n"
+    assert reads == [51]
+    assert (stats.truncated, stats.bytes_in, stats.bytes_out) == (1, len(text), len(truncated))
+    assert stats.tokens_in > len(text) // 8
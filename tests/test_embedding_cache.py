@@ -0,0 +1,32 @@
+import pytest
+
+from bootstrap.embedding_cache import CachedEmbedding, EmbeddingCache
+
+pytestmark = pytest.mark.usefixtures("offline_llama_index")
+
+
+def test_cache_hits_and_lru_eviction(tmp_path):
+    cache = EmbeddingCache(tmp_path / "embeddings.sqlite", max_entries=2)
+    assert cache.get_many("model", ["a", "b"]) == [None, None]
+    cache.put_many("model", ["a", "b"], [[1.0, 2.0], [3.0, 4.0]])
+    assert cache.get_many("model", ["a"]) == [[1.0, 2.0]]
+    assert cache.get_many("other-model", ["a"]) == [None]
+
+    # "b" is now the least recently used entry
+    cache.put_many("model", ["c"], [[5.0, 6.0]])
+    assert cache.get_many("model", ["a", "b", "c"]) == [[1.0, 2.0], None, [5.0, 6.0]]
+    assert cache.stats == {"hits": 3, "misses": 4, "evictions": 1}
+
+    # entries survive reopening the cache
+    assert EmbeddingCache(tmp_path / "embeddings.sqlite").get_many("model", ["c"]) == [[5.0, 6.0]]
+
+
+def test_cached_embedding_only_embeds_new_texts(tmp_path, counting_embedding):
+    cache = EmbeddingCache(tmp_path / "embeddings.sqlite")
+    embed_model = counting_embedding()
+    cached = CachedEmbedding(embed_model, cache=cache, model_name="counting")
+
+    assert cached._get_text_embeddings(["x", "yy"]) == [[1.0, 1.0], [1.0, 2.0]]
+    assert cached._get_text_embeddings(["yy", "zzz", "x"]) == [[1.0, 2.0], [1.0, 3.0], [1.0, 1.0]]
+    assert embed_model.texts == ["x", "yy", "zzz"]
+    assert cached.stats["hits"] == 2
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from bootstrap.embedding_cache import CachedEmbedding, EmbeddingCache
+from bootstrap.embedding_client import (
+    ClientEmbedding,
+    EmbeddingClient,
+    EmbeddingClientConfig,
+    FakeBackend,
+    TokenBucket,
+)
+
+
+class TrackingBackend(FakeBackend):
+    def __init__(self, failures=0, retryable=True):
+        super().__init__(dim=8, latency=0.01)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.failures = failures
+        self.retryable = retryable
+
+    async def aembed(self, texts):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("try again")
+            return await super().aembed(texts)
+        finally:
+            self.in_flight -= 1
+
+    def is_retryable(self, error):
+        return self.retryable
+
+
+def test_client_batches_texts_with_bounded_concurrency(offline_llama_index):
+    backend = TrackingBackend()
+    client = EmbeddingClient(backend, EmbeddingClientConfig(batch_size=2, max_concurrency=3))
+    texts = [f"text {i}" for i in range(11)]
+
+    assert client.embed(texts) == [backend.embed_text(text) for text in texts]
+    assert backend.batches == [2, 2, 2, 2, 2, 1]
+    assert backend.max_in_flight == 3
+    assert client.stats["requests"] == 6 and client.stats["texts"] == 11
+
+    # llama_index hands over enough texts at once to keep every request slot busy
+    embed_model = ClientEmbedding(client)
+    assert embed_model._embed_batch_size == 6
+    assert embed_model.get_query_embedding("text 3") == backend.embed_text("text 3")
+
+
+def test_failed_requests_are_retried_with_backoff():
+    config = EmbeddingClientConfig(batch_size=4, max_retries=2, initial_backoff=0.001)
+    client = EmbeddingClient(TrackingBackend(failures=2), config)
+    assert len(client.embed(["a", "b"])) == 2
+    assert client.stats["retries"] == 2 and client.stats["requests"] == 1
+
+    with pytest.raises(ConnectionError):
+        EmbeddingClient(TrackingBackend(failures=3), config).embed(["a"])
+    client = EmbeddingClient(TrackingBackend(failures=1, retryable=False), config)
+    with pytest.raises(ConnectionError):
+        client.embed(["a"])
+    assert client.stats["retries"] == 0
+
+
+def test_token_bucket_waits_for_refill():
+    now = [0.0]
+    bucket = TokenBucket(per_minute=60, capacity=2, clock=lambda: now[0])
+    assert bucket._take(2) == 0
+    assert bucket._take(1) == pytest.approx(1.0)
+    now[0] = 0.5
+    assert bucket._take(1) == pytest.approx(0.5)
+    now[0] = 1.0
+    assert bucket._take(1) == 0
+
+    # a real bucket paces acquisitions beyond its capacity
+    bucket = TokenBucket(per_minute=600, capacity=1)
+
+    async def acquire_three():
+        for _ in range(3):
+            await bucket.acquire()
+
+    loop = asyncio.new_event_loop()
+    start = loop.time()
+    loop.run_until_complete(acquire_three())
+    assert loop.time() - start >= 0.19
+    loop.close()
+
+
+def test_cached_client_embedding_uses_the_backend_model_name(tmp_path, offline_llama_index):
+    backend = FakeBackend(dim=4)
+    cache = EmbeddingCache(tmp_path / "embeddings.sqlite")
+    embed_model = CachedEmbedding(ClientEmbedding(EmbeddingClient(backend, EmbeddingClientConfig())), cache=cache)
+    embed_model._get_text_embeddings(["a", "b"])
+    embed_model._get_text_embeddings(["a", "b", "c"])
+
+    assert embed_model.model_name == "fake:4"
+    assert backend.batches == [2, 1]
@@ -0,0 +1,129 @@
+import faiss
+import numpy as np
+import pytest
+from llama_index import Document
+from llama_index.data_structs.data_structs import Node
+from llama_index.embeddings.base import BaseEmbedding
+from llama_index.vector_stores.types import NodeEmbeddingResult
+
+from bootstrap.faiss_store import FaissIndexConfig, FaissStore, GPTFaissVectorIndex
+
+
+def _results(doc_id, embeddings):
+    return [
+        NodeEmbeddingResult(f"{doc_id}-{i}", Node(text=doc_id, doc_id=doc_id), embedding, doc_id=doc_id)
+        for i, embedding in enumerate(embeddings)
+    ]
+
+
+def _unit(i, dim=8):
+    vector = np.zeros(dim)
+    vector[i % dim] = 1.0
+    vector[(i + 1) % dim] = 0.1 * (i // dim)
+    return vector.tolist()
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+def test_faiss_store_query_delete_and_reload(tmp_path, index_type):
+    config = FaissIndexConfig(index_type=index_type, ivf_nlist=2, ivf_nprobe=2, vector_dtype="float16")
+    store = FaissStore(config)
+    for i in range(100):
+        store.add(_results(f"doc{i}", [_unit(i)]))
+    if index_type == "ivf":
+        # enough vectors were added to train the clusters
+        assert isinstance(faiss.downcast_index(store.client.index), faiss.IndexIVF)
+
+    result = store.query(_unit(3), 1)
+    assert result.ids == ["doc3-0"]
+    assert result.similarities[0] == pytest.approx(1.0)
+
+    store.delete("doc3")
+    assert "doc3-0" not in store.query(_unit(3), 5).ids
+    assert store.query(_unit(3), 5, doc_ids=["doc11", "doc20"]).ids == ["doc11-0", "doc20-0"]
+
+    text_ids = store.save(tmp_path)
+    # deleted vectors are dropped and the remaining rows renumbered when the store is saved
+    assert len(text_ids) == 99 and "doc3-0" not in text_ids
+
+    loaded = FaissStore.load(tmp_path)
+    assert isinstance(loaded.vectors, np.memmap) and loaded.vectors.shape == (99, 8)
+    assert text_ids[int(loaded.query(_unit(4), 1).ids[0])] == "doc4-0"
+    assert [text_ids[int(i)] for i in loaded.query(_unit(3), 5, doc_ids=["doc11"]).ids] == ["doc11-0"]
+
+    # the first change reads the store into memory
+    loaded.add(_results("doc3", [_unit(3)]))
+    loaded.delete("doc4")
+    assert loaded.query(_unit(3), 1).ids == ["doc3-0"]
+    assert "doc4-0" not in [text_ids[int(i)] for i in loaded.query(_unit(4), 5).ids if i.isdigit()]
+
+
+def test_faiss_index_config_from_env(monkeypatch):
+    monkeypatch.setenv("BOOTSTRAP_FAISS_INDEX_TYPE", "ivf")
+    monkeypatch.setenv("BOOTSTRAP_FAISS_IVF_NPROBE", "32")
+    config = FaissIndexConfig.from_env()
+    assert (config.index_type, config.ivf_nprobe) == ("ivf", 32)
+
+    monkeypatch.setenv("BOOTSTRAP_FAISS_INDEX_TYPE", "annoy")
+    with pytest.raises(ValueError):
+        FaissIndexConfig.from_env()
+
+
+class WordEmbedding(BaseEmbedding):
+    def _get_query_embedding(self, query):
+        return self._get_text_embedding(query)
+
+    def _get_text_embedding(self, text):
+        return _unit(int(text.split("word")[-1].split()[0]))
+
+
+def test_faiss_vector_index_saves_binary_files_and_loads_lazily(tmp_path, offline_llama_index):
+    config = FaissIndexConfig(index_type="hnsw")
+    documents = [Document(f"word{i}", doc_id=f"doc{i}") for i in range(20)]
+    index = GPTFaissVectorIndex(
+        documents, faiss_store=FaissStore(config), embed_model=WordEmbedding(), include_extra_info=False
+    )
+    index.save_to_disk(tmp_path / "index")
+    assert {path.name for path in (tmp_path / "index").iterdir()} == {
+        "index.json",
+        "store.json",
+        "vectors.npy",
+        "doc_ids.npy",
+        "faiss.index",
+        "nodes.jsonl",
+        "nodes.offsets.npy",
+    }
+
+    loaded = GPTFaissVectorIndex.load_from_disk(tmp_path / "index", embed_model=WordEmbedding())
+    result = loaded.faiss_store.query(_unit(5), 1)
+    assert loaded.index_struct.get_nodes(result.ids)[0].get_text() == "word5"
+
+    loaded.delete("doc5")
+    loaded.insert(Document("word5 again", doc_id="doc5"))
+    loaded.save_to_disk(tmp_path / "index")
+    reloaded = GPTFaissVectorIndex.load_from_disk(tmp_path / "index", embed_model=WordEmbedding())
+    result = reloaded.faiss_store.query(_unit(5), 1)
+    assert reloaded.index_struct.get_nodes(result.ids)[0].get_text() == "word5 again"
+    assert len(reloaded.index_struct.nodes_dict) == 20
+
+
+class BatchRecordingEmbedding(WordEmbedding):
+    def __init__(self):
+        super().__init__(embed_batch_size=4)
+        self.batches = []
+
+    def _get_text_embeddings(self, texts):
+        self.batches.append(len(texts))
+        return super()._get_text_embeddings(texts)
+
+
+def test_insert_batch_embeds_across_documents(offline_llama_index):
+    embed_model = BatchRecordingEmbedding()
+    index = GPTFaissVectorIndex([], embed_model=embed_model, include_extra_info=False)
+    index.insert_batch([Document(f"word{i}", doc_id=f"doc{i}") for i in range(10)])
+
+    # one request per embed_batch_size nodes rather than one per document
+    assert embed_model.batches == [4, 4, 2]
+    result = index.faiss_store.query(_unit(7), 1)
+    assert index.index_struct.get_nodes(result.ids)[0].ref_doc_id == "doc7"
+    index.delete("doc7")
+    assert "doc7" not in [node.ref_doc_id for node in index.index_struct.nodes_dict.values()]
@@ -0,0 +1,63 @@
+import os
+
+from bootstrap.file_enumeration import enumerate_files, refresh_listing_mtimes
+
+
+def _touch(root, rel_path, content=""):
+    path = root / rel_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    return path
+
+
+def test_enumerate_files_honours_gitignore_and_excludes(tmp_path):
+    _touch(tmp_path, ".gitignore", "build/\n*.log\n/top_only.py\n")
+    _touch(tmp_path, "pkg/.gitignore", "generated_*.py\n!generated_keep.py\n")
+    for rel_path in [
+        "pkg/a.py",
+        "pkg/b.toml",
+        "pkg/c.md",
+        "pkg/generated_x.py",
+        "pkg/generated_keep.py",
+        "pkg/sub/top_only.py",
+        "top_only.py",
+        "build/d.py",
+        "pkg/__pycache__/a.py",
+        ".venv/lib/e.py",
+        "notebooks/.ipynb_checkpoints/f.py",
+    ]:
+        _touch(tmp_path, rel_path)
+
+    files = enumerate_files(tmp_path, [".py", ".toml"], cache=False)
+    assert [path.relative_to(tmp_path).as_posix() for path in files] == [
+        "pkg/a.py",
+        "pkg/b.toml",
+        "pkg/generated_keep.py",
+        "pkg/sub/top_only.py",
+    ]
+
+
+def test_enumerate_files_cache_notices_new_files(tmp_path):
+    _touch(tmp_path, "pkg/a.py")
+    assert len(enumerate_files(tmp_path, [".py"])) == 1
+    assert len(enumerate_files(tmp_path, [".py"])) == 1
+
+    _touch(tmp_path, "pkg/b.py")
+    assert len(enumerate_files(tmp_path, [".py"])) == 2
+
+
+def test_refreshing_listing_mtimes_keeps_stale_listings_stale(tmp_path):
+    pkg = tmp_path / "pkg"
+    module = _touch(tmp_path, "pkg/a.py")
+    assert len(enumerate_files(tmp_path, [".py"])) == 1
+    assert len(enumerate_files(tmp_path, [".py", ".toml"])) == 1
+
+    # a new file makes the [".py", ".toml"] listing stale before a.py is rewritten by rename
+    _touch(tmp_path, "pkg/new.toml")
+    stat = os.stat(pkg)
+    os.utime(pkg, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    before_write = os.stat(pkg).st_mtime_ns
+    _touch(tmp_path, "pkg/a.py.tmp").replace(module)
+    refresh_listing_mtimes(pkg, before_write)
+
+    assert [path.name for path in enumerate_files(tmp_path, [".py", ".toml"])] == ["a.py", "new.toml"]
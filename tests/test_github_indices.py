@@ -0,0 +1,183 @@
+import subprocess
+import threading
+import time
+
+import pytest
+
+from bootstrap.document_preprocessing import PreprocessingPolicy
+from bootstrap.embedding_cache import CachedEmbedding, EmbeddingCache
+from bootstrap.faiss_store import GPTFaissVectorIndex
+from bootstrap.github_indices import (
+    RepoIngestion,
+    RepoMirror,
+    ingest_github_repos,
+    load_manifest,
+    refresh_github_index,
+)
+
+
+def _git(cwd, *args):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+@pytest.fixture
+def upstream(tmp_path, monkeypatch, offline_llama_index):
+    for variable in ("GIT_AUTHOR_NAME", "GIT_COMMITTER_NAME"):
+        monkeypatch.setenv(variable, "test")
+    for variable in ("GIT_AUTHOR_EMAIL", "GIT_COMMITTER_EMAIL"):
+        monkeypatch.setenv(variable, "test@example.com")
+
+    bare = tmp_path / "upstream.git"
+    work = tmp_path / "work"
+    _git(tmp_path, "init", "--bare", "-q", str(bare))
+    _git(tmp_path, "clone", "-q", str(bare), str(work))
+    (work / "a.py").write_text("a = 1\n")
+    (work / "b.md").write_text("# b\n")
+    (work / "c.md").write_text("# c\n")
+    (work / "setup.cfg").write_text("[metadata]\n")
+    _git(work, "add", "-A")
+    _git(work, "commit", "-q", "-m", "first")
+    _git(work, "push", "-q", "origin", "HEAD")
+    return bare, work
+
+
+def test_refresh_only_embeds_files_changed_since_the_last_indexed_commit(tmp_path, upstream, counting_embedding):
+    bare, work = upstream
+    savepath = tmp_path / "index"
+    refresh = dict(savepath=savepath, url=str(bare), mirror_root=tmp_path / "mirrors", batch_size=2)
+
+    embed_model = counting_embedding()
+    assert refresh_github_index("owner", "repo", embed_model=embed_model, **refresh) == {
+        "added": 3,
+        "changed": 0,
+        "deleted": 0,
+    }
+    assert load_manifest(savepath)["files"] == ["a.py", "b.md", "c.md"]
+
+    (work / "a.py").write_text("a = 2\n")
+    (work / "b.md").unlink()
+    (work / "d.rst").write_text("d\n")
+    _git(work, "mv", "c.md", "e.md")
+    (work / "setup.cfg").write_text("[options]\n")
+    _git(work, "add", "-A")
+    _git(work, "commit", "-q", "-m", "second")
+    _git(work, "push", "-q", "origin", "HEAD")
+
+    embed_model = counting_embedding()
+    stats = refresh_github_index("owner", "repo", embed_model=embed_model, **refresh)
+    assert stats == {"added": 2, "changed": 1, "deleted": 2}
+    # the embedded text is prefixed with the document's file name, but not its source URL
+    assert sorted(embed_model.texts) == [
+        "file_name: a.py\n\na = 2\n",
+        "file_name: d.rst\n\nd\n",
+        "file_name: e.md\n\n# c\n",
+    ]
+    manifest = load_manifest(savepath)
+    assert manifest["files"] == ["a.py", "d.rst", "e.md"]
+    assert manifest["sha"] == RepoMirror("owner", "repo", root=tmp_path / "mirrors").head_sha
+
+    index = GPTFaissVectorIndex.load_from_disk(savepath, embed_model=counting_embedding())
+    nodes = {node.ref_doc_id: node for node in index.index_struct.nodes_dict.values()}
+    assert sorted(nodes) == ["a.py", "d.rst", "e.md"]
+    assert nodes["e.md"].extra_info["source"].endswith(f"/blob/{manifest['sha']}/e.md")
+
+    # nothing to do until upstream moves
+    embed_model = counting_embedding()
+    assert refresh_github_index("owner", "repo", embed_model=embed_model, **refresh) == {
+        "added": 0,
+        "changed": 0,
+        "deleted": 0,
+    }
+    assert embed_model.texts == []
+
+
+def test_reindexing_at_a_new_commit_is_served_from_the_embedding_cache(tmp_path, upstream, counting_embedding):
+    bare, work = upstream
+    refresh = dict(savepath=tmp_path / "index", url=str(bare), mirror_root=tmp_path / "mirrors", incremental=False)
+    embed_model = counting_embedding()
+    cached = CachedEmbedding(embed_model, cache=EmbeddingCache(tmp_path / "embeddings.sqlite"))
+    refresh_github_index("owner", "repo", embed_model=cached, **refresh)
+    assert len(embed_model.texts) == 3
+
+    (work / "a.py").write_text("a = 2\n")
+    _git(work, "commit", "-q", "-am", "second")
+    _git(work, "push", "-q", "origin", "HEAD")
+    embed_model.texts.clear()
+    refresh_github_index("owner", "repo", embed_model=cached, **refresh)
+
+    # every file is re-indexed with the new commit's URL, but only the changed one reaches the model
+    assert embed_model.texts == ["file_name: a.py\n\na = 2\n"]
+    index = GPTFaissVectorIndex.load_from_disk(tmp_path / "index", embed_model=counting_embedding())
+    sha = load_manifest(tmp_path / "index")["sha"]
+    assert all(f"/blob/{sha}/" in node.extra_info["source"] for node in index.index_struct.nodes_dict.values())
+
+
+def test_manifest_only_records_the_files_that_were_indexed(tmp_path, upstream, counting_embedding):
+    bare, work = upstream
+    (work / "big.md").write_text("# big\n" + "x" * 200 + "\n")
+    _git(work, "add", "-A")
+    _git(work, "commit", "-q", "-m", "big")
+    _git(work, "push", "-q", "origin", "HEAD")
+
+    def refresh():
+        ingestion = RepoIngestion(
+            "owner",
+            "repo",
+            savepath=tmp_path / "index",
+            url=str(bare),
+            mirror_root=tmp_path / "mirrors",
+            embed_model=counting_embedding(),
+            policy=PreprocessingPolicy(max_file_bytes=100, oversized="skip"),
+        )
+        return ingest_github_repos([ingestion], progress=False)[ingestion.name]
+
+    refresh()
+    assert load_manifest(tmp_path / "index")["files"] == ["a.py", "b.md", "c.md"]
+
+    # a skipped file that changes upstream was never indexed, so there is nothing to replace
+    (work / "big.md").write_text("# big\n" + "y" * 200 + "\n")
+    _git(work, "commit", "-q", "-am", "bigger")
+    _git(work, "push", "-q", "origin", "HEAD")
+    assert refresh() == {"added": 1, "changed": 0, "deleted": 0}
+    assert load_manifest(tmp_path / "index")["files"] == ["a.py", "b.md", "c.md"]
+
+
+class TrackedIngestion(RepoIngestion):
+    running = 0
+    max_running = 0
+    lock = threading.Lock()
+
+    def embed(self, documents):
+        with self.lock:
+            TrackedIngestion.running += 1
+            TrackedIngestion.max_running = max(TrackedIngestion.max_running, TrackedIngestion.running)
+        time.sleep(0.05)
+        embedded = super().embed(documents)
+        with self.lock:
+            TrackedIngestion.running -= 1
+        return embedded
+
+
+def test_ingest_repos_concurrently_with_bounded_stages(tmp_path, upstream, counting_embedding):
+    bare, work = upstream
+    ingestions = [
+        TrackedIngestion(
+            "owner",
+            f"repo{i}",
+            savepath=tmp_path / f"index{i}",
+            url=str(bare),
+            mirror_root=tmp_path / "mirrors",
+            embed_model=counting_embedding(),
+        )
+        for i in range(3)
+    ]
+    missing = RepoIngestion(
+        "owner", "missing", savepath=tmp_path / "missing", url=str(tmp_path / "missing.git"), mirror_root=tmp_path
+    )
+
+    results = ingest_github_repos(ingestions + [missing], concurrency=3, stage_workers={"embed": 1})
+    assert [results[f"owner/repo{i}"] for i in range(3)] == [{"added": 3, "changed": 0, "deleted": 0}] * 3
+    # one failed repo does not stop the others
+    assert isinstance(results["owner/missing"], Exception)
+    assert TrackedIngestion.max_running == 1
+    assert all(load_manifest(tmp_path / f"index{i}")["files"] == ["a.py", "b.md", "c.md"] for i in range(3))
@@ -0,0 +1,15 @@
+import subprocess
+import sys
+
+from bootstrap import repo_root
+
+
+def test_importing_the_toolchain_loads_no_heavy_dependencies():
+    code = (
+        "import sys\n"
+        "import bootstrap.toolchain, bootstrap.codebase_index, bootstrap.github_indices, bootstrap.code_editing\n"
+        "print(' '.join(sorted({name.split('.')[0] for name in sys.modules})))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=repo_root, capture_output=True, text=True, check=True)
+    loaded = set(result.stdout.split())
+    assert not loaded & {"langchain", "llama_index", "faiss", "openai", "numpy"}
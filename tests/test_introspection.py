@@ -1,4 +1,17 @@
-from bootstrap.introspection import edit_source_code, get_source_code
+import json
+
+from langchain.llms.fake import FakeListLLM
+
+from bootstrap import introspection, repo_root
+from bootstrap.code_editing import EditorChain
+from bootstrap.introspection import (
+    apply_patch,
+    edit_source_code,
+    edit_source_code_batch,
+    edit_source_code_with_instructions,
+    get_full_definition,
+    get_source_code,
+)
 
 
 def test_get_source_code():
@@ -14,13 +27,110 @@ def test_get_source_code():
 def test_edit_source_code():
     original_code = get_source_code("bootstrap.dummy_module.dummy_function")
     new_code = "def dummy_function(a, b):\n    return a + b"
-    assert edit_source_code("bootstrap.dummy_module.dummy_function", new_code)
+    assert edit_source_code(json.dumps({"qualname": "bootstrap.dummy_module.dummy_function", "new_code": new_code}))
 
     edited_code = get_source_code("bootstrap.dummy_module.dummy_function")
     assert edited_code == new_code
 
     # Revert the code back to the original version
-    assert edit_source_code("bootstrap.dummy_module.dummy_function", original_code)
+    assert edit_source_code(
+        json.dumps({"qualname": "bootstrap.dummy_module.dummy_function", "new_code": original_code})
+    )
 
     reverted_code = get_source_code("bootstrap.dummy_module.dummy_function")
     assert reverted_code == original_code
+
+
+def test_parallel_extraction_matches_serial(monkeypatch):
+    monkeypatch.setattr(introspection, "PARALLEL_MIN_MODULES", 1)
+    serial = introspection.extract_functions_and_classes(repo_root, workers=1)
+    parallel = introspection.extract_functions_and_classes(repo_root, workers=2)
+    assert parallel == serial
+
+
+def test_crlf_modules_are_read_with_their_line_endings(tmp_path):
+    (tmp_path / "m.py").write_bytes(b"def f():\r\n    return 1\r\n\r\n\r\ndef g():\r\n    return 2\r\n")
+    records = introspection.extract_functions_and_classes(str(tmp_path), workers=1)
+
+    assert [get_full_definition(record, root=tmp_path) for record in records] == [
+        "def f():\r\n    return 1",
+        "def g():\r\n    return 2",
+    ]
+
+
+def test_get_and_edit_method_source_code():
+    qualname = "bootstrap.dummy_module.DummyClass.dummy_method"
+    original_code = get_source_code(qualname)
+    assert original_code.startswith("def dummy_method(self, x, y):\n    ")
+
+    new_code = "def dummy_method(self, x, y):\n    return x + y"
+    assert introspection._edit_source_code(qualname, new_code)
+    assert get_source_code(qualname) == new_code
+    assert "        return x + y" in get_source_code("bootstrap.dummy_module.DummyClass")
+
+    assert introspection._edit_source_code(qualname, original_code)
+    assert get_source_code(qualname) == original_code
+
+
+def test_edit_source_code_batch_is_atomic():
+    module_path = repo_root / "bootstrap" / "dummy_module.py"
+    original_module = module_path.read_text()
+    function_qualname = "bootstrap.dummy_module.dummy_function"
+    method_qualname = "bootstrap.dummy_module.DummyClass.dummy_method"
+
+    # one broken edit rolls back the whole batch
+    edits = [
+        {"qualname": function_qualname, "new_code": "def dummy_function(a, b):\n    return a - b"},
+        {"qualname": method_qualname, "new_code": "def dummy_method(self, x, y):\n    return x -"},
+    ]
+    assert not edit_source_code_batch(json.dumps(edits))
+    assert module_path.read_text() == original_module
+
+    edits[1]["new_code"] = "def dummy_method(self, x, y):\n    return x - y"
+    try:
+        assert edit_source_code_batch(json.dumps(edits))
+        assert get_source_code(function_qualname) == edits[0]["new_code"]
+        assert get_source_code(method_qualname) == edits[1]["new_code"]
+    finally:
+        module_path.write_text(original_module)
+
+
+def test_apply_patch_validates_hunks():
+    code = "def f(a, b):\n    c = a * b\n    return c"
+    assert apply_patch(code, [("    c = a * b\n", "    c = a + b\n")]) == "def f(a, b):\n    c = a + b\n    return c"
+    # the last line of the definition can be patched too
+    assert apply_patch(code, [("    return c\n", "    return -c\n")]).endswith("return -c")
+
+    assert apply_patch(code, []) is None
+    assert apply_patch(code, [("    c = a - b\n", "    c = 0\n")]) is None
+    assert apply_patch(code, [("    c = a * b\n", "    c = (\n")]) is None
+    assert apply_patch("def f():\n    x = 1\n    x = 1", [("    x = 1\n", "    x = 2\n")]) is None
+
+
+def test_edit_with_instructions_patches_or_falls_back_to_a_rewrite():
+    module_path = repo_root / "bootstrap" / "dummy_module.py"
+    original_module = module_path.read_text()
+    qualname = "bootstrap.dummy_module.DummyClass.dummy_method"
+    patch = "<<<<<<< SEARCH\n    return x * y\n=======\n    return x + y\n>>>>>>> REPLACE"
+    rewrite = FakeListLLM(responses=["```python\ndef dummy_method(self, x, y):\n    return x - y\n```"])
+    built = []
+
+    def rewrite_chain_factory():
+        built.append(True)
+        return EditorChain(llm=rewrite)
+
+    inputs = json.dumps({"qualname": qualname, "instructions": "add instead of multiplying"})
+    try:
+        patch_chain = EditorChain(mode="patch", llm=FakeListLLM(responses=[patch]))
+        assert edit_source_code_with_instructions(inputs, patch_chain, None, rewrite_chain_factory) == "patch"
+        assert get_source_code(qualname).endswith('testing purposes.\n    """\n    return x + y')
+        # the rewrite chain is not even built
+        assert built == [] and rewrite.i == 0
+
+        # the same patch no longer applies to the edited method
+        patch_chain = EditorChain(mode="patch", llm=FakeListLLM(responses=[patch]))
+        assert edit_source_code_with_instructions(inputs, patch_chain, None, rewrite_chain_factory) == "rewrite"
+        assert built == [True]
+        assert get_source_code(qualname) == "def dummy_method(self, x, y):\n    return x - y"
+    finally:
+        module_path.write_text(original_module)
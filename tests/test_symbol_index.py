@@ -0,0 +1,143 @@
+import os
+import pickle
+
+from bootstrap.introspection import get_full_definition
+from bootstrap.symbol_index import SymbolIndex
+from bootstrap.symbol_records import SymbolRecord
+
+
+def _write_module(root, rel_path, source):
+    path = root / rel_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(source)
+    return path
+
+
+def test_refresh_only_parses_changed_modules(tmp_path):
+    src = tmp_path / "src"
+    cache_path = tmp_path / "index.pickle"
+    _write_module(src, "pkg/a.py", "def f(x):\n    return x\n")
+    module_b = _write_module(src, "pkg/b.py", "class B:\n    pass\n")
+
+    index = SymbolIndex(src, cache_path=cache_path).refresh()
+    assert index.last_refresh["parsed"] == 2
+    assert [item.qualname for item in index.symbols()] == ["pkg.a.f", "pkg.b.B"]
+
+    # a warm refresh does not parse anything
+    index.refresh()
+    assert index.last_refresh == {"parsed": 0, "reused": 2, "removed": 0}
+
+    module_b.write_text("class B:\n    pass\n\n\ndef g():\n    pass\n")
+    index.refresh()
+    assert index.last_refresh["parsed"] == 1
+    assert "pkg.b.g" in [item.qualname for item in index.symbols()]
+
+    module_b.unlink()
+    index.refresh()
+    assert index.last_refresh["removed"] == 1
+    assert [item.qualname for item in index.symbols()] == ["pkg.a.f"]
+
+
+def test_index_is_reused_across_instances(tmp_path):
+    src = tmp_path / "src"
+    cache_path = tmp_path / "index.pickle"
+    _write_module(src, "mod.py", "def f():\n    pass\n")
+    SymbolIndex(src, cache_path=cache_path).refresh()
+
+    # a fresh instance (e.g. in another process) loads the cached records instead of re-parsing
+    index = SymbolIndex(src, cache_path=cache_path).refresh()
+    assert index.last_refresh["parsed"] == 0
+    assert get_full_definition(index.symbols()[0], root=src) == "def f():\n    pass"
+
+
+def test_symbol_table_lookups(tmp_path):
+    src = tmp_path / "src"
+    _write_module(src, "pkg/a.py", "def f():\n    pass\n\n\ndef g():\n    pass\n")
+    _write_module(src, "pkg/ab.py", "class C:\n    pass\n")
+    table = SymbolIndex(src, cache_path=tmp_path / "index.pickle").refresh().table
+
+    assert table.get("pkg.a.g").kind == "function"
+    assert table.get("pkg.a.missing") is None
+    assert [item.qualname for item in table.by_module("pkg.a")] == ["pkg.a.f", "pkg.a.g"]
+    assert [item.qualname for item in table.with_prefix("pkg.a.")] == ["pkg.a.f", "pkg.a.g"]
+    assert [item.qualname for item in table.with_prefix("pkg.a")] == ["pkg.a.f", "pkg.a.g", "pkg.ab.C"]
+
+
+def test_symbol_records_pickle_as_tuples():
+    method = SymbolRecord("method", "m", path="mod.py", start_lineno=2, end_lineno=3)
+    record = SymbolRecord("class", "C", qualname="mod.C", path="mod.py", start_lineno=1, end_lineno=3, body=(method,))
+    assert not hasattr(record, "__dict__")
+    assert pickle.loads(pickle.dumps(record)) == record
+    assert record.to_dict()["body"][0]["type"] == "method"
+
+
+def test_nested_symbols_are_addressable(tmp_path):
+    src = tmp_path / "src"
+    _write_module(
+        src,
+        "mod.py",
+        "class A:\n    class B:\n        def m(self):\n            pass\n\n"
+        "    def n(self):\n        def helper():\n            pass\n\n\n"
+        "def f():\n    if True:\n        def g():\n            pass\n",
+    )
+    table = SymbolIndex(src, cache_path=tmp_path / "index.pickle").refresh().table
+
+    assert [item.qualname for item in table] == [
+        "mod.A",
+        "mod.A.B",
+        "mod.A.B.m",
+        "mod.A.n",
+        "mod.A.n.helper",
+        "mod.f",
+        "mod.f.g",
+    ]
+    assert table.get("mod.A.B.m").kind == "method"
+    assert get_full_definition(table.get("mod.A.B.m"), root=src) == "def m(self):\n    pass"
+    assert [item.qualname for item in table.by_module("mod")] == ["mod.A", "mod.f"]
+
+
+def test_update_module_reindexes_in_place(tmp_path):
+    src = tmp_path / "src"
+    _write_module(src, "a.py", "def f():\n    pass\n")
+    module_b = _write_module(src, "b.py", "def g():\n    pass\n\n\ndef h():\n    pass\n")
+    index = SymbolIndex(src, cache_path=tmp_path / "index.pickle").refresh()
+    table = index.table
+
+    new_source = "def g():\n    x = 1\n    return x\n\n\ndef k():\n    pass\n\n\ndef h():\n    pass\n"
+    module_b.write_text(new_source)
+    index.update_module("b.py", new_source)
+
+    # the table is patched rather than rebuilt, and the following refresh has nothing to parse
+    assert index.table is table
+    assert [item.qualname for item in table.with_prefix("b.")] == ["b.g", "b.h", "b.k"]
+    assert (table.get("b.h").start_lineno, table.get("b.h").end_lineno) == (10, 11)
+    assert "b.f" not in table and table.get("a.f") is not None
+    index.refresh()
+    assert index.last_refresh == {"parsed": 0, "reused": 2, "removed": 0}
+
+
+def test_update_module_after_an_atomic_write_does_not_rewalk_the_tree(tmp_path, monkeypatch):
+    from bootstrap import file_enumeration
+
+    src = tmp_path / "src"
+    _write_module(src, "pkg/a.py", "def f():\n    pass\n")
+    _write_module(src, "pkg/b.py", "def g():\n    pass\n")
+    index = SymbolIndex(src, cache_path=tmp_path / "index.pickle").refresh()
+
+    walks = []
+    walk = file_enumeration._walk
+    monkeypatch.setattr(file_enumeration, "_walk", lambda *args: walks.append(args) or walk(*args))
+    new_source = "def g():\n    return 1\n"
+    directory_mtime_ns = os.stat(src / "pkg").st_mtime_ns
+    _write_module(src, "pkg/b.py.tmp", new_source).replace(src / "pkg" / "b.py")
+    index.update_module("pkg/b.py", new_source, directory_mtime_ns)
+
+    index.refresh()
+    assert walks == []
+    assert index.last_refresh == {"parsed": 0, "reused": 2, "removed": 0}
+    assert get_full_definition(index.table.get("pkg.b.g"), root=src) == "def g():\n    return 1"
+
+    # a file added next to it still shows up
+    _write_module(src, "pkg/c.py", "def h():\n    pass\n")
+    index.refresh()
+    assert len(walks) == 1 and "pkg.c.h" in index.table
@@ -0,0 +1,45 @@
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def toolchain():
+    from bootstrap import toolchain
+
+    return toolchain
+
+
+class FakeIndex:
+    def query(self, query_str, similarity_top_k):
+        return f"{query_str} (top {similarity_top_k})"
+
+
+def test_get_tools_loads_indices_on_first_use(toolchain, monkeypatch):
+    loads = []
+
+    def load():
+        loads.append(threading.current_thread())
+        return FakeIndex()
+
+    monkeypatch.setattr(
+        toolchain, "resources", {**toolchain.resources, "langchain_index": toolchain.LazyResource(load)}
+    )
+
+    tools = {tool.name: tool for tool in toolchain.get_tools()}
+    assert "Langchain repo query" in [name for name, _ in toolchain.list_tools()]
+    assert loads == []
+
+    assert tools["Langchain repo query"].run("chains") == "chains (top 8)"
+    assert tools["Langchain repo query"].run("agents") == "agents (top 8)"
+    assert len(loads) == 1
+
+
+def test_prefetch_loads_in_the_background(toolchain, monkeypatch):
+    resource = toolchain.LazyResource(FakeIndex)
+    monkeypatch.setattr(toolchain, "resources", {"codebase_index": resource})
+
+    (thread,) = toolchain.prefetch_resources()
+    thread.join()
+    assert resource.loaded and thread is not threading.current_thread()
+    assert toolchain.prefetch_resources() == []